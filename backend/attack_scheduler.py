@@ -0,0 +1,183 @@
+"""
+Background state transitions for attack searches.
+
+A search is inserted as "searching" with a found_at time; this scheduler flips it to "found"
+(revealing planned_location_state) once found_at passes, and deletes searches past expires_at
+(the attacks.expires_at TTL index stays as a backstop). GET /attack/status and /attack/list
+therefore only read.
+
+Only one worker runs transitions: the holder of the lease in game_config
+{"id": "attack_scheduler_lease"}, renewed every tick and taken over once it lapses. The
+leader keeps a min-heap of (found_at, attack_id) for searches due within
+ATTACK_SCHEDULER_HORIZON_SECONDS, reloaded every ATTACK_SCHEDULER_REFRESH_SECONDS, and sleeps
+until the earliest one is due. Due searches are flipped in one update_many; the update
+re-checks status and found_at, so entries made stale by an admin retime are harmless.
+
+A search scheduled or retimed on another worker reaches the leader's heap only at its next
+reload, so a due search can still be "searching" for up to ATTACK_SCHEDULER_REFRESH_SECONDS.
+Readers don't wait for the flip: found_query() matches found and due searches, and as_found()
+reports a due search as found at its planned location, without writing.
+"""
+import asyncio
+import heapq
+import logging
+import os
+import uuid
+from datetime import timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+from timestamps import to_datetime, utcnow
+
+logger = logging.getLogger(__name__)
+
+ATTACK_SCHEDULER_LEASE_SECONDS = float(os.environ.get("ATTACK_SCHEDULER_LEASE_SECONDS", "30"))
+ATTACK_SCHEDULER_REFRESH_SECONDS = float(os.environ.get("ATTACK_SCHEDULER_REFRESH_SECONDS", "10"))
+ATTACK_SCHEDULER_HORIZON_SECONDS = float(os.environ.get("ATTACK_SCHEDULER_HORIZON_SECONDS", "120"))
+LEASE_ID = "attack_scheduler_lease"
+MAX_HEAP_LOAD = 10000
+
+
+def found_update(states) -> list:
+    """Pipeline update for searching -> found; legacy docs without planned_location_state get a random state."""
+    random_state = {"$arrayElemAt": [list(states), {"$floor": {"$multiply": [{"$rand": {}}, len(states)]}}]}
+    return [{"$set": {
+        "status": "found",
+        "location_state": {"$ifNull": ["$location_state", {"$ifNull": ["$planned_location_state", random_state]}]},
+    }}]
+
+
+def found_query(now) -> dict:
+    """Attacks filter for targets that are found: flipped, or due but not flipped yet."""
+    return {"$or": [{"status": "found"}, {"status": "searching", "found_at": {"$lte": now}}]}
+
+
+def as_found(attack: dict, now) -> dict:
+    """The attack as readers report it: a due search shows as found at its planned location."""
+    if attack.get("status") != "searching":
+        return attack
+    found_at = to_datetime(attack.get("found_at"))
+    location = attack.get("location_state") or attack.get("planned_location_state")
+    if found_at is None or found_at > now or not location:
+        return attack
+    return {**attack, "status": "found", "location_state": location}
+
+
+class AttackScheduler:
+    def __init__(self, lease_seconds: float = ATTACK_SCHEDULER_LEASE_SECONDS,
+                 refresh_seconds: float = ATTACK_SCHEDULER_REFRESH_SECONDS,
+                 horizon_seconds: float = ATTACK_SCHEDULER_HORIZON_SECONDS):
+        self.states: tuple = ()
+        self.lease_seconds = lease_seconds
+        self.refresh_seconds = refresh_seconds
+        self.horizon_seconds = horizon_seconds
+        self.owner = uuid.uuid4().hex
+        self.is_leader = False
+        self._heap: list = []  # (found_at, attack_id)
+        self._wake = asyncio.Event()
+        self._reload = False
+        self.found = 0
+        self.expired = 0
+        self.ticks = 0
+        self.last_tick = None
+
+    def schedule(self, attack_id: str, found_at) -> None:
+        """Tell the local scheduler about a new or retimed search (other workers' searches arrive on refresh)."""
+        if self.is_leader:
+            heapq.heappush(self._heap, (to_datetime(found_at), attack_id))
+            self._wake.set()
+
+    def refresh_now(self) -> None:
+        """Reload the heap on the next tick (after bulk retimes)."""
+        self._reload = True
+        self._wake.set()
+
+    async def _acquire_lease(self, config) -> bool:
+        now = utcnow()
+        try:
+            await config.update_one(
+                {"id": LEASE_ID, "$or": [{"locked_until": {"$lte": now}}, {"owner": self.owner}]},
+                {"$set": {"owner": self.owner, "locked_until": now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:  # another worker holds a live lease
+            return False
+
+    async def release(self, config) -> None:
+        """Give up the lease (shutdown) so another worker takes over without waiting for it to lapse."""
+        if self.is_leader:
+            self.is_leader = False
+            await config.update_one({"id": LEASE_ID, "owner": self.owner}, {"$set": {"locked_until": utcnow()}})
+
+    async def _load_heap(self, attacks, now) -> None:
+        horizon = now + timedelta(seconds=self.horizon_seconds)
+        rows = await attacks.find(
+            {"status": "searching", "found_at": {"$lte": horizon}},
+            {"_id": 0, "id": 1, "found_at": 1},
+        ).sort("found_at", 1).to_list(MAX_HEAP_LOAD)
+        self._heap = [(to_datetime(r["found_at"]), r["id"]) for r in rows]
+        heapq.heapify(self._heap)
+
+    async def tick(self, attacks) -> None:
+        """Flip every due search to found and delete expired ones."""
+        now = utcnow()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[1])
+        if due:
+            result = await attacks.update_many(
+                {"id": {"$in": due}, "status": "searching", "found_at": {"$lte": now}},
+                found_update(self.states),
+            )
+            self.found += result.modified_count
+        result = await attacks.delete_many({"expires_at": {"$lte": now}, "status": {"$in": ["searching", "found"]}})
+        self.expired += result.deleted_count
+        self.ticks += 1
+        self.last_tick = now
+
+    async def _sleep(self, seconds: float) -> None:
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=max(seconds, 0))
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self, db, states) -> None:
+        """Leader loop: renew the lease, reload the heap periodically, wake for the next due search."""
+        self.states = tuple(states)
+        next_refresh = utcnow()
+        while True:
+            try:
+                was_leader = self.is_leader
+                self.is_leader = await self._acquire_lease(db.game_config)
+                if not self.is_leader:
+                    self._heap = []
+                    await self._sleep(self.lease_seconds / 2)
+                    continue
+                now = utcnow()
+                if not was_leader or self._reload or now >= next_refresh:
+                    # The reload includes overdue searches, so ones that came due while nobody led flip at once
+                    self._reload = False
+                    await self._load_heap(db.attacks, now)
+                    next_refresh = now + timedelta(seconds=self.refresh_seconds)
+                await self.tick(db.attacks)
+                wait = (next_refresh - utcnow()).total_seconds()
+                if self._heap:
+                    wait = min(wait, (self._heap[0][0] - utcnow()).total_seconds())
+                await self._sleep(min(wait, self.lease_seconds / 2))
+            except Exception:
+                logger.exception("Attack scheduler tick failed")
+                await asyncio.sleep(1)
+
+    def metrics(self) -> dict:
+        return {
+            "is_leader": self.is_leader,
+            "pending": len(self._heap),
+            "next_due": self._heap[0][0].isoformat() if self._heap else None,
+            "found": self.found,
+            "expired": self.expired,
+            "ticks": self.ticks,
+            "last_tick": self.last_tick.isoformat() if self.last_tick else None,
+        }
+
@@ -0,0 +1,56 @@
+"""
+JWT verification shared by SecurityMiddleware and get_current_user.
+
+SecurityMiddleware decodes the bearer token once per request and stores the claims on
+request.state.jwt_claims; the auth dependency reuses them. Recently verified tokens are kept
+in a small LRU keyed by the token's sha256, so repeat requests skip the HMAC check; "exp"
+is still enforced on every hit. Import after .env is loaded (server.py does).
+"""
+import hashlib
+import os
+import time
+from collections import OrderedDict
+
+from jose import JWTError, jwt
+
+JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "your-secret-key-change-in-production")
+JWT_ALGORITHM = "HS256"
+TOKEN_CACHE_SIZE = int(os.environ.get("JWT_CACHE_SIZE", "4096"))
+
+_verified: OrderedDict = OrderedDict()  # sha256(token) -> claims
+token_cache_stats = {"hits": 0, "misses": 0}
+
+
+def decode_token(token: str) -> dict:
+    """Verified claims for a bearer token. Raises JWTError if invalid or expired."""
+    key = hashlib.sha256(token.encode()).hexdigest()
+    claims = _verified.get(key)
+    if claims is not None:
+        exp = claims.get("exp")
+        if exp is not None and exp <= time.time():
+            del _verified[key]
+            raise JWTError("Signature has expired.")
+        _verified.move_to_end(key)
+        token_cache_stats["hits"] += 1
+        return claims
+    token_cache_stats["misses"] += 1
+    claims = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+    _verified[key] = claims
+    while len(_verified) > TOKEN_CACHE_SIZE:
+        _verified.popitem(last=False)
+    return claims
+
+
+def bearer_token(authorization: str | None) -> str | None:
+    if authorization and authorization.startswith("Bearer "):
+        return authorization.split(" ", 1)[1].strip() or None
+    return None
+
+
+def claims_for_request(request) -> dict | None:
+    """Claims SecurityMiddleware verified for this request, or None if it didn't."""
+    return getattr(request.state, "jwt_claims", None)
+
+
+def token_cache_metrics() -> dict:
+    return {**token_cache_stats, "size": len(_verified)}
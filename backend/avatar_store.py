@@ -0,0 +1,140 @@
+"""
+Content-addressed avatar storage in GridFS (bucket "avatars").
+
+An uploaded data URL is decoded once and stored under its sha256 together with server-made
+thumbnails; the user document keeps only avatar_hash. Files are named "<hash>/<size>" and
+never change, so /api/avatars/{hash} can be served with immutable cache headers. Only raster
+types browsers can't script (AVATAR_CONTENT_TYPES) are accepted or served: the files come from
+the API origin, where an SVG would run its scripts, and responses also carry nosniff and a
+sandboxing CSP (AVATAR_SECURITY_HEADERS).
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import re
+
+# Optional Pillow import for thumbnails (without it every size serves the original image)
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+AVATAR_BUCKET = "avatars"
+AVATAR_MAX_BYTES = 190_000  # decoded size of the old 250k-char data URL limit
+AVATAR_THUMB_SIZES = {"sm": 64, "md": 256}
+AVATAR_SIZES = ("sm", "md", "full")
+AVATAR_CACHE_CONTROL = "public, max-age=31536000, immutable"
+AVATAR_SECURITY_HEADERS = {"X-Content-Type-Options": "nosniff", "Content-Security-Policy": "default-src 'none'; sandbox"}
+AVATAR_CONTENT_TYPES = {"image/png", "image/jpeg", "image/gif", "image/webp"}
+THUMB_CONTENT_TYPE = "image/webp"
+
+_DATA_URL_RE = re.compile(r"^data:(image/[a-zA-Z0-9.+-]+);base64,(.*)$", re.DOTALL)
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_avatar_hash(value: str) -> bool:
+    return bool(_HASH_RE.match(value or ""))
+
+
+def avatar_path(avatar_hash: str, size: str = "md") -> str:
+    """API path for an avatar (frontend prefixes the backend origin)."""
+    return f"/api/avatars/{avatar_hash}?size={size}"
+
+
+def decode_data_url(data_url: str) -> tuple[bytes, str]:
+    """(image bytes, content type) from a data:image/...;base64 URL. Raises ValueError."""
+    m = _DATA_URL_RE.match((data_url or "").strip())
+    if not m:
+        raise ValueError("Avatar must be an image data URL (data:image/...)")
+    content_type = m.group(1).lower().replace("image/jpg", "image/jpeg")
+    if content_type not in AVATAR_CONTENT_TYPES:
+        raise ValueError("Avatar must be a PNG, JPEG, GIF or WebP image")
+    try:
+        raw = base64.b64decode(m.group(2), validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("Avatar data is not valid base64")
+    if len(raw) > AVATAR_MAX_BYTES:
+        raise ValueError("Avatar too large. Use a smaller image.")
+    return raw, content_type
+
+
+def _make_thumbnails(raw: bytes) -> dict:
+    """size -> webp bytes. Empty if Pillow is missing or the image can't be read."""
+    if not PIL_AVAILABLE:
+        return {}
+    try:
+        with Image.open(io.BytesIO(raw)) as img:
+            img.load()
+            img = img.convert("RGBA")
+            out = {}
+            for size, px in AVATAR_THUMB_SIZES.items():
+                thumb = img.copy()
+                thumb.thumbnail((px, px))
+                buf = io.BytesIO()
+                thumb.save(buf, format="WEBP", quality=85)
+                out[size] = buf.getvalue()
+            return out
+    except Exception as e:
+        logger.warning("Avatar thumbnail failed: %s", e)
+        return {}
+
+
+async def _exists(bucket, filename: str) -> bool:
+    docs = await bucket.find({"filename": filename}, limit=1).to_list(1)
+    return bool(docs)
+
+
+async def store_avatar(bucket, data_url: str) -> str:
+    """Store an avatar (and thumbnails) unless already present. Returns its hash. Raises ValueError."""
+    raw, content_type = decode_data_url(data_url)
+    avatar_hash = hashlib.sha256(raw).hexdigest()
+    if await _exists(bucket, f"{avatar_hash}/full"):
+        return avatar_hash
+    thumbs = await asyncio.to_thread(_make_thumbnails, raw)
+    for size, data in thumbs.items():
+        await bucket.upload_from_stream(f"{avatar_hash}/{size}", data, metadata={"content_type": THUMB_CONTENT_TYPE})
+    # full last: its presence marks the set as complete
+    await bucket.upload_from_stream(f"{avatar_hash}/full", raw, metadata={"content_type": content_type})
+    return avatar_hash
+
+
+async def read_avatar(bucket, avatar_hash: str, size: str) -> tuple[bytes, str] | None:
+    """(bytes, content type) for a stored avatar size, falling back to the original. None for other types."""
+    for name in (f"{avatar_hash}/{size}", f"{avatar_hash}/full"):
+        docs = await bucket.find({"filename": name}, limit=1).to_list(1)
+        if not docs:
+            continue
+        content_type = (docs[0].metadata or {}).get("content_type")
+        if content_type not in AVATAR_CONTENT_TYPES:
+            return None  # stored before uploads were limited to raster types
+        stream = await bucket.open_download_stream(docs[0]._id)
+        data = await stream.read()
+        return data, content_type
+    return None
+
+
+async def migrate_data_url_avatars(db, bucket, batch_size: int = 50) -> int:
+    """Move avatar_url data URLs on users into the store (avatar_hash). Returns users migrated."""
+    migrated = 0
+    while True:
+        users = await db.users.find(
+            {"avatar_url": {"$regex": "^data:"}},
+            {"_id": 0, "id": 1, "avatar_url": 1},
+        ).to_list(batch_size)
+        if not users:
+            return migrated
+        for u in users:
+            try:
+                avatar_hash = await store_avatar(bucket, u["avatar_url"])
+                update = {"$set": {"avatar_hash": avatar_hash}, "$unset": {"avatar_url": ""}}
+            except ValueError as e:
+                logger.warning("Dropping unreadable avatar for user %s: %s", u["id"], e)
+                update = {"$unset": {"avatar_url": ""}}
+            await db.users.update_one({"id": u["id"], "avatar_url": u["avatar_url"]}, update)
+            migrated += 1
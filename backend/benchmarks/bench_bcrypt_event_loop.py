@@ -0,0 +1,71 @@
+"""
+Event-loop latency during a burst of concurrent logins: bcrypt inline vs the bcrypt executor.
+
+A ticker task sleeps 1 ms in a loop and records how late it wakes up; that lateness is what
+every other request on the worker would see.
+
+Run from backend dir:
+    python benchmarks/bench_bcrypt_event_loop.py --logins 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+from server import get_password_hash, verify_password, verify_password_async, BCRYPT_MAX_WORKERS  # noqa: E402
+
+
+async def _ticker(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append((time.perf_counter() - start - 0.001) * 1000)
+
+
+async def _inline_login(password: str, hashed: str):
+    verify_password(password, hashed)  # what login() used to do
+
+
+async def run(mode: str, logins: int, hashed: str) -> dict:
+    stop = asyncio.Event()
+    lags: list = []
+    ticker = asyncio.create_task(_ticker(stop, lags))
+    await asyncio.sleep(0.01)
+    start = time.perf_counter()
+    if mode == "inline":
+        await asyncio.gather(*[_inline_login("hunter22", hashed) for _ in range(logins)])
+    else:
+        await asyncio.gather(*[verify_password_async("hunter22", hashed) for _ in range(logins)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker
+    lags = lags or [0.0]
+    return {
+        "mode": mode,
+        "wall_s": elapsed,
+        "ticks": len(lags),
+        "lag_p50_ms": statistics.median(lags),
+        "lag_max_ms": max(lags),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=20)
+    args = parser.parse_args()
+    hashed = get_password_hash("hunter22")
+    print(f"{args.logins} concurrent logins, executor workers={BCRYPT_MAX_WORKERS}")
+    for mode in ("inline", "executor"):
+        r = asyncio.run(run(mode, args.logins, hashed))
+        print(f"{r['mode']:<9} wall {r['wall_s']:.2f}s  ticks {r['ticks']:>5}  "
+              f"loop lag p50 {r['lag_p50_ms']:.2f} ms  max {r['lag_max_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
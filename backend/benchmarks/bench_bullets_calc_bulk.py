@@ -0,0 +1,86 @@
+"""
+Bullets-to-kill for N targets: N single-target calculations vs one bulk lookup.
+
+Run from backend dir:
+    python benchmarks/bench_bullets_calc_bulk.py                    # in-process: formula per target vs bullet table
+    python benchmarks/bench_bullets_calc_bulk.py --url http://localhost:8001 --token <jwt> --targets a,b,c
+        # over HTTP: POST /api/attack/bullets/calc once per target vs one POST /api/attack/bullets/calc-bulk
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+from server import ARMOUR_BASE_BULLETS, MIN_BULLETS_TO_KILL, bullets_table  # noqa: E402
+import bullet_table  # noqa: E402
+
+
+def bench_in_process(n: int, rounds: int) -> None:
+    rng = random.Random(1)
+    targets = [(rng.randint(0, 5), rng.randint(1, 11)) for _ in range(n)]
+    damage, attacker_rank, inflation = 100, 4, 0.12
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        single = [
+            int(math.ceil(bullet_table.breakdown(ARMOUR_BASE_BULLETS, MIN_BULLETS_TO_KILL, arm, tr, damage, attacker_rank)["bullets_required"] * (1.0 + inflation)))
+            for arm, tr in targets
+        ]
+    single_us = (time.perf_counter() - start) / rounds * 1e6
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        bulk = [required for _, required in bullets_table.bulk(targets, damage, attacker_rank, inflation)]
+    bulk_us = (time.perf_counter() - start) / rounds * 1e6
+
+    assert single == bulk, "table and formula disagree"
+    print(f"{n} targets, {rounds} rounds (in-process)")
+    print(f"{'formula x N':<16}{single_us:>12.1f} us")
+    print(f"{'table bulk':<16}{bulk_us:>12.1f} us  ({single_us / bulk_us:.1f}x)")
+
+
+def bench_http(url: str, token: str, usernames: list, rounds: int) -> None:
+    import httpx
+
+    headers = {"Authorization": f"Bearer {token}"}
+    with httpx.Client(base_url=url.rstrip("/"), headers=headers, timeout=30) as client:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for name in usernames:
+                client.post("/api/attack/bullets/calc", json={"target_username": name}).raise_for_status()
+        single_ms = (time.perf_counter() - start) / rounds * 1000
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            client.post("/api/attack/bullets/calc-bulk", json={"target_usernames": usernames}).raise_for_status()
+        bulk_ms = (time.perf_counter() - start) / rounds * 1000
+
+    print(f"{len(usernames)} targets, {rounds} rounds against {url}")
+    print(f"{'calc x N':<16}{single_ms:>12.1f} ms")
+    print(f"{'calc-bulk':<16}{bulk_ms:>12.1f} ms  ({single_ms / bulk_ms:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--targets-count", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--url")
+    parser.add_argument("--token")
+    parser.add_argument("--targets", help="comma-separated usernames (HTTP mode)")
+    args = parser.parse_args()
+    if args.url:
+        if not args.token or not args.targets:
+            parser.error("--url needs --token and --targets")
+        bench_http(args.url, args.token, [t for t in args.targets.split(",") if t], max(1, args.rounds // 20))
+    else:
+        bench_in_process(args.targets_count, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
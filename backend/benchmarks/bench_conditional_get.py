@@ -0,0 +1,83 @@
+"""
+Poll load test for conditional GET: requests/s and bytes per poll for clients that send no
+validator (full 200 every time) vs clients that send back the ETag (304 while unchanged).
+
+Runs the real app in-process over ASGI (no network, no MongoDB: auth is overridden and the
+leaderboards are filled with synthetic users).
+
+Run from backend dir:
+    python benchmarks/bench_conditional_get.py
+    python benchmarks/bench_conditional_get.py --polls 5000 --users 50000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+import httpx  # noqa: E402
+
+import server  # noqa: E402
+
+ENDPOINTS = ["/api/meta/ranks", "/api/meta/cars", "/api/leaderboards/top?limit=100"]
+
+
+def fill_leaderboards(n: int) -> None:
+    rng = random.Random(11)
+    for i in range(n):
+        server.leaderboard_index.apply({
+            "id": f"bench-{i}",
+            "username": f"player{i}",
+            "rank_points": rng.randint(0, 100_000),
+            "total_kills": rng.randint(0, 500),
+            "total_crimes": rng.randint(0, 20_000),
+            "total_gta": rng.randint(0, 5_000),
+            "jail_busts": rng.randint(0, 3_000),
+            "is_dead": rng.random() < 0.1,
+        })
+
+
+async def poll(client, path: str, polls: int, conditional: bool) -> tuple:
+    etag = None
+    body_bytes = 0
+    start = time.perf_counter()
+    for _ in range(polls):
+        headers = {"If-None-Match": etag} if conditional and etag else {}
+        r = await client.get(path, headers=headers)
+        assert r.status_code in (200, 304), r.status_code
+        etag = r.headers.get("etag") or etag
+        body_bytes += len(r.content)
+    elapsed = time.perf_counter() - start
+    return polls / elapsed, body_bytes / polls
+
+
+async def run(polls: int) -> None:
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    server.app.dependency_overrides[server.get_current_user] = lambda: {"id": "bench-0", "email": "bench@example.com", "username": "player0"}
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"{'endpoint':<34}{'full req/s':>12}{'304 req/s':>12}{'full B/poll':>13}{'304 B/poll':>12}")
+        for path in ENDPOINTS:
+            await poll(client, path, 20, False)  # warm up
+            full_rps, full_bytes = await poll(client, path, polls, False)
+            cond_rps, cond_bytes = await poll(client, path, polls, True)
+            print(f"{path:<34}{full_rps:>12,.0f}{cond_rps:>12,.0f}{full_bytes:>13,.0f}{cond_bytes:>12,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--polls", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=20_000)
+    args = parser.parse_args()
+    fill_leaderboards(args.users)
+    asyncio.run(run(args.polls))
+
+
+if __name__ == "__main__":
+    main()
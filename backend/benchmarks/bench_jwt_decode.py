@@ -0,0 +1,50 @@
+"""
+CPU spent on JWT verification per request: old path (middleware + get_current_user each run
+jose.jwt.decode) vs new path (one LRU-cached decode shared via request.state).
+
+Run from backend dir:
+    python benchmarks/bench_jwt_decode.py --rps 500 --users 300
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+from jose import jwt  # noqa: E402
+import auth_tokens  # noqa: E402
+from server import create_access_token  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rps", type=int, default=500)
+    parser.add_argument("--users", type=int, default=300, help="distinct tokens in the request mix")
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    tokens = [create_access_token({"sub": f"user-{i}"}) for i in range(args.users)]
+    mix = [random.choice(tokens) for _ in range(args.requests)]
+    key, alg = auth_tokens.JWT_SECRET_KEY, auth_tokens.JWT_ALGORITHM
+
+    start = time.process_time()
+    for t in mix:
+        jwt.decode(t, key, algorithms=[alg])  # SecurityMiddleware
+        jwt.decode(t, key, algorithms=[alg])  # get_current_user
+    old_us = (time.process_time() - start) / len(mix) * 1e6
+
+    start = time.process_time()
+    for t in mix:
+        auth_tokens.decode_token(t)  # middleware; dependency reads request.state
+    new_us = (time.process_time() - start) / len(mix) * 1e6
+
+    print(f"{args.requests} requests over {args.users} tokens; cache {auth_tokens.token_cache_metrics()}")
+    print(f"old: {old_us:7.1f} us CPU/request -> {old_us * args.rps / 1e4:.2f}% of a core at {args.rps} req/s")
+    print(f"new: {new_us:7.1f} us CPU/request -> {new_us * args.rps / 1e4:.2f}% of a core at {args.rps} req/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Rank histogram over N synthetic users: stream docs + get_rank_info (old /stats/overview) vs
+one $group on users.rank_id.
+
+Run from backend dir:
+    python benchmarks/bench_rank_histogram.py                 # in-process only (no MongoDB)
+    python benchmarks/bench_rank_histogram.py --mongo         # also against MONGO_URL, in a scratch DB
+    python benchmarks/bench_rank_histogram.py --mongo --users 100000 --db bench_rank_histogram
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+from server import RANKS, get_rank_info  # noqa: E402
+import rank_ids  # noqa: E402
+
+
+def synthetic_users(n: int) -> list:
+    rng = random.Random(7)
+    top = RANKS[-1]["required_points"] * 2
+    users = []
+    for i in range(n):
+        points = int(top * rng.random() ** 4)  # most players low-rank
+        users.append({
+            "id": f"bench-{i}",
+            "rank_points": points,
+            "rank_id": get_rank_info(points)[0],
+            "is_dead": rng.random() < 0.1,
+        })
+    return users
+
+
+def bench_in_process(users: list) -> None:
+    start = time.perf_counter()
+    old = Counter((get_rank_info(int(u.get("rank_points", 0) or 0))[0], bool(u.get("is_dead"))) for u in users)
+    old_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    new = Counter((u["rank_id"], bool(u.get("is_dead"))) for u in users)
+    new_ms = (time.perf_counter() - start) * 1000
+    assert old == new, "rank_id disagrees with get_rank_info"
+    print(f"{len(users):,} users (in-process, docs already in memory)")
+    print(f"{'get_rank_info':<22}{old_ms:>10.1f} ms")
+    print(f"{'stored rank_id':<22}{new_ms:>10.1f} ms")
+
+
+def bench_mongo(users: list, db_name: str, rounds: int) -> None:
+    import asyncio
+
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from db_indexes import INDEXES
+
+    async def run():
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+        coll = client[db_name].users
+        await coll.drop()
+        await coll.create_indexes([m for m in INDEXES["users"] if list(m.document["key"]) == ["rank_id", "is_dead"]])
+        docs = [{k: v for k, v in u.items() if k != "rank_id"} for u in users]
+        for i in range(0, len(docs), 10000):
+            await coll.insert_many(docs[i:i + 10000])
+
+        start = time.perf_counter()
+        await rank_ids.backfill(coll, RANKS, only_missing=True)
+        backfill_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            rows = await coll.find({}, {"_id": 0, "rank_points": 1, "is_dead": 1}).to_list(None)
+            old = Counter((get_rank_info(int(u.get("rank_points", 0) or 0))[0], bool(u.get("is_dead"))) for u in rows)
+        stream_ms = (time.perf_counter() - start) / rounds * 1000
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            groups = await coll.aggregate(rank_ids.histogram_pipeline()).to_list(None)
+        group_ms = (time.perf_counter() - start) / rounds * 1000
+
+        new = Counter()
+        for g in groups:
+            new[(g["_id"], True)] += g["dead"]
+            new[(g["_id"], False)] += g["total"] - g["dead"]
+        assert +old == +new, "histograms differ"
+        await coll.drop()
+        print(f"{len(users):,} users in {db_name} ({rounds} rounds)")
+        print(f"{'backfill rank_id':<22}{backfill_ms:>10.1f} ms (once)")
+        print(f"{'stream + get_rank_info':<22}{stream_ms:>10.1f} ms")
+        print(f"{'$group on rank_id':<22}{group_ms:>10.1f} ms  ({stream_ms / group_ms:.1f}x)")
+
+    asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--mongo", action="store_true")
+    parser.add_argument("--db", default="bench_rank_histogram")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    users = synthetic_users(args.users)
+    bench_in_process(users)
+    if args.mongo:
+        bench_mongo(users, args.db, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Bytes per get_current_user call for each projection profile in server.USER_PROFILES.
+
+Run from backend dir:
+    python benchmarks/bench_user_profiles.py            # synthetic worst-case user (250 KB avatar)
+    python benchmarks/bench_user_profiles.py --from-db  # sample real users from MONGO_URL/DB_NAME
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import bson
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+from server import USER_PROFILES, _user_projection  # noqa: E402
+from user_loader import _project  # noqa: E402
+
+
+def synthetic_user() -> dict:
+    doc = {f: 0 for profile in USER_PROFILES.values() if profile for f in profile}
+    doc.update({
+        "id": "0" * 36,
+        "email": "player@example.com",
+        "username": "SomePlayer",
+        "password_hash": "$2b$12$" + "x" * 53,
+        "avatar_url": "data:image/png;base64," + "A" * 250_000,
+        "booze_run_history": [{"booze_id": "moonshine", "qty": 100, "profit": 12345, "at": "2026-01-01T00:00:00+00:00"}] * 10,
+        "horseracing_history": [{"horse": "Lucky Star", "bet": 1000, "won": False, "at": "2026-01-01T00:00:00+00:00"}] * 20,
+        "booze_carrying": {"moonshine": 50, "bathtub_gin": 25},
+        "booze_carrying_cost": {"moonshine": 10000, "bathtub_gin": 5000},
+        "hitlist_npc_add_timestamps": ["2026-01-01T00:00:00+00:00"] * 3,
+    })
+    return doc
+
+
+def sample_users(limit: int) -> list:
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv(Path(__file__).resolve().parent.parent / ".env")
+    client = MongoClient(os.environ["MONGO_URL"])
+    return list(client[os.environ["DB_NAME"]].users.find({}, {"_id": 0}).limit(limit))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--from-db", action="store_true")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--decode-rounds", type=int, default=200)
+    args = parser.parse_args()
+    users = sample_users(args.limit) if args.from_db else [synthetic_user()]
+    if not users:
+        print("No users found.")
+        return
+    print(f"{len(users)} user doc(s)")
+    print(f"{'profile':<10}{'avg bytes':>12}{'decode us':>12}")
+    for profile in USER_PROFILES:
+        projected = [_project(u, _user_projection(profile)) for u in users]
+        encoded = [bson.encode(p) for p in projected]
+        avg_bytes = sum(len(e) for e in encoded) / len(encoded)
+        start = time.perf_counter()
+        for _ in range(args.decode_rounds):
+            for e in encoded:
+                bson.decode(e)
+        decode_us = (time.perf_counter() - start) / (args.decode_rounds * len(encoded)) * 1e6
+        print(f"{profile:<10}{avg_bytes:>12,.0f}{decode_us:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Batched bodyguard lookup for endpoints that show bodyguards for one or many owners.
+
+resolve() takes a set of owner ids and returns each owner's bodyguards ordered by slot, with
+the bodyguard user's username and rank name attached. It is always one $in query on
+bodyguards plus one $in query on users (skipped when no bodyguard has a user, or when
+with_users=False), however many owners are asked for.
+"""
+BODYGUARD_USER_FIELDS = {"_id": 0, "id": 1, "username": 1, "rank_points": 1}
+MAX_SLOTS = 4
+
+
+async def resolve(db, owner_ids, get_rank_info, with_users: bool = True) -> dict:
+    """
+    {owner_id: [bodyguard, ...]} ordered by slot_number; owners without bodyguards map to [].
+    Each bodyguard is the bodyguards doc plus "username" and "rank_name" (None when there is
+    no bodyguard user or it no longer exists).
+    """
+    owner_ids = list(dict.fromkeys(i for i in owner_ids if i))
+    by_owner: dict = {i: [] for i in owner_ids}
+    if not owner_ids:
+        return by_owner
+    rows = await db.bodyguards.find({"user_id": {"$in": owner_ids}}, {"_id": 0}).sort("slot_number", 1).to_list(len(owner_ids) * MAX_SLOTS * 2)
+
+    users = {}
+    user_ids = list({r["bodyguard_user_id"] for r in rows if r.get("bodyguard_user_id")})
+    if with_users and user_ids:
+        docs = await db.users.find({"id": {"$in": user_ids}}, BODYGUARD_USER_FIELDS).to_list(len(user_ids))
+        users = {u["id"]: u for u in docs}
+
+    for r in rows:
+        u = users.get(r.get("bodyguard_user_id"))
+        by_owner.setdefault(r["user_id"], []).append({
+            **r,
+            "username": u.get("username") if u else None,
+            "rank_name": get_rank_info(int(u.get("rank_points", 0) or 0))[1] if u else None,
+        })
+    return by_owner
@@ -0,0 +1,103 @@
+"""
+Precomputed bullets-to-kill lookup.
+
+Bullets to kill depend on target armour (0-5), target rank (1-11), attacker rank (1-11) and
+attacker weapon damage. The first three form a fixed 6 x 11 x 11 grid; weapon damage only
+takes the handful of values the weapon catalog has, so the table holds one flat row of
+726 cells per damage value, built on first use (the default damage at import). breakdown() is
+the formula itself and stays the single source for the table and the calculator breakdown.
+bulk() resolves many (armour, target rank) cells for one attacker and applies inflation in
+one pass.
+"""
+import math
+
+ARMOUR_LEVELS = 6  # 0..5
+RANK_COUNT = 11  # 1..11
+MIN_WEAPON_DAMAGE = 5
+
+
+def clamp_inputs(armour_level, target_rank_id, attacker_rank_id, weapon_damage) -> tuple:
+    return (
+        min(max(0, int(armour_level or 0)), ARMOUR_LEVELS - 1),
+        min(max(1, int(target_rank_id or 1)), RANK_COUNT),
+        min(max(1, int(attacker_rank_id or 1)), RANK_COUNT),
+        max(MIN_WEAPON_DAMAGE, int(weapon_damage or MIN_WEAPON_DAMAGE)),
+    )
+
+
+def breakdown(armour_base: dict, min_bullets: int, armour_level, target_rank_id, weapon_damage, attacker_rank_id) -> dict:
+    """Bullets to kill with each factor of the formula, for UI/debug."""
+    arm, tr, ar, dmg = clamp_inputs(armour_level, target_rank_id, attacker_rank_id, weapon_damage)
+    base = armour_base.get(arm, min_bullets)
+
+    # Defender scaling (rank + rank gap)
+    gap = max(0, tr - ar)
+    rank_factor = 1.0 + (tr - 1) * 0.20          # up to 3.0x at rank 11
+    gap_factor = 1.0 + gap * 0.60                # big gaps hurt a lot
+
+    # Attacker reductions (weapon + rank)
+    weapon_factor = 1.0 + (dmg / 140.0)          # best weapon ~1.85x
+    attacker_factor = 1.0 + (ar - 1) * 0.05      # rank 11 ~1.5x
+
+    needed_raw = (base * rank_factor * gap_factor) / weapon_factor / attacker_factor
+    needed_before_clamp = int(math.ceil(needed_raw))
+    # No artificial floor and no max cap (per request).
+    bullets_required = max(1, needed_before_clamp)
+
+    return {
+        "base_from_armour": base,
+        "rank_factor": round(rank_factor, 3),
+        "gap_factor": round(gap_factor, 3),
+        "weapon_factor": round(weapon_factor, 3),
+        "attacker_factor": round(attacker_factor, 3),
+        "rank_gap": gap,
+        "needed_raw": needed_raw,
+        "needed_before_clamp": needed_before_clamp,
+        "bullets_required": bullets_required,
+    }
+
+
+def _cell(arm: int, tr: int, ar: int) -> int:
+    return (arm * RANK_COUNT + (tr - 1)) * RANK_COUNT + (ar - 1)
+
+
+class BulletTable:
+    def __init__(self, armour_base: dict, min_bullets: int):
+        self.armour_base = dict(armour_base)
+        self.min_bullets = min_bullets
+        self._rows: dict = {}  # weapon damage -> tuple of ARMOUR_LEVELS * RANK_COUNT * RANK_COUNT ints
+        self.row(MIN_WEAPON_DAMAGE)
+
+    def row(self, weapon_damage: int) -> tuple:
+        row = self._rows.get(weapon_damage)
+        if row is None:
+            row = tuple(
+                breakdown(self.armour_base, self.min_bullets, arm, tr, weapon_damage, ar)["bullets_required"]
+                for arm in range(ARMOUR_LEVELS)
+                for tr in range(1, RANK_COUNT + 1)
+                for ar in range(1, RANK_COUNT + 1)
+            )
+            self._rows[weapon_damage] = row
+        return row
+
+    def lookup(self, armour_level, target_rank_id, weapon_damage, attacker_rank_id) -> int:
+        arm, tr, ar, dmg = clamp_inputs(armour_level, target_rank_id, attacker_rank_id, weapon_damage)
+        return self.row(dmg)[_cell(arm, tr, ar)]
+
+    def bulk(self, targets, weapon_damage, attacker_rank_id, inflation: float = 0.0) -> list:
+        """
+        targets: iterable of (armour_level, target_rank_id) for one attacker.
+        Returns [(bullets_base, bullets_required)] with inflation applied, in input order.
+        """
+        _, _, ar, dmg = clamp_inputs(0, 1, attacker_rank_id, weapon_damage)
+        row = self.row(dmg)
+        factor = 1.0 + inflation
+        out = []
+        for armour_level, target_rank_id in targets:
+            arm, tr, _, _ = clamp_inputs(armour_level, target_rank_id, ar, dmg)
+            base = row[_cell(arm, tr, ar)]
+            out.append((base, int(math.ceil(base * factor))))
+        return out
+
+    def metrics(self) -> dict:
+        return {"damage_rows": len(self._rows), "cells": sum(len(r) for r in self._rows.values())}
@@ -0,0 +1,138 @@
+"""
+Read-only catalog of static game data: crimes, weapons, properties, cars and family rackets.
+
+Crimes, weapons and properties are seeded into MongoDB by init_game_data() and loaded here once
+at startup; CARS and FAMILY_RACKETS come from the constants in server.py. Rows are exposed as
+read-only mappings keyed by id, with derived views (cars by rarity, GTA car pool per
+difficulty, weapons by damage) built once per load. load() builds a new Catalog and swaps it
+in whole, so a reload (POST /api/admin/catalog/reload) never exposes a half-built state.
+Each worker holds its own catalog: the reload endpoint reloads the worker that took it and
+$inc's game_config {"id": "catalog"}.version, and run() in every worker polls that version every
+CATALOG_VERSION_POLL_SECONDS and reloads when it changes.
+Copy a row with dict(row) before changing it.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from types import MappingProxyType
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+# Quick Trade casino listings share the properties collection; catalog rows are the ones with an id
+STATIC_PROPERTY_FILTER = {"id": {"$exists": True}}
+CATALOG_VERSION_POLL_SECONDS = float(os.environ.get("CATALOG_VERSION_POLL_SECONDS", "5"))
+
+
+def _freeze_rows(rows) -> tuple:
+    return tuple(MappingProxyType(dict(r)) for r in rows if r.get("id"))
+
+
+def _by_id(rows: tuple) -> MappingProxyType:
+    return MappingProxyType({r["id"]: r for r in rows})
+
+
+class Catalog:
+    def __init__(self, crimes=(), weapons=(), properties=(), cars=(), rackets=()):
+        self.crime_list = _freeze_rows(crimes)
+        self.weapon_list = _freeze_rows(weapons)
+        self.property_list = _freeze_rows(properties)
+        self.car_list = _freeze_rows(cars)
+        self.racket_list = _freeze_rows(rackets)
+        self.crimes = _by_id(self.crime_list)
+        self.weapons = _by_id(self.weapon_list)
+        self.properties = _by_id(self.property_list)
+        self.cars = _by_id(self.car_list)
+        self.rackets = _by_id(self.racket_list)
+
+        self.weapons_by_damage = tuple(sorted(self.weapon_list, key=lambda w: int(w.get("damage") or 0), reverse=True))
+        by_rarity: dict = {}
+        for c in self.car_list:
+            by_rarity.setdefault(c.get("rarity"), []).append(c)
+        self.cars_by_rarity = MappingProxyType({k: tuple(v) for k, v in by_rarity.items()})
+        self.exclusive_car_ids = frozenset(c["id"] for c in by_rarity.get("exclusive", ()))
+        # GTA pool: non-exclusive cars stealable at each difficulty (min_difficulty <= difficulty)
+        difficulties = sorted({int(c.get("min_difficulty") or 1) for c in self.car_list})
+        self.gta_cars_by_difficulty = MappingProxyType({
+            d: tuple(c for c in self.car_list if int(c.get("min_difficulty") or 1) <= d and c.get("rarity") != "exclusive")
+            for d in difficulties
+        })
+        self.loaded_at = datetime.now(timezone.utc)
+
+    def gta_cars(self, difficulty: int) -> tuple:
+        """Cars a GTA attempt at this difficulty can yield; difficulty-1 cars if none qualify."""
+        eligible = [d for d in self.gta_cars_by_difficulty if d <= difficulty]
+        pool = self.gta_cars_by_difficulty[max(eligible)] if eligible else ()
+        return pool or tuple(c for c in self.car_list if c.get("min_difficulty") == 1)
+
+    def is_exclusive_car(self, car_id) -> bool:
+        return car_id in self.exclusive_car_ids
+
+    def metrics(self) -> dict:
+        return {
+            "crimes": len(self.crimes),
+            "weapons": len(self.weapons),
+            "properties": len(self.properties),
+            "cars": len(self.cars),
+            "rackets": len(self.rackets),
+            "loaded_at": self.loaded_at.isoformat(),
+        }
+
+
+_current = Catalog()
+_version = None  # game_config catalog version the current catalog was loaded at
+reloads = 0
+
+
+def current() -> Catalog:
+    return _current
+
+
+async def _read_version(config) -> int:
+    doc = await config.find_one({"id": "catalog"}, {"_id": 0, "version": 1})
+    return int((doc or {}).get("version") or 0)
+
+
+async def publish_reload(config) -> int:
+    """Bump the shared catalog version so every worker's run() reloads; returns the new version."""
+    doc = await config.find_one_and_update(
+        {"id": "catalog"},
+        {"$inc": {"version": 1}},
+        projection={"_id": 0, "version": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return int(doc["version"])
+
+
+async def load(db, cars, rackets, version: int | None = None) -> Catalog:
+    """Read crimes/weapons/properties from db, build a Catalog and make it current."""
+    global _current, _version, reloads
+    if version is None:
+        version = await _read_version(db.game_config)
+    crimes = await db.crimes.find({}, {"_id": 0}).to_list(None)
+    weapons = await db.weapons.find({}, {"_id": 0}).to_list(None)
+    properties = await db.properties.find(STATIC_PROPERTY_FILTER, {"_id": 0}).to_list(None)
+    _current = Catalog(crimes, weapons, properties, cars, rackets)
+    _version = version
+    reloads += 1
+    logger.info("Catalog loaded: %s", _current.metrics())
+    return _current
+
+
+async def run(db, cars, rackets, poll_seconds: float = CATALOG_VERSION_POLL_SECONDS) -> None:
+    """Reload when another worker publishes a catalog reload."""
+    while True:
+        await asyncio.sleep(poll_seconds)
+        try:
+            version = await _read_version(db.game_config)
+            if version != _version:
+                await load(db, cars, rackets, version)
+        except Exception:
+            logger.exception("catalog version poll failed")
+
+
+def metrics() -> dict:
+    return {**_current.metrics(), "version": _version, "reloads": reloads}
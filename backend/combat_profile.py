@@ -0,0 +1,158 @@
+"""
+Denormalized combat profile kept on each user as users.combat_profile.
+
+    {"weapon_id", "weapon_name", "weapon_damage", "equipped_weapon_id", "rank_id", "armour_level"}
+
+weapon_* is the weapon the user fights with: the equipped weapon if still owned, otherwise the
+highest-damage owned weapon, otherwise bare "Brass Knuckles" damage. Weapon and armour
+endpoints write the affected fields in the same users update as the purchase/equip itself
+(set_fields() gives the dotted $set), so /attack/execute and /attack/bullets/calc read
+everything from the user document they already loaded. rank_points is $inc'd from many
+places, so rank_id is compared against rank_points on read and rewritten when a rank changes.
+
+Profiles missing or incomplete (users created before this, or never in combat) are built on
+first use and by backfill() at startup; check() compares stored profiles with the source
+data (GET /api/admin/combat-profiles/check, ?fix=true rewrites mismatches).
+"""
+import asyncio
+import logging
+
+from user_loader import UserUpdateOne
+
+logger = logging.getLogger(__name__)
+
+PROFILE_FIELDS = ("weapon_id", "weapon_name", "weapon_damage", "equipped_weapon_id", "rank_id", "armour_level")
+DEFAULT_WEAPON_DAMAGE = 5
+DEFAULT_WEAPON_NAME = "Brass Knuckles"
+USER_FIELDS = {"_id": 0, "id": 1, "rank_points": 1, "armour_level": 1, "equipped_weapon_id": 1, "combat_profile": 1}
+
+
+def weapon_fields(owned_ids, equipped_weapon_id, cat) -> dict:
+    """Combat weapon for a user owning owned_ids (same rule the kill path has always used)."""
+    if equipped_weapon_id and equipped_weapon_id in owned_ids:
+        w = cat.weapons.get(equipped_weapon_id)
+        if w:
+            return {
+                "weapon_id": w["id"],
+                "weapon_name": w.get("name") or "Weapon",
+                "weapon_damage": int(w.get("damage", 5) or 5),
+                "equipped_weapon_id": equipped_weapon_id,
+            }
+    # weapons_by_damage is sorted high to low, so the first owned one is the best
+    w = next((x for x in cat.weapons_by_damage if x["id"] in owned_ids), None)
+    if w and int(w.get("damage", 0) or 0) > DEFAULT_WEAPON_DAMAGE:
+        fields = {"weapon_id": w["id"], "weapon_name": w.get("name") or DEFAULT_WEAPON_NAME, "weapon_damage": int(w["damage"])}
+    else:
+        fields = {"weapon_id": None, "weapon_name": DEFAULT_WEAPON_NAME, "weapon_damage": DEFAULT_WEAPON_DAMAGE}
+    fields["equipped_weapon_id"] = equipped_weapon_id if equipped_weapon_id in owned_ids else None
+    return fields
+
+
+def build(user: dict, owned_ids, cat, rank_of) -> dict:
+    return {
+        **weapon_fields(owned_ids, user.get("equipped_weapon_id"), cat),
+        "rank_id": rank_of(user.get("rank_points", 0) or 0),
+        "armour_level": int(user.get("armour_level", 0) or 0),
+    }
+
+
+def fields_after_gain(profile, weapon_id: str, cat) -> dict:
+    """Profile fields that change when the user gains weapon_id; the stored profile already knows the current weapon."""
+    if not is_complete(profile) or profile.get("equipped_weapon_id"):
+        return {}
+    w = cat.weapons.get(weapon_id)
+    if w and int(w.get("damage") or 0) > profile["weapon_damage"]:
+        return weapon_fields({weapon_id}, None, cat)
+    return {}
+
+
+def set_fields(fields: dict) -> dict:
+    """Dotted $set for some profile fields, to merge into another users update."""
+    return {f"combat_profile.{k}": v for k, v in fields.items()}
+
+
+def is_complete(profile) -> bool:
+    return isinstance(profile, dict) and all(k in profile for k in PROFILE_FIELDS)
+
+
+async def owned_weapon_ids(db, user_id: str) -> set:
+    rows = await db.user_weapons.find({"user_id": user_id, "quantity": {"$gt": 0}}, {"_id": 0, "weapon_id": 1}).to_list(100)
+    return {r["weapon_id"] for r in rows}
+
+
+async def refresh(db, user_id: str, cat, rank_of) -> dict | None:
+    """Rebuild one user's profile from user_weapons and the user document."""
+    user, owned = await asyncio.gather(db.users.find_one({"id": user_id}, USER_FIELDS), owned_weapon_ids(db, user_id))
+    if not user:
+        return None
+    profile = build(user, owned, cat, rank_of)
+    await db.users.update_one({"id": user_id}, {"$set": {"combat_profile": profile}})
+    return profile
+
+
+async def for_user(db, user: dict, cat, rank_of) -> dict:
+    """Profile for an already-loaded user document (needs combat_profile and rank_points)."""
+    profile = user.get("combat_profile")
+    if not is_complete(profile):
+        return await refresh(db, user["id"], cat, rank_of) or build(user, set(), cat, rank_of)
+    rank_id = rank_of(user.get("rank_points", 0) or 0)
+    if profile["rank_id"] != rank_id:
+        profile = {**profile, "rank_id": rank_id}
+        await db.users.update_one({"id": user["id"]}, {"$set": {"combat_profile.rank_id": rank_id}})
+    return profile
+
+
+async def _expected_profiles(db, users: list, cat, rank_of) -> dict:
+    ids = [u["id"] for u in users]
+    owned: dict = {uid: set() for uid in ids}
+    rows = await db.user_weapons.find({"user_id": {"$in": ids}, "quantity": {"$gt": 0}}, {"_id": 0, "user_id": 1, "weapon_id": 1}).to_list(None)
+    for r in rows:
+        owned.setdefault(r["user_id"], set()).add(r["weapon_id"])
+    return {u["id"]: build(u, owned[u["id"]], cat, rank_of) for u in users}
+
+
+async def backfill(db, cat, rank_of, batch_size: int = 500) -> int:
+    """Write profiles for users without a complete one. Returns users updated."""
+    missing = {"$or": [{f"combat_profile.{k}": {"$exists": False}} for k in PROFILE_FIELDS]}
+    written = 0
+    while True:
+        users = await db.users.find(missing, USER_FIELDS).limit(batch_size).to_list(batch_size)
+        if not users:
+            break
+        expected = await _expected_profiles(db, users, cat, rank_of)
+        await db.users.bulk_write([UserUpdateOne({"id": uid}, {"$set": {"combat_profile": p}}) for uid, p in expected.items()], ordered=False)
+        written += len(users)
+        if len(users) < batch_size:
+            break
+    if written:
+        logger.info("Backfilled combat_profile for %s users", written)
+    return written
+
+
+async def check(db, cat, rank_of, fix: bool = False, batch_size: int = 500, sample_size: int = 20) -> dict:
+    """Compare every stored profile with the source data; optionally rewrite the ones that differ."""
+    checked = 0
+    mismatched = 0
+    samples = []
+    last_id = None
+    while True:
+        query = {"id": {"$gt": last_id}} if last_id else {}
+        users = await db.users.find(query, USER_FIELDS).sort("id", 1).limit(batch_size).to_list(batch_size)
+        if not users:
+            break
+        last_id = users[-1]["id"]
+        expected = await _expected_profiles(db, users, cat, rank_of)
+        fixes = []
+        for u in users:
+            stored = u.get("combat_profile") or {}
+            want = expected[u["id"]]
+            diff = {k: {"stored": stored.get(k), "expected": v} for k, v in want.items() if stored.get(k) != v}
+            if diff:
+                mismatched += 1
+                if len(samples) < sample_size:
+                    samples.append({"user_id": u["id"], "diff": diff})
+                fixes.append(UserUpdateOne({"id": u["id"]}, {"$set": {"combat_profile": want}}))
+        checked += len(users)
+        if fix and fixes:
+            await db.users.bulk_write(fixes, ordered=False)
+    return {"checked": checked, "mismatched": mismatched, "fixed": mismatched if fix else 0, "samples": samples}
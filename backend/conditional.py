@@ -0,0 +1,116 @@
+"""
+Conditional GET (ETag / Last-Modified / 304) for endpoints that are polled and rarely change.
+
+respond() takes a version for the data behind the response and builds the ETag from it and
+the request's parameters, so a client sending If-None-Match with the current tag gets a 304
+before the endpoint builds anything. The version must be the same on every worker for the same
+data (a hash of deployed constants, a version stored in MongoDB), never a per-process counter:
+behind a load balancer a client revalidates against whichever worker it reaches. Responses
+that are the same for every user (shared=True) also keep their serialized body per key.
+respond_body() tags a response by a hash of its rendered body: used where the data is
+in-process state with no shared version (event cache, in-memory leaderboards) or mixes in
+per-user collections. It still renders, but an unchanged poll gets a bodiless 304.
+
+Cache-Control per endpoint class:
+    static   data fixed for the process (ranks, cars): clients may reuse it for a while
+    catalog  shared data: revalidate every poll (cheap 304s)
+    user     per-user views: private, revalidate every poll
+"""
+import hashlib
+import json
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import Response
+
+CACHE_CONTROL = {
+    "static": "private, max-age=300",
+    "catalog": "private, no-cache",
+    "user": "private, no-cache",
+}
+SHARED_BODY_MAX_ENTRIES = 256
+
+_bodies: dict = {}  # key -> (etag, last_modified, body) for shared responses
+_stats = {"not_modified": 0, "built": 0, "body_hits": 0, "bytes_sent": 0, "bytes_saved": 0}
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def _render(content) -> bytes:
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def _is_fresh(request, etag: str, last_modified: datetime | None) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        tags = {t.strip() for t in inm.split(",")}
+        return "*" in tags or etag in tags or etag.removeprefix("W/") in tags
+    ims = request.headers.get("if-modified-since")
+    if ims and last_modified is not None:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _headers(etag: str, cache_class: str, last_modified: datetime | None) -> dict:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL[cache_class]}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+
+def _not_modified(headers: dict, size: int | None = None) -> Response:
+    _stats["not_modified"] += 1
+    if size:
+        _stats["bytes_saved"] += size
+    return Response(status_code=304, headers=headers)
+
+
+def _ok(body: bytes, headers: dict) -> Response:
+    _stats["bytes_sent"] += len(body)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def respond(request, key, version, build, cache_class: str = "catalog", last_modified: datetime | None = None, shared: bool = False) -> Response:
+    """
+    key: what identifies the response besides version (path, query params, user id when the
+    output depends on the caller). build: async callable returning the JSON-able content.
+    """
+    etag = make_etag(key, version)
+    headers = _headers(etag, cache_class, last_modified)
+    cached = _bodies.get(key) if shared else None
+    if cached and cached[0] != etag:
+        cached = None
+    if _is_fresh(request, etag, last_modified):
+        return _not_modified(headers, len(cached[2]) if cached else None)
+    if cached:
+        _stats["body_hits"] += 1
+        return _ok(cached[2], headers)
+    body = _render(await build())
+    _stats["built"] += 1
+    if shared:
+        if len(_bodies) >= SHARED_BODY_MAX_ENTRIES and key not in _bodies:
+            _bodies.pop(next(iter(_bodies)))
+        _bodies[key] = (etag, last_modified, body)
+    return _ok(body, headers)
+
+
+def respond_body(request, content, cache_class: str = "user") -> Response:
+    """ETag from the rendered body, for responses with no cheaper version to compare."""
+    body = _render(content)
+    _stats["built"] += 1
+    etag = 'W/"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+    headers = _headers(etag, cache_class, None)
+    if _is_fresh(request, etag, None):
+        return _not_modified(headers, len(body))
+    return _ok(body, headers)
+
+
+def metrics() -> dict:
+    return {**_stats, "shared_bodies": len(_bodies)}
@@ -0,0 +1,255 @@
+"""
+MongoDB index registry: every index the game relies on, in one place.
+
+Startup calls ensure_indexes(db), which creates anything missing (create_indexes is a
+no-op for indexes that already exist with the same spec).
+
+TTL indexes (expireAfterSeconds) let MongoDB delete expired documents itself; they only act
+on BSON date values (see timestamps.py) and the TTL monitor runs about once a minute, so
+readers still filter on the expiry field.
+
+Run from backend dir:
+    python db_indexes.py                   # create missing indexes
+    python db_indexes.py --check-indexes   # explain() every QUERY_SHAPES entry, exit 1 on COLLSCAN
+"""
+import logging
+import sys
+from pathlib import Path
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Accepted invites must outlive expires_at until the creator runs the heist
+OC_INVITE_RETENTION_SECONDS = 24 * 3600
+SECURITY_FLAG_RETENTION_SECONDS = 30 * 24 * 3600
+# Leaderboard dirty ids only need to outlive the slowest worker's flush (leaderboards.py)
+LEADERBOARD_DIRTY_RETENTION_SECONDS = 600
+
+
+def _idx(*keys, **options) -> IndexModel:
+    """IndexModel from (field, direction) pairs or bare field names (ascending)."""
+    spec = [(k, ASCENDING) if isinstance(k, str) else k for k in keys]
+    return IndexModel(spec, **options)
+
+
+# collection -> indexes. Unique indexes only where the app already guarantees uniqueness.
+INDEXES = {
+    "users": [
+        _idx("id", unique=True),
+        _idx("email", unique=True),
+        _idx("username", unique=True),
+        _idx("username_lower"),
+        _idx("last_seen"),
+        _idx("forced_online_until"),
+        _idx("kill_inflation"),
+        _idx("family_id"),
+        _idx("bodyguard_owner_id"),
+        _idx(("total_kills", DESCENDING)),
+        _idx(("rank_points", DESCENDING)),
+        _idx("rank_id", "is_dead"),
+        _idx(("money", DESCENDING)),
+    ],
+    "attacks": [
+        _idx("id", unique=True),
+        _idx("attacker_id", "status", ("search_started", DESCENDING)),
+        _idx("status", "found_at"),
+        _idx("target_id"),
+        _idx("expires_at", expireAfterSeconds=0),
+    ],
+    "attack_attempts": [
+        _idx("attacker_id", ("created_at", DESCENDING)),
+        _idx("target_id", ("created_at", DESCENDING)),
+        _idx("outcome", ("created_at", DESCENDING)),
+    ],
+    "notifications": [
+        _idx("user_id", ("created_at", DESCENDING)),
+        _idx("user_id", "read"),
+        _idx("id"),
+    ],
+    "user_crimes": [_idx("user_id", "crime_id")],
+    "user_weapons": [_idx("user_id", "weapon_id")],
+    "user_properties": [_idx("user_id", "property_id")],
+    "user_cars": [_idx("user_id"), _idx("id")],
+    "bodyguards": [_idx("user_id", "slot_number"), _idx("bodyguard_user_id")],
+    "bodyguard_invites": [
+        _idx("id"),
+        _idx("inviter_id", "status"),
+        _idx("invitee_id", "status"),
+    ],
+    "hitlist": [
+        _idx("id"),
+        _idx("target_id", "target_type"),
+        _idx("placer_id"),
+        _idx(("created_at", DESCENDING)),
+    ],
+    "families": [_idx("id", unique=True), _idx("name"), _idx("tag")],
+    "family_members": [_idx("family_id", "user_id"), _idx("user_id")],
+    "family_wars": [
+        _idx("id"),
+        _idx("family_a_id", "status"),
+        _idx("family_b_id", "status"),
+        _idx(("created_at", DESCENDING)),
+    ],
+    "family_war_stats": [_idx("war_id", "user_id"), _idx("user_id")],
+    "family_racket_attacks": [_idx("attacker_family_id", "target_family_id", "target_racket_id")],
+    "extortions": [_idx("extorter_id", "target_id", "property_id"), _idx("target_id")],
+    "bank_deposits": [_idx("user_id"), _idx("id"), _idx("claimed_at")],
+    "money_transfers": [_idx("from_user_id"), _idx("to_user_id")],
+    "interest_deposits": [_idx("user_id")],
+    "gta_cooldowns": [_idx("user_id")],
+    "oc_pending_heists": [_idx("id"), _idx("creator_id")],
+    "oc_invites": [
+        _idx("id"),
+        _idx("pending_heist_id", "role"),
+        _idx("creator_id"),
+        _idx("expires_at", expireAfterSeconds=OC_INVITE_RETENTION_SECONDS),
+    ],
+    "dice_ownership": [_idx("city"), _idx("owner_id")],
+    "roulette_ownership": [_idx("city"), _idx("owner_id")],
+    "blackjack_ownership": [_idx("city"), _idx("owner_id")],
+    "horseracing_ownership": [_idx("city"), _idx("owner_id")],
+    "dice_buy_back_offers": [_idx("id"), _idx("from_owner_id"), _idx("to_user_id"), _idx("expires_at", expireAfterSeconds=0)],
+    "blackjack_buy_back_offers": [_idx("id"), _idx("from_owner_id"), _idx("to_user_id"), _idx("expires_at", expireAfterSeconds=0)],
+    "blackjack_games": [_idx("user_id")],
+    "sports_events": [_idx("id"), _idx("status")],
+    "sports_bets": [_idx("id"), _idx("user_id", "status")],
+    "trade_sell_offers": [_idx("status"), _idx("user_id", "status")],
+    "trade_buy_offers": [_idx("status"), _idx("user_id", "status")],
+    "security_flags": [_idx("user_id"), _idx("created_at", expireAfterSeconds=SECURITY_FLAG_RETENTION_SECONDS)],
+    "payment_transactions": [_idx("session_id")],
+    "jail_npcs": [_idx("username")],
+    "game_config": [_idx("id", unique=True)],
+    "stats_snapshots": [_idx("id", unique=True)],
+    "kill_feed": [_idx("created_at")],
+    "leaderboard_dirty": [_idx("at", expireAfterSeconds=LEADERBOARD_DIRTY_RETENTION_SECONDS)],
+    "game_settings": [_idx("key")],
+    "crimes": [_idx("id", unique=True)],
+    "weapons": [_idx("id", unique=True)],
+    "properties": [_idx("id")],
+}
+
+# Real query shapes from the request path: (collection, filter, sort or None).
+# --check-indexes fails if any of these plans a COLLSCAN.
+QUERY_SHAPES = [
+    ("users", {"id": "x"}, None),
+    ("users", {"email": "x"}, None),
+    ("users", {"username": "x"}, None),
+    ("users", {"username_lower": "x"}, None),
+    ("users", {"$or": [{"last_seen": {"$gte": "x"}}, {"forced_online_until": {"$gt": "x"}}]}, None),
+    ("users", {"family_id": "x"}, None),
+    ("users", {"is_bodyguard": True, "bodyguard_owner_id": "x"}, None),
+    ("users", {}, [("total_kills", DESCENDING)]),
+    ("users", {}, [("rank_points", DESCENDING)]),
+    ("attacks", {"id": "x"}, None),
+    ("attacks", {"attacker_id": "x", "status": {"$in": ["searching", "found"]}, "expires_at": {"$gt": "x"}}, [("search_started", DESCENDING)]),
+    ("attacks", {"attacker_id": "x", "target_id": "y", "status": {"$in": ["searching", "found"]}, "expires_at": {"$gt": "x"}}, None),
+    ("attacks", {"status": "searching", "found_at": {"$lte": "x"}}, [("found_at", ASCENDING)]),
+    ("attack_attempts", {"outcome": "killed"}, [("created_at", DESCENDING)]),
+    ("kill_feed", {"created_at": {"$gt": "x"}}, [("created_at", DESCENDING)]),
+    ("leaderboard_dirty", {"at": {"$gt": "x"}, "worker": {"$ne": "x"}}, None),
+    ("attack_attempts", {"$or": [{"attacker_id": "x"}, {"target_id": "x"}]}, [("created_at", DESCENDING)]),
+    ("notifications", {"user_id": "x"}, [("created_at", DESCENDING)]),
+    ("notifications", {"user_id": "x", "read": False}, None),
+    ("notifications", {"user_id": "x", "sender_id": "y", "notification_type": "user_message"}, [("created_at", ASCENDING)]),
+    ("user_crimes", {"user_id": "x", "crime_id": "y"}, None),
+    ("user_weapons", {"user_id": "x", "weapon_id": "y"}, None),
+    ("user_properties", {"user_id": "x", "property_id": "y"}, None),
+    ("user_cars", {"user_id": "x"}, None),
+    ("bodyguards", {"user_id": "x"}, None),
+    ("bodyguards", {"user_id": "x", "slot_number": 1}, None),
+    ("bodyguard_invites", {"invitee_id": "x", "status": "pending"}, None),
+    ("hitlist", {"target_id": "x"}, None),
+    ("hitlist", {"target_id": "x", "target_type": "npc", "placer_id": "y"}, None),
+    ("families", {"id": "x"}, None),
+    ("family_members", {"family_id": "x"}, None),
+    ("family_members", {"family_id": "x", "user_id": "y"}, None),
+    ("family_members", {"user_id": "x"}, None),
+    ("family_wars", {"$or": [{"family_a_id": "x"}, {"family_b_id": "x"}], "status": {"$in": ["active", "truce_offered"]}}, None),
+    ("bank_deposits", {"user_id": "x"}, None),
+    ("money_transfers", {"$or": [{"from_user_id": "x"}, {"to_user_id": "x"}]}, None),
+    ("oc_invites", {"id": "x"}, None),
+    ("oc_pending_heists", {"creator_id": "x"}, None),
+    ("dice_ownership", {"city": "Chicago"}, None),
+    ("blackjack_games", {"user_id": "x"}, None),
+    ("sports_bets", {"user_id": "x", "status": "open"}, None),
+    ("game_config", {"id": "main"}, None),
+    ("crimes", {"id": "crime1"}, None),
+]
+
+
+async def ensure_indexes(db) -> None:
+    """Create every index in INDEXES. Idempotent; a conflicting index is logged, not fatal."""
+    for collection, models in INDEXES.items():
+        for model in models:
+            try:
+                await db[collection].create_indexes([model])
+            except OperationFailure as e:
+                # e.g. duplicate data blocking a unique index; keep going so the rest still apply
+                logger.error("Index %s on %s not created: %s", model.document["name"], collection, e)
+
+
+def _plan_stages(plan: dict):
+    """Yield every stage name in an explain() plan tree."""
+    if not isinstance(plan, dict):
+        return
+    if plan.get("stage"):
+        yield plan["stage"]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get("inputStages") or []:
+        yield from _plan_stages(child)
+
+
+def check_query_shapes(sync_db) -> list:
+    """Explain each QUERY_SHAPES entry. Returns [(collection, filter, stages)] for those that COLLSCAN."""
+    failures = []
+    for collection, query, sort in QUERY_SHAPES:
+        cmd = {"find": collection, "filter": query}
+        if sort:
+            cmd["sort"] = dict(sort)
+        explained = sync_db.command("explain", cmd, verbosity="queryPlanner")
+        stages = list(_plan_stages(explained["queryPlanner"]["winningPlan"]))
+        if "COLLSCAN" in stages:
+            failures.append((collection, query, stages))
+    return failures
+
+
+def _sync_db():
+    import os
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv(Path(__file__).parent / ".env")
+    mongo_url = os.environ["MONGO_URL"]
+    if "mongodb+srv" in mongo_url or "mongodb.net" in mongo_url:
+        import certifi
+        client = MongoClient(mongo_url, tlsCAFile=certifi.where())
+    else:
+        client = MongoClient(mongo_url)
+    return client[os.environ["DB_NAME"]]
+
+
+def run(check: bool) -> int:
+    sync_db = _sync_db()
+    for collection, models in INDEXES.items():
+        sync_db[collection].create_indexes(models)
+    print(f"Indexes ensured on {len(INDEXES)} collections.")
+    if not check:
+        return 0
+    failures = check_query_shapes(sync_db)
+    for collection, query, stages in failures:
+        print(f"COLLSCAN  {collection} {query}  ({' <- '.join(stages)})")
+    print(f"{len(QUERY_SHAPES) - len(failures)}/{len(QUERY_SHAPES)} query shapes use an index.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Apply the MongoDB index registry.")
+    parser.add_argument("--check-indexes", action="store_true", help="explain() known query shapes and fail on COLLSCAN")
+    args = parser.parse_args()
+    sys.exit(run(args.check_indexes))
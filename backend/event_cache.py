@@ -0,0 +1,91 @@
+"""
+Per-process cache of the game event state behind get_effective_event().
+
+The event flags in game_config "main" are read once and the resulting state is reused until
+the next UTC midnight (the daily event rotates) or until game_config changes. Admin writes
+$inc game_config.version; each worker watches the "main" doc (change stream filtered on its
+_id when the deployment supports one, otherwise a version poll every
+EVENT_VERSION_POLL_SECONDS) and drops its cached state, so a toggle on one worker reaches all
+of them within about a second. The lease and claim docs that share the collection
+(attack_scheduler_lease, stats_snapshot, kill_inflation_decay, seed_lock) are renewed every few
+seconds and must not invalidate the cache.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone, timedelta
+
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+EVENT_VERSION_POLL_SECONDS = float(os.environ.get("EVENT_VERSION_POLL_SECONDS", "1"))
+
+
+def next_utc_midnight(now: datetime) -> datetime:
+    return datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)
+
+
+class EventStateCache:
+    def __init__(self, poll_seconds: float = EVENT_VERSION_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._state = None
+        self._valid_until = None
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.mode = "none"  # "change_stream" or "poll" once run() starts
+
+    async def get(self, load) -> dict:
+        """Cached state, or await load() and cache it until the next UTC midnight."""
+        now = datetime.now(timezone.utc)
+        if self._state is not None and now < self._valid_until:
+            self.hits += 1
+            return self._state
+        self.misses += 1
+        gen = self._generation
+        state = await load()
+        if gen == self._generation:  # not invalidated while loading
+            self._state = state
+            self._valid_until = next_utc_midnight(now)
+        return state
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        self._state = None
+        self.invalidations += 1
+
+    async def run(self, collection) -> None:
+        """Watch the game_config "main" doc for changes; fall back to polling its version."""
+        try:
+            # Create "main" if needed so there is an _id to filter the stream on
+            await collection.update_one({"id": "main"}, {"$setOnInsert": {"version": 0}}, upsert=True)
+            main = await collection.find_one({"id": "main"}, {"_id": 1})
+            async with collection.watch([{"$match": {"documentKey._id": main["_id"]}}]) as stream:
+                self.mode = "change_stream"
+                async for _ in stream:
+                    self.invalidate()
+        except PyMongoError as e:
+            logger.info("game_config change stream unavailable (%s); polling version", e)
+        self.mode = "poll"
+        seen = None
+        while True:
+            try:
+                doc = await collection.find_one({"id": "main"}, {"_id": 0, "version": 1})
+                version = (doc or {}).get("version", 0)
+                if seen is not None and version != seen:
+                    self.invalidate()
+                seen = version
+            except Exception:
+                logger.exception("game_config version poll failed")
+            await asyncio.sleep(self.poll_seconds)
+
+    def metrics(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "mode": self.mode,
+            "valid_until": self._valid_until.isoformat() if self._state is not None else None,
+        }
@@ -0,0 +1,87 @@
+"""
+families.living_member_count: members of the family whose user is alive.
+
+Kept in step wherever membership or life changes: a new family starts at 1 (seeded ones at
+their member count), joining is +1, and a living member leaving, being kicked or deleted, or
+dying (execute_attack, admin kill) is -1. adjust() is one atomic $inc returning the new count;
+the caller dissolves the family the moment it reaches 0, so GET /families only reads families
+with living_member_count > 0. recount() repairs drift with one aggregation over family_members
+joined to users: at startup for families without a counter, and in full from
+POST /api/admin/families/reconcile or `python family_counts.py` (against MONGO_URL/DB_NAME).
+"""
+import logging
+
+from pymongo import ReturnDocument, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+
+async def adjust(families, family_id: str, delta: int) -> int | None:
+    """Add delta to a family's counter; the new count, or None if the family doesn't exist."""
+    doc = await families.find_one_and_update(
+        {"id": family_id},
+        {"$inc": {"living_member_count": delta}},
+        projection={"_id": 0, "living_member_count": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    return None if doc is None else int(doc.get("living_member_count") or 0)
+
+
+def living_counts_pipeline(family_ids=None) -> list:
+    """family_members -> [{"_id": family_id, "living": n}] for families with at least one living member."""
+    match = [{"$match": {"family_id": {"$in": family_ids}}}] if family_ids is not None else []
+    return match + [
+        {"$lookup": {
+            "from": "users",
+            "localField": "user_id",
+            "foreignField": "id",
+            "pipeline": [{"$project": {"_id": 0, "is_dead": 1}}],
+            "as": "user",
+        }},
+        {"$match": {"user": {"$elemMatch": {"is_dead": {"$ne": True}}}}},
+        {"$group": {"_id": "$family_id", "living": {"$sum": 1}}},
+    ]
+
+
+async def recount(db, only_missing: bool = False) -> dict:
+    """
+    Set living_member_count from family_members/users on every family (only_missing: those
+    without one). Returns {"checked", "repaired", "zero": family ids now at 0}.
+    """
+    query = {"living_member_count": None} if only_missing else {}
+    families = await db.families.find(query, {"_id": 0, "id": 1, "living_member_count": 1}).to_list(None)
+    if not families:
+        return {"checked": 0, "repaired": 0, "zero": []}
+    ids = [f["id"] for f in families]
+    groups = await db.family_members.aggregate(living_counts_pipeline(ids)).to_list(None)
+    counts = {g["_id"]: int(g["living"]) for g in groups}
+    ops = [
+        # Matching the stored value leaves a counter that changed meanwhile for the next run
+        UpdateOne({"id": f["id"], "living_member_count": f.get("living_member_count")}, {"$set": {"living_member_count": counts.get(f["id"], 0)}})
+        for f in families
+        if f.get("living_member_count") != counts.get(f["id"], 0)
+    ]
+    if ops:
+        await db.families.bulk_write(ops, ordered=False)
+        logger.info("Repaired living_member_count on %s families", len(ops))
+    return {"checked": len(families), "repaired": len(ops), "zero": [i for i in ids if counts.get(i, 0) == 0]}
+
+
+if __name__ == "__main__":
+    import asyncio
+    import os
+    from pathlib import Path
+
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).resolve().parent / ".env")
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    logging.basicConfig(level=logging.INFO)
+
+    async def main():
+        # Dissolving needs the war/notification helpers in server.py
+        from server import reconcile_families
+        result = await reconcile_families()
+        print(f"checked {result['checked']} families, repaired {result['repaired']}, dissolved {result['dissolved']}")
+
+    asyncio.run(main())
@@ -0,0 +1,166 @@
+"""
+Recent-kills feed, written when a kill is settled.
+
+execute_attack appends one compact event per kill (usernames, rank names, weapon, NPC flags,
+public flag, created_at) to the capped kill_feed collection (KILL_FEED_MAX_DOCS newest kept),
+so the feed is one indexed, bounded read instead of scanning attack_attempts and looking up
+users. Each worker keeps a ring buffer of the newest KILL_FEED_BUFFER events in front of it:
+its own kills go straight in, and other workers' kills are fetched at most once per
+KILL_FEED_REFRESH_SECONDS. The fetch starts from the newest created_at read from kill_feed
+(not from this worker's own appends, which can be newer than another worker's unread kill),
+minus KILL_FEED_OVERLAP_SECONDS for inserts that land after their created_at; rows already
+buffered are skipped by id and the buffer is kept ordered by created_at. On first start the
+feed is seeded once from attack_attempts.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import timedelta
+
+from pymongo.errors import CollectionInvalid
+
+from timestamps import to_datetime, utcnow
+
+logger = logging.getLogger(__name__)
+
+KILL_FEED_MAX_DOCS = int(os.environ.get("KILL_FEED_MAX_DOCS", "1000"))
+KILL_FEED_BYTES = 1024 * 1024
+KILL_FEED_BUFFER = 200
+KILL_FEED_REFRESH_SECONDS = float(os.environ.get("KILL_FEED_REFRESH_SECONDS", "2"))
+KILL_FEED_OVERLAP_SECONDS = 5.0
+EVENT_FIELDS = {
+    "_id": 0, "id": 1, "killer_username": 1, "killer_rank_name": 1, "victim_username": 1, "victim_rank_name": 1,
+    "weapon_name": 1, "is_public": 1, "killer_is_npc": 1, "victim_is_npc": 1, "created_at": 1,
+}
+
+
+async def ensure_collection(db) -> None:
+    """Create kill_feed as a capped collection (no-op if it exists)."""
+    if "kill_feed" in await db.list_collection_names(filter={"name": "kill_feed"}):
+        return
+    try:
+        await db.create_collection("kill_feed", capped=True, size=KILL_FEED_BYTES, max=KILL_FEED_MAX_DOCS)
+    except CollectionInvalid:  # another worker created it
+        pass
+
+
+def make_event(killer: dict, victim: dict, killer_rank_name, victim_rank_name, weapon_name, is_public: bool, created_at=None) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "killer_username": killer.get("username"),
+        "killer_rank_name": killer_rank_name,
+        "victim_username": victim.get("username"),
+        "victim_rank_name": victim_rank_name,
+        "weapon_name": weapon_name,
+        "is_public": bool(is_public),
+        "killer_is_npc": bool(killer.get("is_npc")),
+        "victim_is_npc": bool(victim.get("is_npc")),
+        "created_at": created_at or utcnow(),
+    }
+
+
+def public_view(event: dict) -> dict:
+    """Feed entry as the API shows it: the killer's name only when the kill was made public."""
+    return {
+        "id": event["id"],
+        "victim_username": event.get("victim_username"),
+        "victim_rank_name": event.get("victim_rank_name"),
+        "killer_username": event.get("killer_username") if event.get("is_public") else None,
+        "is_public": bool(event.get("is_public")),
+        "weapon_name": event.get("weapon_name"),
+        "created_at": event.get("created_at"),
+    }
+
+
+class KillFeed:
+    def __init__(self, size: int = KILL_FEED_BUFFER, refresh_seconds: float = KILL_FEED_REFRESH_SECONDS):
+        self.size = size
+        self._events: list = []  # newest first (created_at)
+        self._ids: set = set()
+        self._read_until = None  # newest created_at read from kill_feed
+        self.refresh_seconds = refresh_seconds
+        self._refreshed_at = 0.0
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.refreshes = 0
+
+    def _push(self, events: list) -> None:
+        new = [e for e in events if e["id"] not in self._ids]
+        if not new:
+            return
+        merged = sorted(self._events + new, key=lambda e: to_datetime(e["created_at"]), reverse=True)
+        self._events = merged[:self.size]
+        self._ids = {e["id"] for e in self._events}
+
+    async def append(self, db, event: dict) -> None:
+        """Record a settled kill; best-effort like the other kill side effects."""
+        try:
+            await db.kill_feed.insert_one(dict(event))
+        except Exception:
+            logger.exception("kill_feed insert failed")
+        self._push([event])
+
+    async def _refresh(self, db) -> None:
+        since = self._read_until - timedelta(seconds=KILL_FEED_OVERLAP_SECONDS) if self._read_until else None
+        query = {"created_at": {"$gt": since}} if since else {}
+        rows = await db.kill_feed.find(query, EVENT_FIELDS).sort("created_at", -1).to_list(self.size)
+        if rows:
+            newest = to_datetime(rows[0]["created_at"])
+            self._read_until = max(self._read_until, newest) if self._read_until else newest
+        self._push(rows)
+        self._refreshed_at = time.monotonic()
+        self.refreshes += 1
+
+    async def recent(self, db, limit: int = 15, users_only: bool = False) -> list:
+        """Newest kills (public view), optionally without kills involving NPCs."""
+        if time.monotonic() - self._refreshed_at >= self.refresh_seconds:
+            async with self._lock:
+                if time.monotonic() - self._refreshed_at >= self.refresh_seconds:
+                    await self._refresh(db)
+        else:
+            self.hits += 1
+        out = []
+        for e in self._events:
+            if users_only and (e.get("killer_is_npc") or e.get("victim_is_npc")):
+                continue
+            out.append(public_view(e))
+            if len(out) >= limit:
+                break
+        return out
+
+    def metrics(self) -> dict:
+        return {"buffered": len(self._events), "hits": self.hits, "refreshes": self.refreshes}
+
+
+async def seed_from_attempts(db, ranks, limit: int = KILL_FEED_BUFFER) -> int:
+    """One-shot: fill an empty feed from the latest killed attack_attempts (batched user lookup)."""
+    if await db.kill_feed.find_one({}, {"_id": 1}):
+        return 0
+    attempts = await db.attack_attempts.find(
+        {"outcome": "killed"},
+        {"_id": 0, "attacker_id": 1, "target_id": 1, "attacker_username": 1, "target_username": 1,
+         "attacker_rank_id": 1, "target_rank_id": 1, "make_public": 1, "created_at": 1},
+    ).sort("created_at", -1).to_list(limit)
+    if not attempts:
+        return 0
+    ids = list({i for a in attempts for i in (a.get("attacker_id"), a.get("target_id")) if i})
+    users = {u["id"]: u for u in await db.users.find({"id": {"$in": ids}}, {"_id": 0, "id": 1, "is_npc": 1}).to_list(len(ids))}
+    rank_names = {int(r["id"]): r["name"] for r in ranks}
+    events = []
+    for a in reversed(attempts):  # oldest first so natural order matches created_at
+        if not a.get("target_username"):
+            continue
+        killer = {**users.get(a.get("attacker_id"), {}), "username": a.get("attacker_username")}
+        victim = {**users.get(a.get("target_id"), {}), "username": a.get("target_username")}
+        events.append(make_event(
+            killer, victim,
+            rank_names.get(int(a.get("attacker_rank_id") or 1)),
+            rank_names.get(int(a.get("target_rank_id") or 1)),
+            None, a.get("make_public"), a.get("created_at"),
+        ))
+    if events:
+        await db.kill_feed.insert_many(events)
+        logger.info("Seeded kill_feed with %s kills from attack_attempts", len(events))
+    return len(events)
@@ -0,0 +1,101 @@
+"""
+Kill inflation: the extra share of bullets an attacker needs, raised by each kill and decaying
+while they don't kill.
+
+Users store kill_inflation (the value) and kill_inflation_updated_at (the date that value
+applies at). The effective value is computed in O(1) on read: DECAY_PER_HOUR (the mean of the
+old 2-6% hourly draw) is taken off for every whole hour since the anchor, floored at 0, so
+reads never write. Once per KILL_INFLATION_NORMALIZE_SECONDS one worker (claimed through
+game_config {"id": "kill_inflation_decay"}) folds the elapsed hours into the stored values of
+all users with one update_many pipeline, using the same formula.
+"""
+import asyncio
+import logging
+import os
+from datetime import timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+from timestamps import to_datetime, utcnow
+
+logger = logging.getLogger(__name__)
+
+DECAY_PER_HOUR = 0.04
+KILL_INFLATION_NORMALIZE_SECONDS = float(os.environ.get("KILL_INFLATION_NORMALIZE_SECONDS", "3600"))
+CLAIM_ID = "kill_inflation_decay"
+HOUR_MS = 3600 * 1000
+
+_stats = {"runs": 0, "last_run": None, "last_modified": 0}
+
+
+def decayed(value, updated_at, now) -> float:
+    """Inflation at now for a value stored at updated_at."""
+    value = float(value or 0.0)
+    anchor = to_datetime(updated_at)
+    if value <= 0 or anchor is None:
+        return max(0.0, value)
+    hours = int((now - anchor).total_seconds() // 3600)
+    if hours <= 0:
+        return value
+    return max(0.0, value - hours * DECAY_PER_HOUR)
+
+
+def effective(user: dict, now=None) -> float:
+    """Current inflation for a user document with kill_inflation / kill_inflation_updated_at."""
+    return decayed(user.get("kill_inflation"), user.get("kill_inflation_updated_at"), now or utcnow())
+
+
+def normalize_pipeline(now) -> list:
+    hours = {"$floor": {"$divide": [{"$subtract": [now, "$kill_inflation_updated_at"]}, HOUR_MS]}}
+    return [
+        {"$set": {"_decay_hours": hours}},
+        {"$set": {
+            "kill_inflation": {"$max": [0.0, {"$subtract": ["$kill_inflation", {"$multiply": ["$_decay_hours", DECAY_PER_HOUR]}]}]},
+            "kill_inflation_updated_at": {"$add": ["$kill_inflation_updated_at", {"$multiply": ["$_decay_hours", HOUR_MS]}]},
+        }},
+        {"$unset": "_decay_hours"},
+    ]
+
+
+async def normalize(users, now=None) -> int:
+    """Fold whole elapsed hours into every positive stored inflation. Returns users modified."""
+    now = now or utcnow()
+    # No anchor yet: start decaying from now (the old read path did this with a write)
+    await users.update_many({"kill_inflation": {"$gt": 0}, "kill_inflation_updated_at": None}, {"$set": {"kill_inflation_updated_at": now}})
+    result = await users.update_many(
+        {"kill_inflation": {"$gt": 0}, "kill_inflation_updated_at": {"$lte": now - timedelta(hours=1)}},
+        normalize_pipeline(now),
+    )
+    return result.modified_count
+
+
+async def _claim(config, now, interval_seconds: float) -> bool:
+    # Claim the run if the last one is at least ~interval old (90%: sleeps drift a little)
+    try:
+        await config.update_one(
+            {"id": CLAIM_ID, "last_run": {"$lte": now - timedelta(seconds=interval_seconds * 0.9)}},
+            {"$set": {"last_run": now}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:  # another worker ran it this interval
+        return False
+
+
+async def run(db, interval_seconds: float = KILL_INFLATION_NORMALIZE_SECONDS) -> None:
+    """Background loop: normalize all users' inflation once per interval across workers."""
+    while True:
+        try:
+            now = utcnow()
+            if await _claim(db.game_config, now, interval_seconds):
+                modified = await normalize(db.users, now)
+                _stats.update(runs=_stats["runs"] + 1, last_run=now.isoformat(), last_modified=modified)
+                if modified:
+                    logger.info("Normalized kill inflation for %s users", modified)
+        except Exception:
+            logger.exception("Kill inflation normalize failed")
+        await asyncio.sleep(interval_seconds)
+
+
+def metrics() -> dict:
+    return dict(_stats)
@@ -0,0 +1,370 @@
+"""
+In-memory leaderboards for the honours stats (rank points, kills, crimes, GTAs, jail busts).
+
+Each (pool, stat) pair, where pool is "alive" (not dead, not a bodyguard) or "dead", is a
+RankIndex: the users' scores in descending order as sorted buckets of at most 2 * LOAD keys,
+with a Fenwick tree over the bucket sizes. "How many users score more than v" (the profile
+honours rank) and "top N" (/leaderboards/top) are O(log n) instead of a count_documents or a
+sort over the whole users collection.
+
+rebuild() loads everything from MongoDB at startup. Writes through db.users report the ids
+they touch (CachedUsersCollection.write_listeners); writes that can't change a tracked field
+are ignored, the rest mark the user dirty and run() re-reads dirty users with one $in query
+every LEADERBOARD_FLUSH_SECONDS. Each worker shares its dirty ids through the leaderboard_dirty
+collection ({user_id, worker, at}, TTL-expired): exchange() inserts the ids written here since
+the last flush and reads the ones other workers wrote since the newest "at" it has seen (minus
+LEADERBOARD_DIRTY_OVERLAP_SECONDS for inserts that land late), so a kill, crime or GTA on any
+worker reaches every worker's indexes within a flush or two. A write not filtered by id (user_id
+None), or more shared ids than LEADERBOARD_DIRTY_MAX_READ, schedules a full rebuild; a periodic
+rebuild every LEADERBOARD_REBUILD_SECONDS is only a backstop for writes that bypass db.users.
+metrics() reports how stale the indexes are.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from bisect import bisect_left, insort
+from datetime import timedelta
+
+from timestamps import to_datetime, utcnow
+
+logger = logging.getLogger(__name__)
+
+TRACKED_STATS = ("rank_points", "total_kills", "total_crimes", "total_gta", "jail_busts")
+POOLS = ("alive", "dead")
+LEADERBOARD_FLUSH_SECONDS = float(os.environ.get("LEADERBOARD_FLUSH_SECONDS", "2"))
+LEADERBOARD_REBUILD_SECONDS = float(os.environ.get("LEADERBOARD_REBUILD_SECONDS", "3600"))
+LEADERBOARD_DIRTY_OVERLAP_SECONDS = 5.0
+LEADERBOARD_DIRTY_MAX_READ = 5000
+# Fields that decide a user's scores or pool (username only for top N display)
+RELEVANT_FIELDS = frozenset(TRACKED_STATS) | {"is_dead", "is_bodyguard", "username"}
+PROJECTION = {"_id": 0, "id": 1, **{f: 1 for f in RELEVANT_FIELDS}}
+
+
+class RankIndex:
+    """Scores by user id, ordered best first; rank and top N in O(log n)."""
+
+    LOAD = 512
+
+    def __init__(self, scores: dict | None = None):
+        self._scores = dict(scores or {})
+        keys = sorted((-s, uid) for uid, s in self._scores.items())
+        self._buckets = [keys[i:i + self.LOAD] for i in range(0, len(keys), self.LOAD)]
+        self._reindex()
+
+    def _reindex(self) -> None:
+        self._maxes = [b[-1] for b in self._buckets]
+        tree = [0] * (len(self._buckets) + 1)
+        for i, b in enumerate(self._buckets, 1):
+            tree[i] += len(b)
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _add(self, i: int, delta: int) -> None:
+        i += 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, i: int) -> int:
+        """Keys in buckets [0, i)."""
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def score(self, user_id: str):
+        return self._scores.get(user_id)
+
+    def discard(self, user_id: str) -> None:
+        score = self._scores.pop(user_id, None)
+        if score is None:
+            return
+        key = (-score, user_id)
+        i = bisect_left(self._maxes, key)
+        bucket = self._buckets[i]
+        del bucket[bisect_left(bucket, key)]
+        if bucket:
+            self._maxes[i] = bucket[-1]
+            self._add(i, -1)
+        else:
+            del self._buckets[i]
+            self._reindex()
+
+    def set(self, user_id: str, score: int) -> None:
+        if self._scores.get(user_id) == score:
+            return
+        self.discard(user_id)
+        self._scores[user_id] = score
+        key = (-score, user_id)
+        if not self._buckets:
+            self._buckets.append([key])
+            self._reindex()
+            return
+        i = min(bisect_left(self._maxes, key), len(self._buckets) - 1)
+        bucket = self._buckets[i]
+        insort(bucket, key)
+        self._maxes[i] = bucket[-1]
+        if len(bucket) > 2 * self.LOAD:
+            self._buckets[i:i + 1] = [bucket[:self.LOAD], bucket[self.LOAD:]]
+            self._reindex()
+        else:
+            self._add(i, 1)
+
+    def count_above(self, score: int) -> int:
+        """Users with a strictly higher score."""
+        key = (-score,)  # sorts before every (-score, user_id)
+        i = bisect_left(self._maxes, key)
+        if i == len(self._buckets):
+            return len(self._scores)
+        return self._prefix(i) + bisect_left(self._buckets[i], key)
+
+    def top(self, n: int) -> list:
+        """[(user_id, score)] for the n best, best first."""
+        out = []
+        for bucket in self._buckets:
+            for neg_score, uid in bucket:
+                if len(out) >= n:
+                    return out
+                out.append((uid, -neg_score))
+        return out
+
+
+def pool_of(user: dict) -> str | None:
+    if user.get("is_dead"):
+        return "dead"
+    if user.get("is_bodyguard"):
+        return None
+    return "alive"
+
+
+def touched_fields(update) -> set | None:
+    """Top-level fields an update (operators or pipeline) may change; None when that can't be told."""
+    fields = set()
+    if isinstance(update, dict):
+        if not update or not all(k.startswith("$") for k in update):
+            return None  # replacement / inserted document
+        for op_fields in update.values():
+            if not isinstance(op_fields, dict):
+                return None
+            fields.update(k.split(".", 1)[0] for k in op_fields)
+        return fields
+    if isinstance(update, list):
+        for stage in update:
+            for op, spec in stage.items():
+                if op in ("$set", "$addFields") and isinstance(spec, dict):
+                    fields.update(k.split(".", 1)[0] for k in spec)
+                elif op == "$unset":
+                    fields.update(k.split(".", 1)[0] for k in ([spec] if isinstance(spec, str) else spec))
+                else:
+                    return None
+        return fields
+    return None
+
+
+class Leaderboards:
+    def __init__(self, stats=TRACKED_STATS):
+        self.stats = tuple(stats)
+        self._indexes = {(pool, stat): RankIndex() for pool in POOLS for stat in self.stats}
+        self._usernames: dict = {}
+        self._pools: dict = {}
+        self._dirty: dict = {}  # user_id -> monotonic time first marked
+        self._rebuild_requested = None
+        self.worker = uuid.uuid4().hex
+        self._outbox: set = set()  # ids written on this worker, not yet shared
+        self._outbox_rebuild = False
+        self._read_until = None  # newest leaderboard_dirty "at" read from other workers
+        self._seen: dict = {}  # (worker, user_id, at) -> at, rows read within the overlap window
+        self.built_at = None
+        self.last_build_ms = None
+        self.last_flush = None
+        self.rebuilds = 0
+        self.flushes = 0
+        self.users_flushed = 0
+        self.received = 0
+
+    def rank(self, stat: str, score: int, pool: str = "alive") -> int:
+        """1 + users in pool with a higher score (ties share a rank)."""
+        return self._indexes[(pool, stat)].count_above(int(score or 0)) + 1
+
+    def top(self, stat: str, n: int, pool: str = "alive") -> list:
+        """[{"id", "username", "value"}] best first."""
+        return [
+            {"id": uid, "username": self._usernames.get(uid), "value": score}
+            for uid, score in self._indexes[(pool, stat)].top(n)
+        ]
+
+    def apply(self, user: dict) -> None:
+        """Place one user (PROJECTION fields) in its pool with its current scores."""
+        uid = user["id"]
+        pool = pool_of(user)
+        old_pool = self._pools.get(uid)
+        if old_pool and old_pool != pool:
+            for stat in self.stats:
+                self._indexes[(old_pool, stat)].discard(uid)
+        if pool is None:
+            self._pools.pop(uid, None)
+            self._usernames.pop(uid, None)
+            return
+        self._pools[uid] = pool
+        self._usernames[uid] = user.get("username")
+        for stat in self.stats:
+            self._indexes[(pool, stat)].set(uid, int(user.get(stat) or 0))
+
+    def drop(self, user_id: str) -> None:
+        pool = self._pools.pop(user_id, None)
+        self._usernames.pop(user_id, None)
+        if pool:
+            for stat in self.stats:
+                self._indexes[(pool, stat)].discard(user_id)
+
+    def note_write(self, ids, update) -> None:
+        """CachedUsersCollection write listener: ids written (None: any user) and the update (None: delete)."""
+        if update is not None:
+            fields = touched_fields(update)
+            if fields is not None and not fields & RELEVANT_FIELDS:
+                return
+        now = time.monotonic()
+        if ids is None:
+            if self._rebuild_requested is None:
+                self._rebuild_requested = now
+            self._outbox_rebuild = True
+            return
+        for uid in ids:
+            self._dirty.setdefault(uid, now)
+        self._outbox.update(ids)
+
+    async def exchange(self, feed) -> int:
+        """Share ids written here through leaderboard_dirty and mark other workers' as dirty. Returns ids received."""
+        ids, rebuild = self._outbox, self._outbox_rebuild
+        self._outbox, self._outbox_rebuild = set(), False
+        if ids or rebuild:
+            at = utcnow()
+            docs = [{"user_id": uid, "worker": self.worker, "at": at} for uid in ids]
+            if rebuild:
+                docs.append({"user_id": None, "worker": self.worker, "at": at})
+            try:
+                await feed.insert_many(docs, ordered=False)
+            except Exception:
+                self._outbox |= ids
+                self._outbox_rebuild = self._outbox_rebuild or rebuild
+                raise
+        if self._read_until is None:
+            self._read_until = utcnow()  # nothing to catch up on before the first rebuild
+            return 0
+        since = self._read_until - timedelta(seconds=LEADERBOARD_DIRTY_OVERLAP_SECONDS)
+        rows = await feed.find(
+            {"at": {"$gt": since}, "worker": {"$ne": self.worker}},
+            {"_id": 0, "user_id": 1, "worker": 1, "at": 1},
+        ).to_list(LEADERBOARD_DIRTY_MAX_READ)
+        now = time.monotonic()
+        if len(rows) >= LEADERBOARD_DIRTY_MAX_READ and self._rebuild_requested is None:
+            self._rebuild_requested = now
+        received = 0
+        for row in rows:
+            at = to_datetime(row["at"])
+            key = (row.get("worker"), row.get("user_id"), at)
+            if key in self._seen:
+                continue
+            self._seen[key] = at
+            received += 1
+            self._read_until = max(self._read_until, at)
+            if row.get("user_id") is None:
+                if self._rebuild_requested is None:
+                    self._rebuild_requested = now
+            else:
+                self._dirty.setdefault(row["user_id"], now)
+        self._seen = {k: at for k, at in self._seen.items() if at > since}
+        self.received += received
+        return received
+
+    async def rebuild(self, users) -> int:
+        """Reload every user from MongoDB and swap in fresh indexes. Returns users indexed."""
+        started = time.perf_counter()
+        requested, self._rebuild_requested = self._rebuild_requested, None
+        read_from = utcnow()  # shared ids from before this are covered by the full read
+        scores = {(pool, stat): {} for pool in POOLS for stat in self.stats}
+        usernames, pools = {}, {}
+        try:
+            async for user in users.find({}, PROJECTION):
+                pool = pool_of(user)
+                if pool is None or not user.get("id"):
+                    continue
+                uid = user["id"]
+                pools[uid] = pool
+                usernames[uid] = user.get("username")
+                for stat in self.stats:
+                    scores[(pool, stat)][uid] = int(user.get(stat) or 0)
+        except Exception:
+            self._rebuild_requested = requested or time.monotonic()
+            raise
+        self._indexes = {key: RankIndex(s) for key, s in scores.items()}
+        self._usernames, self._pools = usernames, pools
+        if self._read_until is None or self._read_until < read_from:
+            self._read_until = read_from
+        self.built_at = time.time()
+        self.last_build_ms = round((time.perf_counter() - started) * 1000)
+        self.rebuilds += 1
+        return len(pools)
+
+    async def flush(self, users) -> int:
+        """Re-read users written since the last flush. Returns users refreshed."""
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, {}
+        ids = list(dirty)
+        try:
+            rows = await users.find({"id": {"$in": ids}}, PROJECTION).to_list(len(ids))
+        except Exception:
+            self._dirty = {**dirty, **self._dirty}
+            raise
+        found = set()
+        for user in rows:
+            found.add(user["id"])
+            self.apply(user)
+        for uid in ids:
+            if uid not in found:
+                self.drop(uid)
+        self.last_flush = time.time()
+        self.flushes += 1
+        self.users_flushed += len(ids)
+        return len(ids)
+
+    async def run(self, db, flush_seconds: float = LEADERBOARD_FLUSH_SECONDS, rebuild_seconds: float = LEADERBOARD_REBUILD_SECONDS) -> None:
+        """Background loop: exchange dirty ids, flush dirty users; full rebuild when requested or every rebuild_seconds."""
+        while True:
+            await asyncio.sleep(flush_seconds)
+            try:
+                await self.exchange(db.leaderboard_dirty)
+            except Exception:
+                logger.exception("Leaderboard dirty-id exchange failed")
+            try:
+                if self._rebuild_requested is not None or self.built_at is None or time.time() - self.built_at >= rebuild_seconds:
+                    await self.rebuild(db.users)
+                await self.flush(db.users)
+            except Exception:
+                logger.exception("Leaderboard refresh failed")
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        return {
+            "users": len(self._pools),
+            "built_age_seconds": round(time.time() - self.built_at, 1) if self.built_at else None,
+            "last_build_ms": self.last_build_ms,
+            "rebuilds": self.rebuilds,
+            "rebuild_pending_seconds": round(now - self._rebuild_requested, 1) if self._rebuild_requested is not None else None,
+            "dirty": len(self._dirty),
+            "oldest_dirty_seconds": round(now - min(self._dirty.values()), 1) if self._dirty else 0.0,
+            "last_flush_age_seconds": round(time.time() - self.last_flush, 1) if self.last_flush else None,
+            "flushes": self.flushes,
+            "users_flushed": self.users_flushed,
+            "shared_ids_received": self.received,
+            "unshared": len(self._outbox),
+        }
@@ -0,0 +1,175 @@
+"""
+Coalesced presence tracking.
+
+Authenticated polls (/auth/me) call presence.touch(user_id) instead of writing users.last_seen.
+Only the latest heartbeat per user is kept; a background task flushes pending heartbeats every
+PRESENCE_FLUSH_SECONDS with unordered bulk_write batches of PRESENCE_FLUSH_BATCH. Reads
+(/users/online, profile "online") consult the in-memory view first and fall back to the DB
+value written by any worker.
+
+OnlineIndex is the in-memory online list itself: fed by the auth path and admin force-online,
+answered in O(k), and reconciled with the DB periodically for multi-worker deployments.
+"""
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_FLUSH_SECONDS = float(os.environ.get("PRESENCE_FLUSH_SECONDS", "15"))
+PRESENCE_FLUSH_BATCH = int(os.environ.get("PRESENCE_FLUSH_BATCH", "500"))
+ONLINE_RECONCILE_SECONDS = float(os.environ.get("ONLINE_RECONCILE_SECONDS", "60"))
+ONLINE_WINDOW = timedelta(minutes=5)
+
+
+class PresenceBuffer:
+    def __init__(self, flush_seconds: float = PRESENCE_FLUSH_SECONDS, batch_size: int = PRESENCE_FLUSH_BATCH):
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self._pending: dict = {}  # user_id -> datetime, not yet written
+        self._seen: dict = {}  # user_id -> datetime, latest heartbeat this worker saw
+        self.heartbeats = 0
+        self.writes = 0
+        self.flushes = 0
+
+    def touch(self, user_id: str, when: datetime | None = None) -> None:
+        when = when or datetime.now(timezone.utc)
+        self._pending[user_id] = when
+        self._seen[user_id] = when
+        self.heartbeats += 1
+
+    def last_seen(self, user_id: str) -> datetime | None:
+        return self._seen.get(user_id)
+
+    def recent_user_ids(self, window: timedelta = ONLINE_WINDOW) -> list:
+        cutoff = datetime.now(timezone.utc) - window
+        return [uid for uid, ts in self._seen.items() if ts >= cutoff]
+
+    async def flush(self, users_collection) -> int:
+        """Write pending heartbeats (unordered bulk_write per batch). Returns documents written."""
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        items = list(pending.items())
+        written = 0
+        for i in range(0, len(items), self.batch_size):
+            batch = items[i:i + self.batch_size]
+            ops = [UpdateOne({"id": uid}, {"$set": {"last_seen": ts}}) for uid, ts in batch]
+            try:
+                await users_collection.bulk_write(ops, ordered=False)
+                written += len(batch)
+            except Exception:
+                logger.exception("Presence flush failed for %s heartbeats", len(batch))
+                for uid, ts in batch:  # retry next round unless a newer heartbeat arrived
+                    self._pending.setdefault(uid, ts)
+        self.writes += written
+        self.flushes += 1
+        # Forget users idle past the online window; the DB value covers them now
+        cutoff = datetime.now(timezone.utc) - ONLINE_WINDOW
+        self._seen = {uid: ts for uid, ts in self._seen.items() if ts >= cutoff or uid in self._pending}
+        return written
+
+    async def run(self, users_collection) -> None:
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush(users_collection)
+            except Exception:
+                logger.exception("Presence flush loop error")
+
+    def metrics(self) -> dict:
+        return {
+            "heartbeats": self.heartbeats,
+            "writes": self.writes,
+            "writes_avoided": self.heartbeats - self.writes - len(self._pending),
+            "pending": len(self._pending),
+            "tracked": len(self._seen),
+            "flushes": self.flushes,
+            "flush_seconds": self.flush_seconds,
+            "batch_size": self.batch_size,
+        }
+
+
+class OnlineIndex:
+    """
+    Online players held in memory, ordered by last heartbeat (oldest first).
+
+    touch() moves a user to the end, so expired users sit at the front and are evicted lazily
+    on read. Admin "force online" windows live in a separate map. reconcile() merges in what
+    other workers flushed to the DB (last_seen / forced_online_until).
+    """
+
+    def __init__(self, window: timedelta = ONLINE_WINDOW):
+        self.window = window
+        self._by_heartbeat: OrderedDict = OrderedDict()  # user_id -> (heartbeat, row)
+        self._forced: dict = {}  # user_id -> (until, row)
+        self.reconciles = 0
+
+    def get_row(self, user_id: str) -> dict | None:
+        entry = self._by_heartbeat.get(user_id) or self._forced.get(user_id)
+        return entry[1] if entry else None
+
+    def touch(self, user_id: str, row: dict, when: datetime | None = None) -> None:
+        self._by_heartbeat[user_id] = (when or datetime.now(timezone.utc), row)
+        self._by_heartbeat.move_to_end(user_id)
+
+    def force(self, user_id: str, row: dict, until: datetime) -> None:
+        current = self._forced.get(user_id)
+        if not current or current[0] < until:
+            self._forced[user_id] = (until, row)
+
+    def remove(self, user_id: str) -> None:
+        self._by_heartbeat.pop(user_id, None)
+        self._forced.pop(user_id, None)
+
+    def _evict(self, now: datetime) -> None:
+        cutoff = now - self.window
+        while self._by_heartbeat:
+            uid, (ts, _) = next(iter(self._by_heartbeat.items()))
+            if ts >= cutoff:
+                break
+            self._by_heartbeat.popitem(last=False)
+        for uid in [uid for uid, (until, _) in self._forced.items() if until <= now]:
+            del self._forced[uid]
+
+    def online_rows(self, limit: int = 100) -> list:
+        """Rows for online users, most recent heartbeat first, then forced-online users."""
+        self._evict(datetime.now(timezone.utc))
+        out = []
+        for uid in reversed(self._by_heartbeat):
+            if len(out) >= limit:
+                return out
+            out.append(self._by_heartbeat[uid][1])
+        for uid, (_, row) in self._forced.items():
+            if len(out) >= limit:
+                break
+            if uid not in self._by_heartbeat:
+                out.append(row)
+        return out
+
+    def is_online(self, user_id: str) -> bool:
+        now = datetime.now(timezone.utc)
+        hb = self._by_heartbeat.get(user_id)
+        if hb and hb[0] >= now - self.window:
+            return True
+        forced = self._forced.get(user_id)
+        return bool(forced and forced[0] > now)
+
+    def reconcile(self, db_rows: list) -> None:
+        """Merge DB state: db_rows are (user_id, last_seen or None, forced_until or None, row)."""
+        merged = dict(self._by_heartbeat)
+        for uid, last_seen, forced_until, row in db_rows:
+            if last_seen and (uid not in merged or merged[uid][0] < last_seen):
+                merged[uid] = (last_seen, row)
+            if forced_until:
+                self.force(uid, row, forced_until)
+        self._by_heartbeat = OrderedDict(sorted(merged.items(), key=lambda kv: kv[1][0]))
+        self._evict(datetime.now(timezone.utc))
+        self.reconciles += 1
+
+    def metrics(self) -> dict:
+        return {"heartbeat_users": len(self._by_heartbeat), "forced_users": len(self._forced), "reconciles": self.reconciles}
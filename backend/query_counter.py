@@ -0,0 +1,66 @@
+"""
+Per-request MongoDB command counter.
+
+QueryCounter is registered as a pymongo CommandListener on the Motor client. Motor copies the
+caller's contextvars into its executor threads, so a budget opened with query_budget() in a
+handler sees exactly the commands that handler (and anything it awaits) sends, including
+getMore batches. Finished budgets are summarised per name for /api/admin/metrics; a run over
+its limit is logged, and raises AssertionError when QUERY_BUDGET_STRICT=1 (dev/CI).
+"""
+import logging
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUDGET_STRICT = os.environ.get("QUERY_BUDGET_STRICT", "").lower() in ("1", "true", "yes")
+
+_active: ContextVar[Optional[list]] = ContextVar("query_budget_commands", default=None)
+_stats: dict = {}  # name -> {"runs", "max", "last", "limit", "over_budget"}
+
+
+class QueryCounter(monitoring.CommandListener):
+    def started(self, event):
+        commands = _active.get()
+        if commands is not None:
+            commands.append(event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+@contextmanager
+def query_budget(name: str, limit: int):
+    """Count MongoDB commands sent inside the block; yields the live list of command names."""
+    commands: list = []
+    token = _active.set(commands)
+    try:
+        yield commands
+    finally:
+        _active.reset(token)
+        _record(name, limit, commands)
+
+
+def _record(name: str, limit: int, commands: list) -> None:
+    n = len(commands)
+    s = _stats.setdefault(name, {"runs": 0, "max": 0, "last": 0, "limit": limit, "over_budget": 0})
+    s["runs"] += 1
+    s["last"] = n
+    s["max"] = max(s["max"], n)
+    s["limit"] = limit
+    if n > limit:
+        s["over_budget"] += 1
+        logger.warning("%s sent %d MongoDB commands (budget %d): %s", name, n, limit, commands)
+        if QUERY_BUDGET_STRICT:
+            raise AssertionError(f"{name} sent {n} MongoDB commands, budget is {limit}")
+
+
+def metrics() -> dict:
+    return {name: dict(s) for name, s in _stats.items()}
@@ -0,0 +1,84 @@
+"""
+users.rank_id: the RANKS id for a user's rank_points, stored so rank counts are one $group on
+an indexed field instead of get_rank_info() over every user document.
+
+Every write that changes rank_points goes through with_rank_id(), which turns a plain
+{"$inc", "$set"} update into an update pipeline that applies it and then recomputes rank_id
+from the new rank_points in the same atomic write. Documents inserted with a literal
+rank_points set rank_id next to it. backfill() fixes any user whose rank_id is missing or
+stale: at startup for users without one, and `python rank_ids.py` (full check) against
+MONGO_URL/DB_NAME.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def rank_id_expr(ranks, rank_points="$rank_points") -> dict:
+    """Aggregation expression for get_rank_info(rank_points)[0]."""
+    points = {"$ifNull": [rank_points, 0]}
+    return {"$switch": {
+        "branches": [
+            {"case": {"$gte": [points, r["required_points"]]}, "then": r["id"]}
+            for r in sorted(ranks, key=lambda r: r["required_points"], reverse=True)
+        ],
+        "default": ranks[0]["id"],
+    }}
+
+
+def with_rank_id(update: dict, ranks) -> list:
+    """Pipeline equivalent of a {"$inc", "$set"} users update that also refreshes rank_id."""
+    unsupported = set(update) - {"$inc", "$set"}
+    if unsupported:
+        raise ValueError(f"with_rank_id only converts $inc/$set, got {sorted(unsupported)}")
+    fields = {k: {"$literal": v} for k, v in (update.get("$set") or {}).items()}
+    for k, v in (update.get("$inc") or {}).items():
+        fields[k] = {"$add": [{"$ifNull": [f"${k}", 0]}, v]}
+    return [{"$set": fields}, {"$set": {"rank_id": rank_id_expr(ranks)}}]
+
+
+async def backfill(users, ranks, only_missing: bool = False) -> int:
+    """
+    Set rank_id on users where it is missing (only_missing: the indexed startup pass) or doesn't
+    match rank_points (full scan). Returns users modified.
+    """
+    expr = rank_id_expr(ranks)
+    query = {"rank_id": None} if only_missing else {"$expr": {"$ne": ["$rank_id", expr]}}
+    result = await users.update_many(query, [{"$set": {"rank_id": expr}}])
+    if result.modified_count:
+        logger.info("Backfilled rank_id on %s users", result.modified_count)
+    return result.modified_count
+
+
+def histogram_pipeline() -> list:
+    """Users per rank_id, split alive/dead; sorted and projected so it can be covered by the (rank_id, is_dead) index."""
+    return [
+        {"$sort": {"rank_id": 1}},
+        {"$project": {"_id": 0, "rank_id": 1, "is_dead": 1}},
+        {"$group": {
+            "_id": "$rank_id",
+            "total": {"$sum": 1},
+            "dead": {"$sum": {"$cond": [{"$eq": ["$is_dead", True]}, 1, 0]}},
+        }},
+    ]
+
+
+if __name__ == "__main__":
+    import asyncio
+    import os
+    from pathlib import Path
+
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).resolve().parent / ".env")
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    logging.basicConfig(level=logging.INFO)
+
+    async def main():
+        from server import RANKS
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+        modified = await backfill(client[os.environ["DB_NAME"]].users, RANKS)
+        print(f"rank_id updated on {modified} users")
+
+    asyncio.run(main())
@@ -5,50 +5,43 @@ import random
 import os
 import sys
 import logging
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Request
 
 logger = logging.getLogger(__name__)
 
 
-def _parse_iso_datetime(val):
-    """Parse datetime from DB (string with optional Z, or datetime object). Avoids 500 on Python < 3.11."""
-    if val is None:
-        return None
-    if hasattr(val, "year"):
-        return val
-    s = str(val).strip().replace("Z", "+00:00")
-    return datetime.fromisoformat(s)
-
-
 _backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if _backend not in sys.path:
     sys.path.insert(0, _backend)
 from server import (
     db,
-    get_current_user,
+    get_current_user_profile,
     get_rank_info,
     get_effective_event,
+    with_rank_id,
     CrimeResponse,
     CommitCrimeResponse,
 )
+from timestamps import to_datetime
+import catalog
+import conditional
 
 
-async def get_crimes(current_user: dict = Depends(get_current_user)):
-    crimes = await db.crimes.find({}, {"_id": 0}).to_list(100)
+async def get_crimes(request: Request, current_user: dict = Depends(get_current_user_profile("core"))):
+    crimes = catalog.current().crime_list
     user_rank, _ = get_rank_info(current_user.get("rank_points", 0))
+    user_crimes = await db.user_crimes.find({"user_id": current_user["id"]}, {"_id": 0}).to_list(None)
+    user_crime_by_id = {uc.get("crime_id"): uc for uc in user_crimes}
     result = []
     for crime in crimes:
-        user_crime = await db.user_crimes.find_one(
-            {"user_id": current_user["id"], "crime_id": crime["id"]},
-            {"_id": 0},
-        )
+        user_crime = user_crime_by_id.get(crime["id"])
         can_commit = crime["min_rank"] <= user_rank
         next_available = None
         if user_crime and "cooldown_until" in user_crime:
-            cooldown_time = _parse_iso_datetime(user_crime["cooldown_until"])
+            cooldown_time = to_datetime(user_crime["cooldown_until"])
             if cooldown_time and cooldown_time > datetime.now(timezone.utc):
                 can_commit = False
-                next_available = user_crime["cooldown_until"]
+                next_available = cooldown_time.isoformat()
         result.append(
             CrimeResponse(
                 id=crime["id"],
@@ -63,10 +56,10 @@ async def get_crimes(current_user: dict = Depends(get_current_user)):
                 next_available=next_available,
             )
         )
-    return result
+    return conditional.respond_body(request, result)
 
 
-async def commit_crime(crime_id: str, current_user: dict = Depends(get_current_user)):
+async def commit_crime(crime_id: str, current_user: dict = Depends(get_current_user_profile("core"))):
     try:
         return await _commit_crime_impl(crime_id, current_user)
     except HTTPException:
@@ -77,7 +70,7 @@ async def commit_crime(crime_id: str, current_user: dict = Depends(get_current_u
 
 
 async def _commit_crime_impl(crime_id: str, current_user: dict):
-    crime = await db.crimes.find_one({"id": crime_id}, {"_id": 0})
+    crime = catalog.current().crimes.get(crime_id)
     if not crime:
         raise HTTPException(status_code=404, detail="Crime not found")
     if current_user.get("in_jail"):
@@ -91,11 +84,11 @@ async def _commit_crime_impl(crime_id: str, current_user: dict):
     )
     now = datetime.now(timezone.utc)
     if user_crime and "cooldown_until" in user_crime:
-        cooldown_time = _parse_iso_datetime(user_crime["cooldown_until"])
+        cooldown_time = to_datetime(user_crime["cooldown_until"])
         if cooldown_time and cooldown_time > now:
             raise HTTPException(
                 status_code=400,
-                detail=f"Crime on cooldown until {user_crime['cooldown_until']}",
+                detail=f"Crime on cooldown until {cooldown_time.isoformat()}",
             )
     success_rate = (
         0.7
@@ -123,14 +116,14 @@ async def _commit_crime_impl(crime_id: str, current_user: dict):
         rank_points = int(rank_points * ev.get("rank_points", 1.0))
         await db.users.update_one(
             {"id": current_user["id"]},
-            {
+            with_rank_id({
                 "$inc": {
                     "money": reward,
                     "rank_points": rank_points,
                     "total_crimes": 1,
                     "crime_profit": reward,
                 }
-            },
+            }),
         )
         message = f"Success! You earned ${reward:,} and {rank_points} rank points"
     else:
@@ -142,17 +135,17 @@ async def _commit_crime_impl(crime_id: str, current_user: dict):
         cooldown_seconds = int(float(cooldown_min) * 60) if cooldown_min else 300
     else:
         cooldown_seconds = int(float(cooldown_seconds))
-    cooldown_until = (now + timedelta(seconds=cooldown_seconds)).isoformat()
+    cooldown_until = now + timedelta(seconds=cooldown_seconds)
     await db.user_crimes.update_one(
         {"user_id": current_user["id"], "crime_id": crime_id},
-        {"$set": {"last_committed": now.isoformat(), "cooldown_until": cooldown_until}},
+        {"$set": {"last_committed": now, "cooldown_until": cooldown_until}},
         upsert=True,
     )
     return CommitCrimeResponse(
         success=success,
         message=message,
         reward=reward,
-        next_available=cooldown_until,
+        next_available=cooldown_until.isoformat(),
     )
 
 
@@ -7,11 +7,11 @@ from bson.objectid import ObjectId
 
 from server import (
     db,
-    get_current_user,
+    get_current_user_profile,
     get_rank_info,
     get_effective_event,
+    with_rank_id,
     RANKS,
-    CARS,
     TRAVEL_TIMES,
     GTA_OPTIONS,
     DEFAULT_GARAGE_BATCH_LIMIT,
@@ -19,9 +19,11 @@ from server import (
     GTAAttemptResponse,
     GTAMeltRequest,
 )
+from timestamps import to_datetime
+import catalog
 
 
-async def get_gta_options(current_user: dict = Depends(get_current_user)):
+async def get_gta_options(current_user: dict = Depends(get_current_user_profile("economy"))):
     now = datetime.now(timezone.utc)
     user_rank, _ = get_rank_info(current_user.get("rank_points", 0))
     cooldown_doc = await db.gta_cooldowns.find_one(
@@ -30,9 +32,9 @@ async def get_gta_options(current_user: dict = Depends(get_current_user)):
     )
     global_cooldown_until = None
     if cooldown_doc:
-        until = datetime.fromisoformat(cooldown_doc["cooldown_until"])
-        if until > now:
-            global_cooldown_until = cooldown_doc["cooldown_until"]
+        until = to_datetime(cooldown_doc.get("cooldown_until"))
+        if until and until > now:
+            global_cooldown_until = until.isoformat()
     result = []
     for opt in GTA_OPTIONS:
         row = dict(opt)
@@ -47,11 +49,11 @@ async def get_gta_options(current_user: dict = Depends(get_current_user)):
 
 
 async def attempt_gta(
-    request: GTAAttemptRequest, current_user: dict = Depends(get_current_user)
+    request: GTAAttemptRequest, current_user: dict = Depends(get_current_user_profile("economy"))
 ):
     if current_user.get("in_jail"):
-        jail_time = datetime.fromisoformat(current_user["jail_until"])
-        if jail_time > datetime.now(timezone.utc):
+        jail_time = to_datetime(current_user.get("jail_until"))
+        if jail_time and jail_time > datetime.now(timezone.utc):
             raise HTTPException(status_code=400, detail="You are in jail!")
         await db.users.update_one(
             {"id": current_user["id"]},
@@ -76,8 +78,8 @@ async def attempt_gta(
         {"_id": 0, "cooldown_until": 1},
     )
     if cooldown_doc:
-        until = datetime.fromisoformat(cooldown_doc["cooldown_until"])
-        if until > now:
+        until = to_datetime(cooldown_doc.get("cooldown_until"))
+        if until and until > now:
             secs = int((until - now).total_seconds())
             raise HTTPException(
                 status_code=400, detail=f"GTA cooldown: try again in {secs}s"
@@ -88,18 +90,10 @@ async def attempt_gta(
     cooldown_until = now + timedelta(seconds=option["cooldown"])
     await db.gta_cooldowns.delete_many({"user_id": current_user["id"]})
     await db.gta_cooldowns.insert_one(
-        {"user_id": current_user["id"], "cooldown_until": cooldown_until.isoformat()}
+        {"user_id": current_user["id"], "cooldown_until": cooldown_until}
     )
     if success:
-        available_cars = [
-            c
-            for c in CARS
-            if c["min_difficulty"] <= option["difficulty"]
-            and c["rarity"] != "exclusive"
-        ]
-        if not available_cars:
-            available_cars = [c for c in CARS if c["min_difficulty"] == 1]
-        car = random.choice(available_cars)
+        car = random.choice(catalog.current().gta_cars(option["difficulty"]))
         rank_points_map = {
             "common": 5,
             "uncommon": 10,
@@ -120,12 +114,12 @@ async def attempt_gta(
         )
         await db.users.update_one(
             {"id": current_user["id"]},
-            {"$inc": {"money": car["value"], "rank_points": rank_points, "total_gta": 1}},
+            with_rank_id({"$inc": {"money": car["value"], "rank_points": rank_points, "total_gta": 1}}),
         )
         return GTAAttemptResponse(
             success=True,
             message=f"Success! You stole a {car['name']}!",
-            car=car,
+            car=dict(car),
             jailed=False,
             jail_until=None,
             rank_points_earned=rank_points,
@@ -133,7 +127,7 @@ async def attempt_gta(
     jail_until = datetime.now(timezone.utc) + timedelta(seconds=option["jail_time"])
     await db.users.update_one(
         {"id": current_user["id"]},
-        {"$set": {"in_jail": True, "jail_until": jail_until.isoformat()}},
+        {"$set": {"in_jail": True, "jail_until": jail_until}},
     )
     return GTAAttemptResponse(
         success=False,
@@ -145,14 +139,14 @@ async def attempt_gta(
     )
 
 
-async def get_garage(current_user: dict = Depends(get_current_user)):
+async def get_garage(current_user: dict = Depends(get_current_user_profile("economy"))):
     cars = await db.user_cars.find({"user_id": current_user["id"]}).to_list(1000)
     car_details = []
     for user_car in cars:
         car_id = user_car.get("car_id")
         if not car_id:
             continue
-        car_info = next((c for c in CARS if c["id"] == car_id), None)
+        car_info = catalog.current().cars.get(car_id)
         if car_info:
             user_car_id = user_car.get("id") or str(user_car.get("_id", ""))
             car_details.append(
@@ -168,7 +162,7 @@ async def get_garage(current_user: dict = Depends(get_current_user)):
 
 
 async def melt_cars(
-    request: GTAMeltRequest, current_user: dict = Depends(get_current_user)
+    request: GTAMeltRequest, current_user: dict = Depends(get_current_user_profile("economy"))
 ):
     if not request.car_ids:
         raise HTTPException(status_code=400, detail="No cars selected")
@@ -198,7 +192,7 @@ async def melt_cars(
             )
         if user_car:
             model_id = user_car["car_id"]
-            car_info = next((c for c in CARS if c["id"] == model_id), None)
+            car_info = catalog.current().cars.get(model_id)
             if car_info:
                 if request.action == "bullets":
                     total_bullets += int(car_info["value"] / 10)
@@ -243,9 +237,9 @@ async def melt_cars(
     return {"success": False, "message": "No cars were processed"}
 
 
-async def get_car(car_id: str, current_user: dict = Depends(get_current_user)):
+async def get_car(car_id: str, current_user: dict = Depends(get_current_user_profile("economy"))):
     """Return full car details by id (for profile page)."""
-    car = next((c for c in CARS if c.get("id") == car_id), None)
+    car = catalog.current().cars.get(car_id)
     if not car:
         raise HTTPException(status_code=404, detail="Car not found")
     out = dict(car)
@@ -11,8 +11,9 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from server import (
     db,
-    get_current_user,
+    get_current_user_profile,
     get_rank_info,
+    with_rank_id,
     BustOutRequest,
     JailSetBustRewardRequest,
     ADMIN_EMAILS,
@@ -20,6 +21,7 @@ from server import (
     RANKS,
     STATES,
 )
+from timestamps import to_datetime
 
 logger = logging.getLogger(__name__)
 
@@ -43,7 +45,7 @@ def _npc_bust_success_rate(npc_rank_name: str | None) -> float:
     return NPC_BUST_SUCCESS_BY_RANK_NAME.get(npc_rank_name or "", 0.5)
 
 
-async def get_jailed_players(current_user: dict = Depends(get_current_user)):
+async def get_jailed_players(current_user: dict = Depends(get_current_user_profile("core"))):
     now = datetime.now(timezone.utc)
     real_players_raw = await db.users.find(
         {"in_jail": True},
@@ -51,18 +53,14 @@ async def get_jailed_players(current_user: dict = Depends(get_current_user)):
     ).to_list(50)
     real_players = []
     for p in real_players_raw:
-        jail_until_iso = p.get("jail_until")
-        if not jail_until_iso:
+        if not p.get("jail_until"):
             await db.users.update_one(
                 {"id": p["id"]},
                 {"$set": {"in_jail": False, "jail_until": None}},
             )
             continue
-        try:
-            jail_until = datetime.fromisoformat(jail_until_iso)
-            if jail_until.tzinfo is None:
-                jail_until = jail_until.replace(tzinfo=timezone.utc)
-        except Exception:
+        jail_until = to_datetime(p["jail_until"])
+        if jail_until is None:
             continue
         if jail_until <= now:
             await db.users.update_one(
@@ -104,7 +102,7 @@ async def get_jailed_players(current_user: dict = Depends(get_current_user)):
 
 
 async def bust_out_of_jail(
-    request: BustOutRequest, current_user: dict = Depends(get_current_user)
+    request: BustOutRequest, current_user: dict = Depends(get_current_user_profile("core"))
 ):
     npc = await db.jail_npcs.find_one(
         {"username": request.target_username}, {"_id": 0}
@@ -122,7 +120,7 @@ async def bust_out_of_jail(
                 updates["$inc"]["money"] = bust_reward_cash
             await db.users.update_one(
                 {"id": current_user["id"]},
-                updates,
+                with_rank_id(updates),
             )
             await db.jail_npcs.delete_one({"username": request.target_username})
             return {
@@ -134,7 +132,7 @@ async def bust_out_of_jail(
         jail_until = datetime.now(timezone.utc) + timedelta(seconds=30)
         await db.users.update_one(
             {"id": current_user["id"]},
-            {"$set": {"in_jail": True, "jail_until": jail_until.isoformat(), "current_consecutive_busts": 0}},
+            {"$set": {"in_jail": True, "jail_until": jail_until, "current_consecutive_busts": 0}},
         )
         return {
             "success": False,
@@ -170,7 +168,7 @@ async def bust_out_of_jail(
         record = max((current_user.get("consecutive_busts_record") or 0), new_consec)
         await db.users.update_one(
             {"id": current_user["id"]},
-            {"$inc": {"rank_points": rank_points, "jail_busts": 1}, "$set": {"current_consecutive_busts": new_consec, "consecutive_busts_record": record}},
+            with_rank_id({"$inc": {"rank_points": rank_points, "jail_busts": 1}, "$set": {"current_consecutive_busts": new_consec, "consecutive_busts_record": record}}),
         )
         return {
             "success": True,
@@ -181,7 +179,7 @@ async def bust_out_of_jail(
     jail_until = datetime.now(timezone.utc) + timedelta(seconds=30)
     await db.users.update_one(
         {"id": current_user["id"]},
-        {"$set": {"in_jail": True, "jail_until": jail_until.isoformat(), "current_consecutive_busts": 0}},
+        {"$set": {"in_jail": True, "jail_until": jail_until, "current_consecutive_busts": 0}},
     )
     return {
         "success": False,
@@ -190,7 +188,7 @@ async def bust_out_of_jail(
     }
 
 
-async def get_jail_status(current_user: dict = Depends(get_current_user)):
+async def get_jail_status(current_user: dict = Depends(get_current_user_profile("core"))):
     jail_busts = int((current_user.get("jail_busts") or 0) or 0)
     bust_reward_cash = int((current_user.get("bust_reward_cash") or 0) or 0)
     current_consecutive_busts = int((current_user.get("current_consecutive_busts") or 0) or 0)
@@ -203,8 +201,10 @@ async def get_jail_status(current_user: dict = Depends(get_current_user)):
     }
     if not current_user.get("in_jail"):
         return {"in_jail": False, **base}
-    jail_until = datetime.fromisoformat(current_user["jail_until"])
+    jail_until = to_datetime(current_user.get("jail_until"))
     now = datetime.now(timezone.utc)
+    if jail_until is None:
+        return {"in_jail": False, **base}
     if jail_until <= now:
         await db.users.update_one(
             {"id": current_user["id"]},
@@ -214,13 +214,13 @@ async def get_jail_status(current_user: dict = Depends(get_current_user)):
     seconds_remaining = int((jail_until - now).total_seconds())
     return {
         "in_jail": True,
-        "jail_until": current_user["jail_until"],
+        "jail_until": jail_until.isoformat(),
         "seconds_remaining": seconds_remaining,
         **base,
     }
 
 
-async def set_bust_reward(request: JailSetBustRewardRequest, current_user: dict = Depends(get_current_user)):
+async def set_bust_reward(request: JailSetBustRewardRequest, current_user: dict = Depends(get_current_user_profile("core"))):
     """Set the $ reward offered to whoever busts you out. 0 to clear."""
     amount = max(0, int(request.amount))
     await db.users.update_one(
@@ -230,7 +230,7 @@ async def set_bust_reward(request: JailSetBustRewardRequest, current_user: dict
     return {"message": f"Bust reward set to ${amount:,}" if amount else "Bust reward cleared.", "bust_reward_cash": amount}
 
 
-async def leave_jail(current_user: dict = Depends(get_current_user)):
+async def leave_jail(current_user: dict = Depends(get_current_user_profile("core"))):
     """Pay 3 points to leave jail immediately."""
     if not current_user.get("in_jail"):
         raise HTTPException(status_code=400, detail="You are not in jail")
@@ -251,7 +251,7 @@ async def leave_jail(current_user: dict = Depends(get_current_user)):
     }
 
 
-async def get_admin_npcs(current_user: dict = Depends(get_current_user)):
+async def get_admin_npcs(current_user: dict = Depends(get_current_user_profile("core"))):
     if current_user["email"] not in ADMIN_EMAILS:
         raise HTTPException(status_code=403, detail="Admin access required")
     npcs = await db.test_npcs.find({}, {"_id": 0}).to_list(100)
@@ -263,7 +263,7 @@ async def get_admin_npcs(current_user: dict = Depends(get_current_user)):
     }
 
 
-async def toggle_npcs(request: NPCToggleRequest, current_user: dict = Depends(get_current_user)):
+async def toggle_npcs(request: NPCToggleRequest, current_user: dict = Depends(get_current_user_profile("core"))):
     if current_user["email"] not in ADMIN_EMAILS:
         raise HTTPException(status_code=403, detail="Admin access required")
     await db.game_settings.update_one(
@@ -302,7 +302,7 @@ async def toggle_npcs(request: NPCToggleRequest, current_user: dict = Depends(ge
     return {"message": "NPCs setting updated"}
 
 
-async def list_npcs_for_attack(current_user: dict = Depends(get_current_user)):
+async def list_npcs_for_attack(current_user: dict = Depends(get_current_user_profile("core"))):
     """Get NPCs that can be attacked (same state, not in jail)."""
     settings = await db.game_settings.find_one({"key": "npcs_enabled"}, {"_id": 0})
     if not settings or not settings.get("value"):
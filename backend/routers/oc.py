@@ -11,19 +11,11 @@ from pydantic import BaseModel
 logger = logging.getLogger(__name__)
 
 
-def _parse_iso_datetime(val):
-    if val is None:
-        return None
-    if hasattr(val, "year"):
-        return val
-    s = str(val).strip().replace("Z", "+00:00")
-    return datetime.fromisoformat(s)
-
-
 _backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if _backend not in sys.path:
     sys.path.insert(0, _backend)
-from server import db, get_current_user, get_effective_event, send_notification
+from server import db, get_current_user, get_effective_event, send_notification, with_rank_id
+from timestamps import to_datetime
 
 # Roles (team of 4)
 OC_ROLES = [
@@ -82,12 +74,10 @@ async def get_oc_status(current_user: dict = Depends(get_current_user)):
     """Return cooldown, timer upgrade, and pending heist/invites (creator)."""
     has_timer_upgrade = bool(current_user.get("oc_timer_reduced", False))
     cooldown_hours = OC_COOLDOWN_HOURS_REDUCED if has_timer_upgrade else OC_COOLDOWN_HOURS
-    cooldown_until = current_user.get("oc_cooldown_until")
+    cooldown_until = to_datetime(current_user.get("oc_cooldown_until"))
     now = datetime.now(timezone.utc)
-    if cooldown_until:
-        until = _parse_iso_datetime(cooldown_until)
-        if until and until <= now:
-            cooldown_until = None
+    if cooldown_until and cooldown_until <= now:
+        cooldown_until = None
     out = {
         "cooldown_until": cooldown_until,
         "cooldown_hours": cooldown_hours,
@@ -118,15 +108,10 @@ async def get_oc_status(current_user: dict = Depends(get_current_user)):
             {"_id": 0, "id": 1, "role": 1, "target_username": 1, "status": 1, "expires_at": 1}
         ).to_list(10)
         for inv in invites:
-            exp = inv.get("expires_at")
-            if exp:
-                try:
-                    exp_dt = _parse_iso_datetime(exp)
-                    if exp_dt and exp_dt <= now and inv.get("status") == "pending":
-                        await db.oc_invites.update_one({"id": inv["id"]}, {"$set": {"status": "expired"}})
-                        inv["status"] = "expired"
-                except Exception:
-                    pass
+            exp_dt = to_datetime(inv.get("expires_at"))
+            if exp_dt and exp_dt <= now and inv.get("status") == "pending":
+                await db.oc_invites.update_one({"id": inv["id"]}, {"$set": {"status": "expired"}})
+                inv["status"] = "expired"
             out["pending_invites"].append({
                 "invite_id": inv["id"],
                 "role": inv.get("role"),
@@ -184,7 +169,7 @@ async def send_invites_oc(
         raise HTTPException(status_code=400, detail="No invite slots: add at least one username to invite")
     # Resolve usernames to user_ids and validate
     now = datetime.now(timezone.utc)
-    expires_at = (now + timedelta(minutes=OC_INVITE_EXPIRY_MINUTES)).isoformat()
+    expires_at = now + timedelta(minutes=OC_INVITE_EXPIRY_MINUTES)
     # If creator already has a pending heist, remove it (replace with new one)
     await db.oc_pending_heists.delete_many({"creator_id": uid})
     await db.oc_invites.delete_many({"creator_id": uid})
@@ -231,7 +216,7 @@ async def send_invites_oc(
             "target_id": target_id,
             "target_username": target.get("username") or username,
             "status": "pending",
-            "created_at": now.isoformat(),
+            "created_at": now,
             "expires_at": expires_at,
         })
         role_name = role.replace("_", " ").capitalize()
@@ -264,7 +249,7 @@ async def oc_invite_accept(invite_id: str, current_user: dict = Depends(get_curr
     if inv.get("status") != "pending":
         raise HTTPException(status_code=400, detail=f"Invite already {inv.get('status')}")
     now = datetime.now(timezone.utc)
-    exp = _parse_iso_datetime(inv.get("expires_at"))
+    exp = to_datetime(inv.get("expires_at"))
     if exp and exp <= now:
         await db.oc_invites.update_one({"id": invite_id}, {"$set": {"status": "expired"}})
         raise HTTPException(status_code=400, detail="Invite expired")
@@ -339,7 +324,7 @@ async def oc_pending_set_slot(
     if target.get("is_dead"):
         raise HTTPException(status_code=400, detail="Cannot invite dead players")
     now = datetime.now(timezone.utc)
-    expires_at = (now + timedelta(minutes=OC_INVITE_EXPIRY_MINUTES)).isoformat()
+    expires_at = now + timedelta(minutes=OC_INVITE_EXPIRY_MINUTES)
     invite_id = str(uuid.uuid4())
     job = next((j for j in OC_JOBS if j["id"] == pending["job_id"]), None)
     job_name = job["name"] if job else "Heist"
@@ -352,7 +337,7 @@ async def oc_pending_set_slot(
         "target_id": target["id"],
         "target_username": target.get("username") or val,
         "status": "pending",
-        "created_at": now.isoformat(),
+        "created_at": now,
         "expires_at": expires_at,
     })
     await db.oc_pending_heists.update_one(
@@ -443,12 +428,10 @@ async def execute_oc(
     now = datetime.now(timezone.utc)
     has_timer_upgrade = bool(current_user.get("oc_timer_reduced", False))
     cooldown_hours = OC_COOLDOWN_HOURS_REDUCED if has_timer_upgrade else OC_COOLDOWN_HOURS
-    cooldown_until = current_user.get("oc_cooldown_until")
-    if cooldown_until:
-        until = _parse_iso_datetime(cooldown_until)
-        if until and until > now:
-            secs = int((until - now).total_seconds())
-            raise HTTPException(status_code=400, detail=f"OC cooldown: try again in {secs}s")
+    until = to_datetime(current_user.get("oc_cooldown_until"))
+    if until and until > now:
+        secs = int((until - now).total_seconds())
+        raise HTTPException(status_code=400, detail=f"OC cooldown: try again in {secs}s")
 
     ev = await get_effective_event()
     rank_mult = float(ev.get("rank_points", 1.0))
@@ -459,7 +442,7 @@ async def execute_oc(
     new_cooldown_until = now + timedelta(hours=cooldown_hours)
     await db.users.update_one(
         {"id": uid},
-        {"$set": {"oc_cooldown_until": new_cooldown_until.isoformat()}},
+        {"$set": {"oc_cooldown_until": new_cooldown_until}},
     )
 
     if not success:
@@ -491,13 +474,13 @@ async def execute_oc(
             rp_each += rp_add
         await db.users.update_one(
             {"id": user_id},
-            {
+            with_rank_id({
                 "$inc": {
                     "money": cash_add,
                     "rank_points": rp_add,
                     "total_oc_heists": 1,
                 }
-            },
+            }),
         )
 
     return {
@@ -103,7 +103,7 @@ async def flag_user_suspicious(db, user_id: str, username: str, flag_type: str,
             "flag_type": flag_type,  # rate_limit, impossible_stat, rapid_transfer, exploit_attempt, etc.
             "reason": reason,
             "details": details or {},
-            "created_at": datetime.now(timezone.utc).isoformat(),
+            "created_at": datetime.now(timezone.utc),
             "resolved": False,
         })
         
@@ -470,7 +470,7 @@ async def clear_old_security_flags(db, days: int = 30) -> int:
     """Clear security flags older than specified days."""
     cutoff = datetime.now(timezone.utc) - timedelta(days=days)
     result = await db.security_flags.delete_many({
-        "created_at": {"$lt": cutoff.isoformat()}
+        "created_at": {"$lt": cutoff}
     })
     return result.deleted_count
 
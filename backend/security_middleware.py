@@ -3,9 +3,8 @@ from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import JSONResponse
 from fastapi import Request
 import logging
-import hashlib
-import os
-from jose import jwt, JWTError
+from jose import JWTError
+from auth_tokens import bearer_token, decode_token
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +25,16 @@ class SecurityMiddleware(BaseHTTPMiddleware):
         self.check_duplicate_request = check_duplicate_request
     
     async def dispatch(self, request: Request, call_next):
+        # Decode the bearer token once; get_current_user reuses request.state.jwt_claims
+        claims = None
+        token = bearer_token(request.headers.get("Authorization"))
+        if token:
+            try:
+                claims = decode_token(token)
+            except (JWTError, Exception):
+                pass  # If token invalid, just skip security checks (auth dependency rejects it)
+        request.state.jwt_claims = claims
+
         # Skip security checks for certain paths
         path = request.url.path
         
@@ -43,20 +52,9 @@ class SecurityMiddleware(BaseHTTPMiddleware):
         if any(path.startswith(p) for p in skip_paths):
             return await call_next(request)
         
-        # Try to extract user from JWT token
         current_user = None
-        try:
-            auth_header = request.headers.get("Authorization")
-            if auth_header and auth_header.startswith("Bearer "):
-                token = auth_header.split(" ")[1]
-                SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-here")
-                payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-                user_id = payload.get("sub")
-                username = payload.get("username", "Unknown")
-                if user_id:
-                    current_user = {"id": user_id, "username": username}
-        except (JWTError, Exception):
-            pass  # If token invalid, just skip security checks
+        if claims and claims.get("sub"):
+            current_user = {"id": claims["sub"], "username": claims.get("username", "Unknown")}
         
         if not current_user:
             # No user = unauthenticated request, skip checks
@@ -45,14 +45,16 @@ def make_user_doc(user_id: str, username: str, email: str, password_hash: str) -
         "id": user_id,
         "email": email,
         "username": username,
+        "username_lower": username.lower(),
         "password_hash": password_hash,
         "rank": 1,
         "money": 1000.0,
         "points": 0,
         "rank_points": 0,
+        "rank_id": 1,
         "bodyguard_slots": 0,
         "bullets": 0,
-        "avatar_url": None,
+        "avatar_hash": None,
         "jail_busts": 0,
         "garage_batch_limit": DEFAULT_GARAGE_BATCH_LIMIT,
         "total_crimes": 0,
@@ -80,8 +82,8 @@ def make_user_doc(user_id: str, username: str, email: str, password_hash: str) -
         "dead_at": None,
         "points_at_death": None,
         "retrieval_used": False,
-        "last_seen": now,
-        "created_at": now,
+        "last_seen": datetime.now(timezone.utc),
+        "created_at": datetime.now(timezone.utc),
     }
 
 
@@ -102,7 +104,7 @@ def run():
     for fam_cfg in FAMILIES_CONFIG:
         name, tag = fam_cfg["name"], fam_cfg["tag"]
         family_id = str(uuid.uuid4())
-        now = datetime.now(timezone.utc).isoformat()
+        now = datetime.now(timezone.utc)
 
         user_ids = []
         for i, role in enumerate(fam_cfg["members"]):
@@ -125,6 +127,7 @@ def run():
             "treasury": 0,
             "created_at": now,
             "rackets": {r["id"]: {"level": 0, "last_collected_at": None} for r in FAMILY_RACKETS},
+            "living_member_count": len(user_ids),
         })
         created_families.append({"id": family_id, "name": name, "tag": tag})
 
@@ -0,0 +1,106 @@
+"""
+Idempotent seeding of static game data (crimes, weapons, properties).
+
+Each seeded collection is hashed (sha256 of its canonical JSON) and the hashes are stored in
+game_config {"id": "seed"}. On boot, collections whose hash is unchanged are skipped; changed
+ones are upserted by id so readers never see an empty collection. Collections marked prune are
+owned by the seed: rows are overwritten ($set) and rows dropped from the seed are removed. The
+others only gain missing rows ($setOnInsert), so prices and stats edited in the database are
+kept, as when the seed used to run only on an empty collection. A lease in
+game_config {"id": "seed_lock"} (unique id index) lets one worker seed while the others wait
+for the stored hash to match, or for the lease to lapse if that worker died.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import timedelta
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from timestamps import utcnow
+
+logger = logging.getLogger(__name__)
+
+SEED_LOCK_SECONDS = float(os.environ.get("SEED_LOCK_SECONDS", "60"))
+SEED_WAIT_POLL_SECONDS = 0.5
+
+
+def seed_hash(rows: list) -> str:
+    canonical = json.dumps(sorted(rows, key=lambda r: r["id"]), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+async def _stored_hashes(config) -> dict:
+    doc = await config.find_one({"id": "seed"}, {"_id": 0, "hashes": 1})
+    return (doc or {}).get("hashes") or {}
+
+
+async def _acquire_lock(config, owner: str, lease_seconds: float) -> bool:
+    now = utcnow()
+    try:
+        await config.update_one(
+            {"id": "seed_lock", "$or": [{"locked_until": {"$lte": now}}, {"owner": owner}]},
+            {"$set": {"owner": owner, "locked_until": now + timedelta(seconds=lease_seconds)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:  # lock doc exists and another worker's lease is live
+        return False
+
+
+async def _release_lock(config, owner: str) -> None:
+    await config.update_one({"id": "seed_lock", "owner": owner}, {"$set": {"locked_until": utcnow()}})
+
+
+async def _upsert_collection(coll, rows: list, prune: bool) -> dict:
+    op = "$set" if prune else "$setOnInsert"
+    ops = [UpdateOne({"id": r["id"]}, {op: r}, upsert=True) for r in rows]
+    result = await coll.bulk_write(ops, ordered=False)
+    removed = 0
+    if prune:
+        ids = [r["id"] for r in rows]
+        removed = (await coll.delete_many({"id": {"$exists": True, "$nin": ids}})).deleted_count
+    return {"upserted": result.upserted_count, "modified": result.modified_count, "removed": removed}
+
+
+async def apply_seed(db, seeds: dict, lease_seconds: float = SEED_LOCK_SECONDS) -> dict:
+    """
+    seeds: {collection: (rows, prune)}. Upserts collections whose hash changed.
+    Returns {collection: write counts} for collections this worker wrote ({} if nothing changed).
+    """
+    config = db.game_config
+    wanted = {name: seed_hash(rows) for name, (rows, _) in seeds.items()}
+    if await _stored_hashes(config) == wanted:
+        return {}
+    owner = uuid.uuid4().hex
+    deadline = time.monotonic() + lease_seconds * 2
+    while not await _acquire_lock(config, owner, lease_seconds):
+        if await _stored_hashes(config) == wanted:
+            return {}  # another worker finished seeding
+        if time.monotonic() > deadline:
+            logger.warning("Seed lock still held after %.0fs; seeding anyway", lease_seconds * 2)
+            break
+        await asyncio.sleep(SEED_WAIT_POLL_SECONDS)
+    try:
+        stored = await _stored_hashes(config)
+        written = {}
+        for name, (rows, prune) in seeds.items():
+            if stored.get(name) == wanted[name]:
+                continue
+            written[name] = await _upsert_collection(db[name], rows, prune)
+            stored[name] = wanted[name]
+            await config.update_one(
+                {"id": "seed"},
+                {"$set": {f"hashes.{name}": wanted[name], "seeded_at": utcnow()}},
+                upsert=True,
+            )
+        if written:
+            logger.info("Seeded %s", written)
+        return written
+    finally:
+        await _release_lock(config, owner)
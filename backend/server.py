@@ -4,8 +4,9 @@ from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import Response
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
 from bson.objectid import ObjectId
+from pymongo import UpdateOne, DeleteOne, ReturnDocument
 import os
 import re
 import logging
@@ -23,27 +24,66 @@ import time
 from urllib.parse import unquote
 import httpx
 import certifi
+from concurrent.futures import ThreadPoolExecutor
 
 # Import security module (anti-cheat and monitoring)
 import security as security_module
+from db_indexes import ensure_indexes
+from user_loader import UserLoader, CachedDatabase, UserUpdateOne
+import avatar_store
+from presence import PresenceBuffer, OnlineIndex, ONLINE_RECONCILE_SECONDS
+from timestamps import utcnow, to_datetime, to_iso, migrate_timestamps
+from event_cache import EventStateCache
+from attack_scheduler import AttackScheduler, as_found, found_query
+import catalog
+import seeding
+import query_counter
+import combat_profile
+import bodyguard_resolver
+import bullet_table
+import kill_inflation
+import stats_snapshot
+import rank_ids
+import kill_feed
+import leaderboards
+import conditional
+import family_counts
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 # Also load project root .env if present (e.g. when running from root)
 load_dotenv(ROOT_DIR.parent / '.env')
+import auth_tokens  # reads JWT_SECRET_KEY, so after .env is loaded
 
 # MongoDB connection (certifi CA bundle only needed for Atlas SSL, skip for localhost)
 mongo_url = os.environ['MONGO_URL']
 if 'mongodb+srv' in mongo_url or 'mongodb.net' in mongo_url:
-    client = AsyncIOMotorClient(mongo_url, tlsCAFile=certifi.where())
+    client = AsyncIOMotorClient(mongo_url, tlsCAFile=certifi.where(), tz_aware=True, event_listeners=[query_counter.QueryCounter()])
 else:
-    client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+    client = AsyncIOMotorClient(mongo_url, tz_aware=True, event_listeners=[query_counter.QueryCounter()])
+# db.users reads by id go through user_loader (request memo; short-TTL LRU for the authenticated user); writes invalidate
+user_loader = UserLoader()
+mongo_db = client[os.environ['DB_NAME']]
+db = CachedDatabase(mongo_db, user_loader)
+avatar_bucket = AsyncIOMotorGridFSBucket(mongo_db, bucket_name=avatar_store.AVATAR_BUCKET)
+# Heartbeats from /auth/me, flushed to users.last_seen in the background
+presence = PresenceBuffer()
+# Users Online list served from memory; fed by the auth path, reconciled with the DB periodically
+online_index = OnlineIndex()
+# Event flags/effective event, cached until UTC midnight or a game_config change
+event_cache = EventStateCache()
+# searching -> found / expiry transitions for attacks; runs on the worker holding the lease
+attack_scheduler = AttackScheduler()
+# Recent kills: capped kill_feed collection with a per-worker ring buffer in front
+kill_events = kill_feed.KillFeed()
+# Honours ranks and top N per stat from memory; kept current by this worker's db.users writes
+leaderboard_index = leaderboards.Leaderboards()
+db.users.write_listeners.append(leaderboard_index.note_write)
 
 # Security
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
-ALGORITHM = "HS256"
+SECRET_KEY = auth_tokens.JWT_SECRET_KEY
+ALGORITHM = auth_tokens.JWT_ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7
 
 security = HTTPBearer()
@@ -161,6 +201,14 @@ MAX_BULLETS_TO_KILL = 100000
 ARMOUR_BASE_BULLETS = {0: 5000, 1: 25000, 2: 45000, 3: 65000, 4: 85000, 5: 100000}  # base before weapon/rank reduction
 KILL_CASH_PERCENT = 0.25  # killer gets 25% of victim's cash
 DEAD_ALIVE_POINTS_PERCENT = 0.25  # retrieved points from dead account (25%)
+# MongoDB commands /attack/execute may send (uncached worst case, bodyguard victim, including the kill_feed
+# insert); family war bookkeeping not included
+EXECUTE_ATTACK_MAX_QUERIES = 25
+# /attack/list: attacks + bodyguards of found targets + their users, independent of the number of attacks
+LIST_ATTACKS_MAX_QUERIES = 3
+# Bullets to kill for every armour/rank cell, one row per weapon damage (bullet_table.py)
+bullets_table = bullet_table.BulletTable(ARMOUR_BASE_BULLETS, MIN_BULLETS_TO_KILL)
+BULLET_CALC_BULK_MAX_TARGETS = 50
 
 # Game-wide daily events (rotate by UTC date). Multipliers default 1.0 when not set.
 # racket_cooldown: <1 = faster, >1 = longer; racket_payout: >1 = extra %, <1 = reduced %
@@ -201,29 +249,41 @@ def get_combined_event():
         combined[key] = prod
     return combined
 
+async def _load_event_state() -> dict:
+    """One game_config read: event flags plus today's effective event."""
+    doc = await db.game_config.find_one({"id": "main"}, {"_id": 0, "events_enabled": 1, "all_events_for_testing": 1})
+    doc = doc or {}  # no doc = enabled; admin toggle will create doc
+    enabled = bool(doc.get("events_enabled", True))
+    all_for_testing = bool(doc.get("all_events_for_testing", False))
+    if not enabled:
+        event = NO_EVENT.copy()
+    elif all_for_testing:
+        event = get_combined_event()
+    else:
+        event = get_active_game_event()
+    return {"events_enabled": enabled, "all_events_for_testing": all_for_testing, "event": event}
+
 async def get_events_enabled() -> bool:
     """Whether daily game events are enabled (admin can disable). Default True if not set."""
-    doc = await db.game_config.find_one({"id": "main"}, {"_id": 0, "events_enabled": 1})
-    if doc is None:
-        return True  # no doc = enabled; admin toggle will create doc
-    return bool(doc.get("events_enabled", True))
+    return (await event_cache.get(_load_event_state))["events_enabled"]
 
 async def get_all_events_for_testing() -> bool:
     """Whether all events are combined for testing (admin). Default False."""
-    doc = await db.game_config.find_one({"id": "main"}, {"_id": 0, "all_events_for_testing": 1})
-    return bool(doc.get("all_events_for_testing", False))
+    return (await event_cache.get(_load_event_state))["all_events_for_testing"]
 
 async def get_effective_event():
     """Current event multipliers if events enabled, else NO_EVENT. When all_events_for_testing, returns combined event. Never raises."""
     try:
-        if not await get_events_enabled():
-            return NO_EVENT.copy()
-        if await get_all_events_for_testing():
-            return get_combined_event()
-        return get_active_game_event()
+        return dict((await event_cache.get(_load_event_state))["event"])
     except Exception:
         return NO_EVENT.copy()
 
+async def bump_game_config(update: dict):
+    """Apply an update to game_config "main" and bump its version so every worker drops cached event state."""
+    update = {**update, "$inc": {**update.get("$inc", {}), "version": 1}}
+    await db.game_config.update_one({"id": "main"}, update, upsert=True)
+    event_cache.invalidate()
+
 # Armour shop (5 tiers): first 3 cash, top 2 points
 ARMOUR_SETS = [
     {
@@ -815,6 +875,9 @@ class ArmourBuyRequest(BaseModel):
 class BulletCalcRequest(BaseModel):
     target_username: str
 
+class BulletCalcBulkRequest(BaseModel):
+    target_usernames: List[str]
+
 class BustOutRequest(BaseModel):
     target_username: str
 
@@ -838,6 +901,61 @@ def get_password_hash(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+# bcrypt runs in its own small pool (capped concurrency) so a login burst never blocks the event loop
+BCRYPT_MAX_WORKERS = int(os.environ.get("BCRYPT_MAX_WORKERS", "2"))
+_bcrypt_executor = ThreadPoolExecutor(max_workers=BCRYPT_MAX_WORKERS, thread_name_prefix="bcrypt")
+bcrypt_stats = {"in_flight": 0, "max_queue_depth": 0, "completed": 0}
+
+async def _run_bcrypt(fn, *args):
+    bcrypt_stats["in_flight"] += 1
+    bcrypt_stats["max_queue_depth"] = max(bcrypt_stats["max_queue_depth"], bcrypt_stats["in_flight"] - BCRYPT_MAX_WORKERS)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_bcrypt_executor, fn, *args)
+    finally:
+        bcrypt_stats["in_flight"] -= 1
+        bcrypt_stats["completed"] += 1
+
+def bcrypt_metrics() -> dict:
+    return {**bcrypt_stats, "queue_depth": max(0, bcrypt_stats["in_flight"] - BCRYPT_MAX_WORKERS), "max_workers": BCRYPT_MAX_WORKERS}
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_bcrypt(get_password_hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Robot/NPC accounts store an empty hash and can never log in; skip bcrypt for them."""
+    if not hashed_password:
+        return False
+    return await _run_bcrypt(verify_password, plain_password, hashed_password)
+
+def username_key(username: str) -> str:
+    """Normalized username stored as users.username_lower (indexed) for case-insensitive lookups."""
+    return (username or "").strip().lower()
+
+def _find_user_by_username_case_insensitive(username_raw: str):
+    """Return a find_one filter for users by username (case-insensitive, served by the username_lower index)."""
+    key = username_key(username_raw)
+    if not key:
+        return None
+    return {"username_lower": key}
+
+async def backfill_username_lower():
+    """One-shot: set username_lower on users created before the field existed."""
+    result = await db.users.update_many(
+        {"username_lower": {"$exists": False}},
+        [{"$set": {"username_lower": {"$toLower": "$username"}}}],
+    )
+    if result.modified_count:
+        logging.info("Backfilled username_lower on %s users", result.modified_count)
+
+async def backfill_attack_expiry():
+    """One-shot: give legacy attacks (no expires_at) the 24h expiry the TTL index needs."""
+    result = await db.attacks.update_many(
+        {"expires_at": None, "search_started": {"$type": "date"}},
+        [{"$set": {"expires_at": {"$add": ["$search_started", 24 * 3600 * 1000]}}}],
+    )
+    if result.modified_count:
+        logging.info("Backfilled expires_at on %s attacks", result.modified_count)
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -845,17 +963,47 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+# Projection profiles for the authenticated user. Routes that only need a few fields use
+# Depends(get_current_user_profile("core")) instead of loading the whole document
+# (avatar data URL, booze/horseracing history, ...). get_current_user is the "full" profile.
+_USER_CORE_FIELDS = [
+    "id", "email", "username", "rank", "rank_points", "money", "points", "bullets",
+    "current_state", "traveling_to", "travel_arrives_at", "is_dead", "family_id",
+    "in_jail", "jail_until", "jail_busts", "bust_reward_cash",
+    "current_consecutive_busts", "consecutive_busts_record",
+]
+USER_PROFILES = {
+    "core": _USER_CORE_FIELDS,
+    "combat": _USER_CORE_FIELDS + [
+        "health", "armour_level", "armour_owned_level_max", "equipped_weapon_id",
+        "kill_inflation", "kill_inflation_updated_at", "has_silencer", "search_minutes_override",
+        "bodyguard_slots", "total_kills", "total_deaths", "combat_profile",
+    ],
+    "economy": _USER_CORE_FIELDS + [
+        "swiss_balance", "swiss_limit", "garage_batch_limit", "premium_rank_bar", "custom_car_name",
+        "total_crimes", "crime_profit", "total_gta", "total_oc_heists", "oc_cooldown_until", "oc_timer_reduced",
+    ],
+    "full": None,
+}
+
+def _user_projection(profile: str) -> dict:
+    fields = USER_PROFILES[profile]
+    if fields is None:
+        return {"_id": 0}
+    return {"_id": 0, **{f: 1 for f in fields}}
+
+async def _load_current_user(request: Request, credentials: HTTPAuthorizationCredentials, projection: dict) -> dict:
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        # SecurityMiddleware already verified the token; fall back to decoding (LRU-cached) without it
+        payload = auth_tokens.claims_for_request(request) or auth_tokens.decode_token(credentials.credentials)
         user_id: str = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
     
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    user_loader.begin_request()
+    user = await db.users.find_current_user(user_id, projection)
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
     
@@ -876,11 +1024,72 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
                         {"id": user_id},
                         {"$set": {"current_state": destination}, "$unset": {"traveling_to": "", "travel_arrives_at": ""}}
                     )
-                    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+                    user["current_state"] = destination
+                    user.pop("traveling_to", None)
+                    user.pop("travel_arrives_at", None)
         except Exception:
             pass
+    online_index.touch(user_id, _online_row(user))
     return user
 
+def _online_row(user: dict) -> dict:
+    """Row shown in the Users Online list."""
+    rank_id, rank_name = get_rank_info(user.get("rank_points", 0))
+    return {
+        "username": user.get("username"),
+        "rank": rank_id,
+        "rank_name": rank_name,
+        "location": user.get("current_state"),
+        "in_jail": user.get("in_jail", False),
+    }
+
+async def reconcile_online_index():
+    """Merge users other workers saw (flushed last_seen) and forced-online windows into online_index."""
+    now = datetime.now(timezone.utc)
+    five_min_ago = now - timedelta(minutes=5)
+    users = await db.users.find(
+        {
+            "is_dead": {"$ne": True},
+            "is_bodyguard": {"$ne": True},
+            "$or": [
+                {"last_seen": {"$gte": five_min_ago}},
+                {"forced_online_until": {"$gt": now}},
+            ],
+        },
+        {"_id": 0, "id": 1, "username": 1, "rank_points": 1, "current_state": 1, "in_jail": 1, "last_seen": 1, "forced_online_until": 1}
+    ).to_list(5000)
+    online_index.reconcile([
+        (u["id"], to_datetime(u.get("last_seen")), to_datetime(u.get("forced_online_until")), _online_row(u))
+        for u in users
+    ])
+
+async def _online_reconcile_loop():
+    while True:
+        try:
+            await reconcile_online_index()
+        except Exception:
+            logging.exception("Online index reconcile failed")
+        await asyncio.sleep(ONLINE_RECONCILE_SECONDS)
+
+async def get_current_user(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await _load_current_user(request, credentials, _user_projection("full"))
+
+_profile_dependencies = {"full": get_current_user}
+
+def get_current_user_profile(profile: str = "full"):
+    """Dependency factory: Depends(get_current_user_profile("combat")) loads only that profile's fields."""
+    if profile not in USER_PROFILES:
+        raise ValueError(f"Unknown user profile: {profile}")
+    if profile not in _profile_dependencies:
+        projection = _user_projection(profile)
+
+        async def dependency(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)):
+            return await _load_current_user(request, credentials, projection)
+
+        dependency.__name__ = f"get_current_user_{profile}"
+        _profile_dependencies[profile] = dependency
+    return _profile_dependencies[profile]
+
 async def send_notification(user_id: str, title: str, message: str, notification_type: str, **extra):
     """Send a notification to user's inbox. Optional extra fields (e.g. oc_invite_id) are merged in."""
     notification = {
@@ -890,18 +1099,36 @@ async def send_notification(user_id: str, title: str, message: str, notification
         "message": message,
         "notification_type": notification_type,
         "read": False,
-        "created_at": datetime.now(timezone.utc).isoformat(),
+        "created_at": utcnow(),
         **extra,
     }
     await db.notifications.insert_one(notification)
     return notification
 
 
+async def send_notifications(user_ids: list, title: str, message: str, notification_type: str):
+    """Send the same notification to several users with one insert_many."""
+    if not user_ids:
+        return
+    now = utcnow()
+    await db.notifications.insert_many([
+        {
+            "id": str(uuid.uuid4()),
+            "user_id": uid,
+            "title": title,
+            "message": message,
+            "notification_type": notification_type,
+            "read": False,
+            "created_at": now,
+        }
+        for uid in user_ids
+    ])
+
+
 async def send_notification_to_family(family_id: str, title: str, message: str, notification_type: str):
     """Notify every member of a family."""
     members = await db.family_members.find({"family_id": family_id}, {"_id": 0, "user_id": 1}).to_list(100)
-    for m in members:
-        await send_notification(m["user_id"], title, message, notification_type)
+    await send_notifications([m["user_id"] for m in members], title, message, notification_type)
 
 
 async def _family_war_start(family_a_id: str, family_b_id: str):
@@ -921,7 +1148,7 @@ async def _family_war_start(family_a_id: str, family_b_id: str):
     fb = await db.families.find_one({"id": family_b_id}, {"_id": 0, "name": 1, "tag": 1})
     family_a_name = (fa or {}).get("name") or (fa or {}).get("tag") or family_a_id
     family_b_name = (fb or {}).get("name") or (fb or {}).get("tag") or family_b_id
-    now = datetime.now(timezone.utc).isoformat()
+    now = utcnow()
     await db.family_wars.insert_one({
         "id": str(uuid.uuid4()),
         "family_a_id": family_a_id,
@@ -957,12 +1184,7 @@ async def _family_war_check_wipe_and_award(victim_family_id: str):
     if not war or war.get("status") not in ["active", "truce_offered"]:
         return
     members = await db.family_members.find({"family_id": victim_family_id}, {"_id": 0, "user_id": 1}).to_list(100)
-    alive = 0
-    for m in members:
-        # Include 'id' in projection to ensure we get a non-empty dict when user exists
-        u = await db.users.find_one({"id": m["user_id"]}, {"_id": 0, "id": 1, "is_dead": 1})
-        if u and u.get("id") and not u.get("is_dead"):
-            alive += 1
+    alive = await db.users.count_documents({"id": {"$in": [m["user_id"] for m in members]}, "is_dead": {"$ne": True}})
     if alive > 0:
         return
     winner_id = war["family_b_id"] if war["family_a_id"] == victim_family_id else war["family_a_id"]
@@ -987,19 +1209,19 @@ async def _family_war_check_wipe_and_award(victim_family_id: str):
         l_level = state.get("level", 0)
         if l_level > w_level:
             winner_rackets[racket_id] = {"level": l_level, "last_collected_at": state.get("last_collected_at")}
-            racket_def = next((r for r in FAMILY_RACKETS if r["id"] == racket_id), None)
+            racket_def = catalog.current().rackets.get(racket_id)
             prize_rackets.append({"racket_id": racket_id, "name": racket_def["name"] if racket_def else racket_id, "level": l_level})
     await db.families.update_one({"id": winner_id}, {"$set": {"rackets": winner_rackets}})
     loser_member_ids = [m["user_id"] for m in members]
     exclusive_cars = await db.user_cars.find({"user_id": {"$in": loser_member_ids}}, {"_id": 0}).to_list(500)
+    cat = catalog.current()
     for uc in exclusive_cars:
-        car_info = next((c for c in CARS if c.get("id") == uc.get("car_id")), None)
-        if car_info and car_info.get("rarity") == "exclusive":
+        if cat.is_exclusive_car(uc.get("car_id")):
             await db.user_cars.update_one(
                 {"id": uc.get("id")},
                 {"$set": {"user_id": winner_boss_id}},
             )
-    prize_count = sum(1 for uc in exclusive_cars if next((c for c in CARS if c.get("id") == uc.get("car_id")), {}).get("rarity") == "exclusive")
+    prize_count = sum(1 for uc in exclusive_cars if cat.is_exclusive_car(uc.get("car_id")))
     await db.family_wars.update_one(
         {"id": war["id"]},
         {"$set": {
@@ -1052,36 +1274,35 @@ async def _get_active_war_for_family(family_id: str):
     )
 
 
+def _war_stats_inc(war_id: str, user_id: str, family_id: str | None, field: str) -> UpdateOne:
+    """Upsert op adding 1 to one counter of a user's family_war_stats row."""
+    counters = {"bodyguard_kills": 0, "bodyguards_lost": 0, "kills": 0, "deaths": 0}
+    counters.pop(field)
+    return UpdateOne(
+        {"war_id": war_id, "user_id": user_id},
+        {"$setOnInsert": {"war_id": war_id, "user_id": user_id, "family_id": family_id or None, **counters}, "$inc": {field: 1}},
+        upsert=True,
+    )
+
+
 async def _record_war_stats_bodyguard_kill(war_id: str, attacker_id: str, attacker_family_id: str, target_id: str, target_family_id: str):
     """Record one bodyguard kill for this war: attacker +1 bodyguard_kills, target +1 bodyguards_lost."""
     if not war_id:
         return
-    await db.family_war_stats.update_one(
-        {"war_id": war_id, "user_id": attacker_id},
-        {"$setOnInsert": {"war_id": war_id, "user_id": attacker_id, "family_id": attacker_family_id or None, "bodyguard_kills": 0, "bodyguards_lost": 0, "kills": 0, "deaths": 0}, "$inc": {"bodyguard_kills": 1}},
-        upsert=True,
-    )
-    await db.family_war_stats.update_one(
-        {"war_id": war_id, "user_id": target_id},
-        {"$setOnInsert": {"war_id": war_id, "user_id": target_id, "family_id": target_family_id or None, "bodyguard_kills": 0, "bodyguards_lost": 0, "kills": 0, "deaths": 0}, "$inc": {"bodyguards_lost": 1}},
-        upsert=True,
-    )
+    await db.family_war_stats.bulk_write([
+        _war_stats_inc(war_id, attacker_id, attacker_family_id, "bodyguard_kills"),
+        _war_stats_inc(war_id, target_id, target_family_id, "bodyguards_lost"),
+    ], ordered=False)
 
 
 async def _record_war_stats_player_kill(war_id: str, killer_id: str, killer_family_id: str, victim_id: str, victim_family_id: str):
     """Record one player kill for this war: killer +1 kills, victim +1 deaths."""
     if not war_id:
         return
-    await db.family_war_stats.update_one(
-        {"war_id": war_id, "user_id": killer_id},
-        {"$setOnInsert": {"war_id": war_id, "user_id": killer_id, "family_id": killer_family_id or None, "bodyguard_kills": 0, "bodyguards_lost": 0, "kills": 0, "deaths": 0}, "$inc": {"kills": 1}},
-        upsert=True,
-    )
-    await db.family_war_stats.update_one(
-        {"war_id": war_id, "user_id": victim_id},
-        {"$setOnInsert": {"war_id": war_id, "user_id": victim_id, "family_id": victim_family_id or None, "bodyguard_kills": 0, "bodyguards_lost": 0, "kills": 0, "deaths": 0}, "$inc": {"deaths": 1}},
-        upsert=True,
-    )
+    await db.family_war_stats.bulk_write([
+        _war_stats_inc(war_id, killer_id, killer_family_id, "kills"),
+        _war_stats_inc(war_id, victim_id, victim_family_id, "deaths"),
+    ], ordered=False)
 
 def get_rank_info(rank_points: int):
     """Get rank based on rank_points only"""
@@ -1091,6 +1312,11 @@ def get_rank_info(rank_points: int):
     return 1, RANKS[0]["name"]
 
 
+def with_rank_id(update: dict) -> list:
+    """Users update ($inc/$set) as a pipeline that also keeps users.rank_id in step with rank_points."""
+    return rank_ids.with_rank_id(update, RANKS)
+
+
 def get_wealth_rank(money: int | float) -> tuple[int, str]:
     """Get wealth rank (1920s–1930s style) based on cash on hand. Returns (id, name)."""
     m = int(money) if money is not None else 0
@@ -1146,7 +1372,7 @@ async def check_and_process_rank_up(user_id: str, old_rank: int, new_rank: int,
 @api_router.post("/auth/register")
 async def register(user_data: UserRegister):
     try:
-        existing = await db.users.find_one({"$or": [{"email": user_data.email}, {"username": user_data.username}]}, {"_id": 0})
+        existing = await db.users.find_one({"$or": [{"email": user_data.email}, {"username_lower": username_key(user_data.username)}]}, {"_id": 0})
         if existing:
             if existing.get("is_dead"):
                 # Dead account — free up the email/username so they can re-register
@@ -1155,6 +1381,7 @@ async def register(user_data: UserRegister):
                     {"$set": {
                         "email": f"dead_{existing['id']}@deleted",
                         "username": f"dead_{existing['id'][:8]}",
+                        "username_lower": f"dead_{existing['id'][:8]}",
                     }}
                 )
             else:
@@ -1165,14 +1392,16 @@ async def register(user_data: UserRegister):
             "id": user_id,
             "email": str(user_data.email),
             "username": str(user_data.username),
-            "password_hash": get_password_hash(user_data.password),
+            "username_lower": username_key(user_data.username),
+            "password_hash": await get_password_hash_async(user_data.password),
             "rank": 1,
             "money": 1000.0,
             "points": 0,
             "rank_points": 0,
+            "rank_id": 1,
             "bodyguard_slots": 0,
             "bullets": 0,
-            "avatar_url": None,
+            "avatar_hash": None,
             "jail_busts": 0,
             "garage_batch_limit": DEFAULT_GARAGE_BATCH_LIMIT,
             "total_crimes": 0,
@@ -1198,13 +1427,13 @@ async def register(user_data: UserRegister):
             "armour_owned_level_max": 0,
             "equipped_weapon_id": None,
             "kill_inflation": 0.0,  # +% bullets required (e.g. 0.10 = +10%)
-            "kill_inflation_updated_at": datetime.now(timezone.utc).isoformat(),
+            "kill_inflation_updated_at": utcnow(),
             "is_dead": False,
             "dead_at": None,
             "points_at_death": None,
             "retrieval_used": False,
-            "last_seen": datetime.now(timezone.utc).isoformat(),
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "last_seen": utcnow(),
+            "created_at": utcnow()
         }
         
         # Insert the user document
@@ -1236,7 +1465,7 @@ async def register(user_data: UserRegister):
 @api_router.post("/auth/login")
 async def login(user_data: UserLogin):
     user = await db.users.find_one({"email": user_data.email}, {"_id": 0})
-    if not user or not verify_password(user_data.password, user["password_hash"]):
+    if not user or not await verify_password_async(user_data.password, user.get("password_hash")):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     if user.get("is_dead"):
         raise HTTPException(
@@ -1248,11 +1477,8 @@ async def login(user_data: UserLogin):
 
 @api_router.get("/auth/me")
 async def get_me(current_user: dict = Depends(get_current_user)):
-    # Update last_seen
-    await db.users.update_one(
-        {"id": current_user["id"]},
-        {"$set": {"last_seen": datetime.now(timezone.utc).isoformat()}}
-    )
+    # Record last_seen (buffered; flushed to the DB in batches)
+    presence.touch(current_user["id"])
     
     rank_id, rank_name = get_rank_info(current_user.get("rank_points", 0))
     wealth_id, wealth_name = get_wealth_rank(current_user.get("money", 0))
@@ -1277,7 +1503,7 @@ async def get_me(current_user: dict = Depends(get_current_user)):
         total_kills=current_user["total_kills"],
         total_deaths=current_user["total_deaths"],
         in_jail=current_user.get("in_jail", False),
-        jail_until=current_user.get("jail_until"),
+        jail_until=to_iso(current_user.get("jail_until")),
         premium_rank_bar=current_user.get("premium_rank_bar", False),
         has_silencer=current_user.get("has_silencer", False),
         custom_car_name=current_user.get("custom_car_name"),
@@ -1286,7 +1512,7 @@ async def get_me(current_user: dict = Depends(get_current_user)):
         garage_batch_limit=current_user.get("garage_batch_limit", DEFAULT_GARAGE_BATCH_LIMIT),
         total_crimes=current_user.get("total_crimes", 0),
         crime_profit=int(current_user.get("crime_profit", 0) or 0),
-        created_at=current_user["created_at"],
+        created_at=to_iso(current_user["created_at"]) or "",
         swiss_balance=int(current_user.get("swiss_balance", 0) or 0),
         swiss_limit=int(current_user.get("swiss_limit", SWISS_BANK_LIMIT_START) or SWISS_BANK_LIMIT_START),
         oc_timer_reduced=bool(current_user.get("oc_timer_reduced", False)),
@@ -1303,25 +1529,18 @@ async def get_user_profile(username: str, current_user: dict = Depends(get_curre
     wealth_id, wealth_name = get_wealth_rank(user.get("money", 0))
     is_dead = bool(user.get("is_dead"))
     online = False
-    last_seen = user.get("last_seen")
+    last_seen = to_datetime(user.get("last_seen"))
+    buffered_seen = presence.last_seen(user["id"])
+    if buffered_seen and (not last_seen or buffered_seen > last_seen):
+        last_seen = buffered_seen
     if (not is_dead) and last_seen:
-        try:
-            ls = datetime.fromisoformat(last_seen)
-            if ls.tzinfo is None:
-                ls = ls.replace(tzinfo=timezone.utc)
-            online = ls >= (datetime.now(timezone.utc) - timedelta(minutes=5))
-        except Exception:
-            online = False
+        online = last_seen >= (datetime.now(timezone.utc) - timedelta(minutes=5))
+    if (not is_dead) and (not online):
+        online = online_index.is_online(user["id"])
     if (not is_dead) and (not online):
-        forced_until = user.get("forced_online_until")
+        forced_until = to_datetime(user.get("forced_online_until"))
         if forced_until:
-            try:
-                fu = datetime.fromisoformat(forced_until)
-                if fu.tzinfo is None:
-                    fu = fu.replace(tzinfo=timezone.utc)
-                online = datetime.now(timezone.utc) < fu
-            except Exception:
-                pass
+            online = datetime.now(timezone.utc) < forced_until
     wealth_range = get_wealth_rank_range(user.get("money", 0))
     user_id = user["id"]
 
@@ -1332,22 +1551,12 @@ async def get_user_profile(username: str, current_user: dict = Depends(get_curre
         if fam:
             family_name = fam.get("name")
 
-    # Honours: leaderboard rankings for this user (rank in each stat)
-    async def _rank_for_field(field: str, value: int) -> int:
-        if value is None:
-            value = 0
-        n_better = await db.users.count_documents({
-            "is_dead": {"$ne": True},
-            "is_bodyguard": {"$ne": True},
-            field: {"$gt": value},
-        })
-        return n_better + 1
-
-    kills_rank = await _rank_for_field("total_kills", int(user.get("total_kills") or 0))
-    crimes_rank = await _rank_for_field("total_crimes", int(user.get("total_crimes") or 0))
-    gta_rank = await _rank_for_field("total_gta", int(user.get("total_gta") or 0))
-    jail_rank = await _rank_for_field("jail_busts", int(user.get("jail_busts") or 0))
-    rank_points_rank = await _rank_for_field("rank_points", int(user.get("rank_points") or 0))
+    # Honours: leaderboard rankings for this user (rank in each stat, among alive players)
+    kills_rank = leaderboard_index.rank("total_kills", int(user.get("total_kills") or 0))
+    crimes_rank = leaderboard_index.rank("total_crimes", int(user.get("total_crimes") or 0))
+    gta_rank = leaderboard_index.rank("total_gta", int(user.get("total_gta") or 0))
+    jail_rank = leaderboard_index.rank("jail_busts", int(user.get("jail_busts") or 0))
+    rank_points_rank = leaderboard_index.rank("rank_points", int(user.get("rank_points") or 0))
     honours = [
         {"rank": rank_points_rank, "label": "Most Rank Points Earned"},
         {"rank": kills_rank, "label": "Most Kills"},
@@ -1384,7 +1593,8 @@ async def get_user_profile(username: str, current_user: dict = Depends(get_curre
         "kills": user.get("total_kills", 0),
         "jail_busts": user.get("jail_busts", 0),
         "created_at": user.get("created_at"),
-        "avatar_url": user.get("avatar_url"),
+        "avatar_url": avatar_store.avatar_path(user["avatar_hash"], "md") if user.get("avatar_hash") else user.get("avatar_url"),
+        "avatar_thumb_url": avatar_store.avatar_path(user["avatar_hash"], "sm") if user.get("avatar_hash") else user.get("avatar_url"),
         "is_dead": is_dead,
         "is_npc": bool(user.get("is_npc")),
         "is_bodyguard": bool(user.get("is_bodyguard")),
@@ -1412,19 +1622,33 @@ async def get_user_profile(username: str, current_user: dict = Depends(get_curre
     return out
 
 @api_router.post("/profile/avatar")
-async def update_avatar(request: AvatarUpdateRequest, current_user: dict = Depends(get_current_user)):
-    """Update your avatar (stored as a data URL)."""
-    avatar = (request.avatar_data or "").strip()
-    if not avatar.startswith("data:image/"):
-        raise HTTPException(status_code=400, detail="Avatar must be an image data URL (data:image/...)")
-    if len(avatar) > 250_000:
-        raise HTTPException(status_code=400, detail="Avatar too large. Use a smaller image.")
+async def update_avatar(request: AvatarUpdateRequest, current_user: dict = Depends(get_current_user_profile("core"))):
+    """Update your avatar (decoded into the avatar store; the user keeps only its hash)."""
+    try:
+        avatar_hash = await avatar_store.store_avatar(avatar_bucket, request.avatar_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     await db.users.update_one(
         {"id": current_user["id"]},
-        {"$set": {"avatar_url": avatar}}
+        {"$set": {"avatar_hash": avatar_hash}, "$unset": {"avatar_url": ""}}
+    )
+    return {"message": "Avatar updated", "avatar_url": avatar_store.avatar_path(avatar_hash, "md")}
+
+@api_router.get("/avatars/{avatar_hash}")
+async def get_avatar(avatar_hash: str, size: str = "md"):
+    """Avatar image by content hash (size: sm, md or full). Public and immutable."""
+    if not avatar_store.is_avatar_hash(avatar_hash) or size not in avatar_store.AVATAR_SIZES:
+        raise HTTPException(status_code=404, detail="Avatar not found")
+    found = await avatar_store.read_avatar(avatar_bucket, avatar_hash, size)
+    if not found:
+        raise HTTPException(status_code=404, detail="Avatar not found")
+    data, content_type = found
+    return Response(
+        content=data,
+        media_type=content_type,
+        headers={"Cache-Control": avatar_store.AVATAR_CACHE_CONTROL, "ETag": f'"{avatar_hash}-{size}"', **avatar_store.AVATAR_SECURITY_HEADERS},
     )
-    return {"message": "Avatar updated"}
 
 @api_router.post("/dead-alive/retrieve")
 async def dead_alive_retrieve(request: DeadAliveRetrieveRequest, current_user: dict = Depends(get_current_user)):
@@ -1436,7 +1660,7 @@ async def dead_alive_retrieve(request: DeadAliveRetrieveRequest, current_user: d
         raise HTTPException(status_code=400, detail="That account is not dead. Only dead accounts can be retrieved.")
     if dead_user.get("retrieval_used"):
         raise HTTPException(status_code=400, detail="Points from that dead account have already been retrieved.")
-    if not verify_password(request.dead_password, dead_user["password_hash"]):
+    if not await verify_password_async(request.dead_password, dead_user.get("password_hash")):
         raise HTTPException(status_code=401, detail="Invalid password for that account")
     points_at_death = dead_user.get("points_at_death", 0)
     if points_at_death <= 0:
@@ -1458,33 +1682,9 @@ async def dead_alive_retrieve(request: DeadAliveRetrieveRequest, current_user: d
 
 # Online Users endpoint
 @api_router.get("/users/online", response_model=OnlineUsersResponse)
-async def get_online_users(current_user: dict = Depends(get_current_user)):
-    # Users online in last 5 minutes OR forced-online window (exclude dead accounts)
-    now = datetime.now(timezone.utc)
-    five_min_ago = now - timedelta(minutes=5)
-    users = await db.users.find(
-        {
-            "is_dead": {"$ne": True},
-            "is_bodyguard": {"$ne": True},
-            "$or": [
-                {"last_seen": {"$gte": five_min_ago.isoformat()}},
-                {"forced_online_until": {"$gt": now.isoformat()}},
-            ],
-        },
-        {"_id": 0, "password_hash": 0}
-    ).to_list(100)
-    
-    users_data = []
-    for user in users:
-        rank_id, rank_name = get_rank_info(user.get("rank_points", 0))
-        users_data.append({
-            "username": user["username"],
-            "rank": rank_id,
-            "rank_name": rank_name,
-            "location": user["current_state"],
-            "in_jail": user.get("in_jail", False)
-        })
-    
+async def get_online_users(current_user: dict = Depends(get_current_user_profile("core"))):
+    # Users with a heartbeat in the last 5 minutes OR a forced-online window, from memory
+    users_data = online_index.online_rows(100)
     return OnlineUsersResponse(total_online=len(users_data), users=users_data)
 
 # Stats endpoints
@@ -1493,172 +1693,30 @@ async def get_stats_overview(
     users_only_kills: bool = True,
     current_user: dict = Depends(get_current_user),
 ):
-    now = datetime.now(timezone.utc)
-
-    total_users = await db.users.count_documents({})
-    alive_users = await db.users.count_documents({"is_dead": {"$ne": True}})
-    dead_users = max(0, total_users - alive_users)
-
-    # Totals across all users (includes dead accounts for historical totals)
-    totals = await db.users.aggregate([
-        {
-            "$group": {
-                "_id": None,
-                "money_total": {"$sum": {"$ifNull": ["$money", 0]}},
-                "points_total": {"$sum": {"$ifNull": ["$points", 0]}},
-                "swiss_total": {"$sum": {"$ifNull": ["$swiss_balance", 0]}},
-                "total_crimes": {"$sum": {"$ifNull": ["$total_crimes", 0]}},
-                "total_gta": {"$sum": {"$ifNull": ["$total_gta", 0]}},
-                "total_jail_busts": {"$sum": {"$ifNull": ["$jail_busts", 0]}},
-            }
-        }
-    ]).to_list(1)
-    totals_doc = totals[0] if totals else {}
-
-    # Interest bank: total principal + interest in unclaimed deposits
-    interest_agg = await db.bank_deposits.aggregate([
-        {"$match": {"claimed_at": None}},
-        {"$group": {"_id": None, "total": {"$sum": {"$add": [{"$ifNull": ["$principal", 0]}, {"$ifNull": ["$interest_amount", 0]}]}}}}
-    ]).to_list(1)
-    interest_bank_total = int(interest_agg[0].get("total", 0) or 0) if interest_agg else 0
-
-    # Vehicle stats
-    total_vehicles = await db.user_cars.count_documents({})
-    car_counts = await db.user_cars.aggregate([
-        {"$group": {"_id": "$car_id", "count": {"$sum": 1}}}
-    ]).to_list(100)
-    car_by_id = {c.get("id"): c for c in CARS}
-    exclusive_vehicles = 0
-    rare_vehicles = 0
-    for cc in car_counts:
-        car_id = cc.get("_id")
-        cnt = int(cc.get("count", 0) or 0)
-        info = car_by_id.get(car_id) or {}
-        rarity = info.get("rarity")
-        if rarity == "exclusive":
-            exclusive_vehicles += cnt
-        if rarity in ("rare", "ultra_rare", "legendary", "exclusive"):
-            rare_vehicles += cnt
-
-    # Rank breakdown (alive/dead) using current rank_points (fast enough for typical sizes)
-    rank_stats_map: dict[int, dict] = {}
-    rank_meta = [(r["id"], r["name"]) for r in RANKS]
-    for rid, rname in rank_meta:
-        rank_stats_map[int(rid)] = {"rank_id": int(rid), "rank_name": rname, "alive": 0, "dead": 0}
-
-    users_for_rank = await db.users.find(
-        {},
-        {"_id": 0, "rank_points": 1, "is_dead": 1}
-    ).to_list(50000)
-    for u in users_for_rank:
-        rid, _ = get_rank_info(int(u.get("rank_points", 0) or 0))
-        bucket = rank_stats_map.get(int(rid))
-        if not bucket:
-            continue
-        if u.get("is_dead"):
-            bucket["dead"] += 1
-        else:
-            bucket["alive"] += 1
-
-    rank_stats = [rank_stats_map[r["id"]] for r in RANKS]
-
-    # Recent kills (show ALL kills), but only show the killer's name when it was marked public.
-    attempts = await db.attack_attempts.find(
-        {"outcome": "killed"},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(200)
-    recent_kills = []
-    for a in attempts:
-        killer = await db.users.find_one(
-            {"id": a.get("attacker_id")},
-            {"_id": 0, "is_npc": 1, "rank_points": 1, "username": 1}
-        )
-        victim = await db.users.find_one(
-            {"id": a.get("target_id")},
-            {"_id": 0, "is_npc": 1, "rank_points": 1}
-        )
-
-        if users_only_kills and (bool(killer and killer.get("is_npc")) or bool(victim and victim.get("is_npc"))):
-            continue
-
-        # Prefer rank stored on the attempt record (stable even if user doc changes)
-        victim_rank_name = None
-        tr_id = a.get("target_rank_id")
-        if tr_id is not None:
-            try:
-                tr_id_int = int(tr_id)
-                victim_rank_name = next((r.get("name") for r in RANKS if int(r.get("id", 0) or 0) == tr_id_int), None)
-            except Exception:
-                victim_rank_name = None
-        if victim_rank_name is None and victim:
-            _, victim_rank_name = get_rank_info(int(victim.get("rank_points", 0) or 0))
-
-        is_public = bool(a.get("make_public"))
-        killer_username = a.get("attacker_username") if is_public else None
-        victim_username = a.get("target_username")
-        if not victim_username:
-            continue
-
-        recent_kills.append({
-            "id": a.get("id") or a.get("attack_id") or str(uuid.uuid4()),
-            "victim_username": victim_username,
-            "victim_rank_name": victim_rank_name,
-            "killer_username": killer_username,
-            "is_public": is_public,
-            "created_at": a.get("created_at"),
-        })
-
-        if len(recent_kills) >= 15:
-            break
-
-    top_dead = await db.users.find(
-        {"is_dead": True},
-        {"_id": 0, "username": 1, "total_kills": 1, "rank_points": 1, "dead_at": 1}
-    ).sort("total_kills", -1).limit(20).to_list(20)
-    top_dead_users = []
-    for u in top_dead:
-        rid, rname = get_rank_info(int(u.get("rank_points", 0) or 0))
-        top_dead_users.append({
-            "username": u.get("username"),
-            "total_kills": int(u.get("total_kills", 0) or 0),
-            "rank_name": rname,
-            "dead_at": u.get("dead_at"),
-        })
+    """Game overview, served from the snapshot stats_snapshot.run() rebuilds every minute; recent kills from the kill feed."""
+    snapshot, recent_kills = await asyncio.gather(
+        stats_snapshot.latest(db),
+        kill_events.recent(db, stats_snapshot.RECENT_KILLS, users_only=users_only_kills),
+    )
+    if not snapshot:
+        snapshot = await stats_snapshot.refresh(db, RANKS, catalog.current().cars)
+    return {"generated_at": to_iso(snapshot["generated_at"]), **snapshot["data"], "recent_kills": recent_kills}
 
-    return {
-        "generated_at": now.isoformat(),
-        "game_capital": {
-            "total_cash": int(totals_doc.get("money_total", 0) or 0),
-            "swiss_total": int(totals_doc.get("swiss_total", 0) or 0),
-            "interest_bank_total": interest_bank_total,
-            "points_total": int(totals_doc.get("points_total", 0) or 0),
-        },
-        "user_stats": {
-            "total_users": int(total_users),
-            "alive_users": int(alive_users),
-            "dead_users": int(dead_users),
-            "total_crimes": int(totals_doc.get("total_crimes", 0) or 0),
-            "total_gta": int(totals_doc.get("total_gta", 0) or 0),
-            "total_jail_busts": int(totals_doc.get("total_jail_busts", 0) or 0),
-            "bullets_melted_total": 0,
-        },
-        "vehicle_stats": {
-            "total_vehicles": int(total_vehicles),
-            "exclusive_vehicles": int(exclusive_vehicles),
-            "rare_vehicles": int(rare_vehicles),
-        },
-        "rank_stats": rank_stats,
-        "recent_kills": recent_kills,
-        "top_dead_users": top_dead_users,
-    }
+# RANKS/CARS only change with a deploy
+_META_VERSION = conditional.make_etag(RANKS, CARS)
+_META_LOADED_AT = utcnow()
 
 @api_router.get("/meta/ranks")
-async def get_meta_ranks(current_user: dict = Depends(get_current_user)):
-    return {"ranks": [{"id": int(r["id"]), "name": r["name"]} for r in RANKS]}
+async def get_meta_ranks(request: Request, current_user: dict = Depends(get_current_user)):
+    async def build():
+        return {"ranks": [{"id": int(r["id"]), "name": r["name"]} for r in RANKS]}
+    return await conditional.respond(request, ("meta/ranks",), _META_VERSION, build, "static", _META_LOADED_AT, shared=True)
 
 @api_router.get("/meta/cars")
-async def get_meta_cars(current_user: dict = Depends(get_current_user)):
-    return {"cars": [{"id": c["id"], "name": c["name"], "rarity": c.get("rarity")} for c in CARS]}
+async def get_meta_cars(request: Request, current_user: dict = Depends(get_current_user)):
+    async def build():
+        return {"cars": [{"id": c["id"], "name": c["name"], "rarity": c.get("rarity")} for c in CARS]}
+    return await conditional.respond(request, ("meta/cars",), _META_VERSION, build, "static", _META_LOADED_AT, shared=True)
 
 def _interest_option(duration_hours: int) -> dict | None:
     try:
@@ -1668,18 +1726,6 @@ def _interest_option(duration_hours: int) -> dict | None:
     return next((o for o in BANK_INTEREST_OPTIONS if int(o.get("hours", 0) or 0) == h), None)
 
 
-def _parse_matures_at(matures_at: str | None) -> datetime | None:
-    """Parse deposit matures_at to timezone-aware UTC datetime. Returns None if missing/invalid."""
-    if not matures_at:
-        return None
-    try:
-        mat = datetime.fromisoformat(matures_at.replace("Z", "+00:00"))
-        if mat.tzinfo is None:
-            mat = mat.replace(tzinfo=timezone.utc)
-        return mat
-    except Exception:
-        return None
-
 @api_router.get("/bank/meta")
 async def bank_meta(current_user: dict = Depends(get_current_user)):
     return {
@@ -1700,7 +1746,7 @@ async def bank_overview(current_user: dict = Depends(get_current_user)):
         {"_id": 0}
     ).sort("created_at", -1).to_list(50)
     for d in deposits:
-        mat = _parse_matures_at(d.get("matures_at"))
+        mat = to_datetime(d.get("matures_at"))
         d["matured"] = bool(mat is not None and now >= mat)
 
     transfers = await db.money_transfers.find(
@@ -1748,8 +1794,8 @@ async def bank_interest_deposit(request: BankInterestDepositRequest, current_use
         "duration_hours": hours,
         "interest_rate": rate,
         "interest_amount": int(interest),
-        "created_at": now.isoformat(),
-        "matures_at": matures.isoformat(),
+        "created_at": now,
+        "matures_at": matures,
         "claimed_at": None,
     })
     return {"message": f"Deposited ${amount:,} for {hours}h", "deposit_id": deposit_id, "interest": interest, "matures_at": matures.isoformat()}
@@ -1764,7 +1810,7 @@ async def bank_interest_claim(request: BankDepositClaimRequest, current_user: di
         raise HTTPException(status_code=400, detail="Deposit already claimed")
 
     now = datetime.now(timezone.utc)
-    mat = _parse_matures_at(dep.get("matures_at"))
+    mat = to_datetime(dep.get("matures_at"))
     if mat is None:
         raise HTTPException(status_code=400, detail="Deposit missing or invalid maturity time")
     if now < mat:
@@ -1823,13 +1869,13 @@ async def bank_transfer(request: MoneyTransferRequest, current_user: dict = Depe
     to_username = (request.to_username or "").strip()
     if not to_username:
         raise HTTPException(status_code=400, detail="Recipient username required")
-    if to_username == current_user["username"]:
+    if username_key(to_username) == username_key(current_user["username"]):
         raise HTTPException(status_code=400, detail="Cannot send money to yourself")
     amount = int(request.amount or 0)
     if amount <= 0:
         raise HTTPException(status_code=400, detail="Amount must be greater than 0")
 
-    recipient = await db.users.find_one({"username": to_username}, {"_id": 0})
+    recipient = await db.users.find_one(_find_user_by_username_case_insensitive(to_username), {"_id": 0})
     if not recipient:
         raise HTTPException(status_code=404, detail="Recipient not found")
     if recipient.get("is_dead"):
@@ -1840,7 +1886,7 @@ async def bank_transfer(request: MoneyTransferRequest, current_user: dict = Depe
     if amount > money:
         raise HTTPException(status_code=400, detail="Insufficient cash on hand")
 
-    now = datetime.now(timezone.utc).isoformat()
+    now = utcnow()
     transfer_id = str(uuid.uuid4())
     
     # Perform transfer
@@ -1935,7 +1981,7 @@ async def sports_betting_place(request: SportsBetPlaceRequest, current_user: dic
     money = int(user.get("money", 0) or 0)
     if stake > money:
         raise HTTPException(status_code=400, detail="Insufficient cash")
-    now = datetime.now(timezone.utc).isoformat()
+    now = utcnow()
     bet_id = str(uuid.uuid4())
     await db.users.update_one({"id": current_user["id"]}, {"$inc": {"money": -stake}})
     await db.sports_bets.insert_one({
@@ -2943,7 +2989,7 @@ async def buy_armour(request: ArmourBuyRequest, current_user: dict = Depends(get
 
     ev = await get_effective_event()
     mult = ev.get("armour_weapon_cost", 1.0)
-    updates = {"$set": {"armour_level": level, "armour_owned_level_max": max(owned_max, level)}}
+    updates = {"$set": {"armour_level": level, "armour_owned_level_max": max(owned_max, level), "combat_profile.armour_level": level}}
     if armour.get("cost_money") is not None:
         cost = int(armour["cost_money"] * mult)
         if current_user.get("money", 0) < cost:
@@ -2977,7 +3023,7 @@ async def equip_armour(request: ArmourBuyRequest, current_user: dict = Depends(g
 
     await db.users.update_one(
         {"id": current_user["id"]},
-        {"$set": {"armour_level": level}}
+        {"$set": {"armour_level": level, "combat_profile.armour_level": level}}
     )
     return {"message": "Armour equipped" if level else "Armour unequipped", "equipped_level": level}
 
@@ -2985,7 +3031,7 @@ async def equip_armour(request: ArmourBuyRequest, current_user: dict = Depends(g
 async def unequip_armour(current_user: dict = Depends(get_current_user)):
     await db.users.update_one(
         {"id": current_user["id"]},
-        {"$set": {"armour_level": 0}}
+        {"$set": {"armour_level": 0, "combat_profile.armour_level": 0}}
     )
     return {"message": "Armour unequipped", "equipped_level": 0}
 
@@ -3006,6 +3052,7 @@ async def sell_armour(current_user: dict = Depends(get_current_user)):
     updates = {"$set": {"armour_owned_level_max": new_owned_max}}
     if equipped == owned_max:
         updates["$set"]["armour_level"] = new_owned_max if new_owned_max > 0 else 0
+        updates["$set"]["combat_profile.armour_level"] = updates["$set"]["armour_level"]
     if refund_money is not None:
         updates["$inc"] = {"money": refund_money}
     elif refund_points is not None:
@@ -3119,7 +3166,7 @@ async def admin_add_car(target_username: str, car_id: str, current_user: dict =
     if not target:
         raise HTTPException(status_code=404, detail="User not found")
     
-    car = next((c for c in CARS if c["id"] == car_id), None)
+    car = catalog.current().cars.get(car_id)
     if not car:
         raise HTTPException(status_code=404, detail="Car not found")
     
@@ -3449,7 +3496,7 @@ async def admin_force_online(current_user: dict = Depends(get_current_user)):
             "$and": [
                 {
                     "$or": [
-                        {"last_seen": {"$lt": five_min_ago.isoformat()}},
+                        {"last_seen": {"$lt": five_min_ago}},
                         {"last_seen": None},
                         {"last_seen": {"$exists": False}},
                     ]
@@ -3458,13 +3505,19 @@ async def admin_force_online(current_user: dict = Depends(get_current_user)):
                     "$or": [
                         {"forced_online_until": {"$exists": False}},
                         {"forced_online_until": None},
-                        {"forced_online_until": {"$lt": until_iso}},
+                        {"forced_online_until": {"$lt": until}},
                     ]
                 },
             ],
         },
-        {"$set": {"forced_online_until": until_iso}},
+        {"$set": {"forced_online_until": until}},
     )
+    forced = await db.users.find(
+        {"forced_online_until": until, "is_bodyguard": {"$ne": True}},
+        {"_id": 0, "id": 1, "username": 1, "rank_points": 1, "current_state": 1, "in_jail": 1}
+    ).to_list(5000)
+    for u in forced:
+        online_index.force(u["id"], _online_row(u), until)
 
     return {"message": f"Forced offline users online until {until_iso}", "until": until_iso, "updated": res.modified_count}
 
@@ -3481,7 +3534,7 @@ async def admin_lock_player(target_username: str, lock_minutes: int, current_use
     
     await db.users.update_one(
         {"id": target["id"]},
-        {"$set": {"in_jail": True, "jail_until": jail_until.isoformat()}}
+        {"$set": {"in_jail": True, "jail_until": jail_until}}
     )
     
     return {"message": f"Locked {target_username} for {lock_minutes} minutes"}
@@ -3508,6 +3561,8 @@ async def admin_kill_player(target_username: str, current_user: dict = Depends(g
             "health": 0,
         }, "$inc": {"total_deaths": 1}}
     )
+    online_index.remove(target["id"])
+    await _family_member_lost(target.get("family_id"))
     return {"message": f"Killed {target_username}. Account is dead (cannot login); use Dead to Alive to revive."}
 
 @api_router.post("/admin/set-search-time")
@@ -3530,8 +3585,9 @@ async def admin_set_search_time(target_username: str, search_minutes: int, curre
     new_found_time = datetime.now(timezone.utc) + timedelta(minutes=int(search_minutes))
     await db.attacks.update_many(
         {"attacker_id": attacker["id"], "status": "searching"},
-        {"$set": {"found_at": new_found_time.isoformat()}}
+        {"$set": {"found_at": new_found_time}}
     )
+    attack_scheduler.refresh_now()
 
     return {"message": f"Set {target_username}'s search time to {search_minutes} minutes (persistent)"}
 
@@ -3547,16 +3603,13 @@ async def admin_set_all_search_time(search_minutes: int = 5, current_user: dict
         {},
         {"$set": {"search_minutes_override": int(search_minutes)}}
     )
-    await db.game_config.update_one(
-        {"id": "main"},
-        {"$set": {"default_search_minutes": int(search_minutes)}},
-        upsert=True
-    )
+    await bump_game_config({"$set": {"default_search_minutes": int(search_minutes)}})
     new_found_time = datetime.now(timezone.utc) + timedelta(minutes=int(search_minutes))
     await db.attacks.update_many(
         {"status": "searching"},
-        {"$set": {"found_at": new_found_time.isoformat()}}
+        {"$set": {"found_at": new_found_time}}
     )
+    attack_scheduler.refresh_now()
     return {"message": f"Set all users' search time to {search_minutes} minutes, persistent for everyone including new users ({res.modified_count} users updated)"}
 
 
@@ -3653,7 +3706,7 @@ async def admin_delete_single_user(user_id: str, current_user: dict = Depends(ge
     if current_user["email"] not in ADMIN_EMAILS:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "username": 1})
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "username": 1, "family_id": 1, "is_dead": 1})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -3663,6 +3716,8 @@ async def admin_delete_single_user(user_id: str, current_user: dict = Depends(ge
     # Delete user and all related data
     deleted["user"] = (await db.users.delete_one({"id": user_id})).deleted_count
     deleted["family_members"] = (await db.family_members.delete_many({"user_id": user_id})).deleted_count
+    if deleted["family_members"] and not user.get("is_dead"):
+        await _family_member_lost(user.get("family_id"))
     deleted["bodyguards"] = (await db.bodyguards.delete_many({"$or": [{"user_id": user_id}, {"bodyguard_user_id": user_id}]})).deleted_count
     deleted["bodyguard_invites"] = (await db.bodyguard_invites.delete_many({"$or": [{"from_user_id": user_id}, {"to_user_id": user_id}]})).deleted_count
     deleted["user_cars"] = (await db.user_cars.delete_many({"user_id": user_id})).deleted_count
@@ -3682,6 +3737,65 @@ async def admin_delete_single_user(user_id: str, current_user: dict = Depends(ge
     return {"message": f"Deleted user '{username}' and {total} related documents", "details": deleted}
 
 
+@api_router.get("/admin/metrics")
+async def admin_metrics(current_user: dict = Depends(get_current_user)):
+    """In-process cache/perf counters for this worker (admin)."""
+    if current_user["email"] not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return {
+        "user_loader": user_loader.stats(),
+        "bcrypt": bcrypt_metrics(),
+        "jwt_cache": auth_tokens.token_cache_metrics(),
+        "presence": presence.metrics(),
+        "online_index": online_index.metrics(),
+        "event_cache": event_cache.metrics(),
+        "catalog": catalog.metrics(),
+        "query_budgets": query_counter.metrics(),
+        "bullet_table": bullets_table.metrics(),
+        "kill_inflation": kill_inflation.metrics(),
+        "stats_snapshot": stats_snapshot.metrics(),
+        "kill_feed": kill_events.metrics(),
+        "leaderboards": leaderboard_index.metrics(),
+        "conditional_get": conditional.metrics(),
+        "attack_scheduler": attack_scheduler.metrics(),
+    }
+
+
+@api_router.get("/admin/combat-profiles/check")
+async def admin_check_combat_profiles(fix: bool = False, current_user: dict = Depends(get_current_user)):
+    """Compare users.combat_profile with user_weapons/armour/rank; fix=true rewrites mismatches (admin)."""
+    if current_user["email"] not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return await combat_profile.check(db, catalog.current(), _rank_id_of, fix=fix)
+
+
+@api_router.post("/admin/stats/refresh")
+async def admin_refresh_stats(current_user: dict = Depends(get_current_user)):
+    """Rebuild the /stats/overview snapshot now instead of waiting for the next run (admin)."""
+    if current_user["email"] not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    snapshot = await stats_snapshot.refresh(db, RANKS, catalog.current().cars)
+    return {"message": "Stats snapshot refreshed", "generated_at": to_iso(snapshot["generated_at"])}
+
+@api_router.post("/admin/families/reconcile")
+async def admin_reconcile_families(current_user: dict = Depends(get_current_user)):
+    """Recount every family's living_member_count and dissolve those with no living members (admin)."""
+    if current_user["email"] not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    result = await reconcile_families()
+    return {"checked": result["checked"], "repaired": result["repaired"], "dissolved": result["dissolved"]}
+
+
+@api_router.post("/admin/catalog/reload")
+async def admin_reload_catalog(current_user: dict = Depends(get_current_user)):
+    """Re-read crimes/weapons/properties into the in-memory catalog: this worker now, the others on their next version poll (admin)."""
+    if current_user["email"] not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    version = await catalog.publish_reload(db.game_config)
+    cat = await catalog.load(db, CARS, FAMILY_RACKETS, version)
+    return {"message": "Catalog reloaded", "catalog": cat.metrics()}
+
+
 @api_router.get("/admin/events")
 async def admin_get_events(current_user: dict = Depends(get_current_user)):
     """Get current events-enabled flag and all-events-for-testing (admin)."""
@@ -3699,11 +3813,7 @@ async def admin_toggle_events(request: EventsToggleRequest, current_user: dict =
     if current_user["email"] not in ADMIN_EMAILS:
         raise HTTPException(status_code=403, detail="Admin access required")
     enabled = request.enabled
-    await db.game_config.update_one(
-        {"id": "main"},
-        {"$set": {"events_enabled": bool(enabled)}},
-        upsert=True,
-    )
+    await bump_game_config({"$set": {"events_enabled": bool(enabled)}})
     return {"message": "Daily events " + ("enabled" if enabled else "disabled"), "events_enabled": bool(enabled)}
 
 
@@ -3713,11 +3823,7 @@ async def admin_all_events_for_testing(request: AllEventsForTestingRequest, curr
     if current_user["email"] not in ADMIN_EMAILS:
         raise HTTPException(status_code=403, detail="Admin access required")
     enabled = request.enabled
-    await db.game_config.update_one(
-        {"id": "main"},
-        {"$set": {"all_events_for_testing": bool(enabled)}},
-        upsert=True,
-    )
+    await bump_game_config({"$set": {"all_events_for_testing": bool(enabled)}})
     return {"message": "All events for testing " + ("enabled" if enabled else "disabled"), "all_events_for_testing": bool(enabled)}
 
 
@@ -3744,7 +3850,7 @@ async def admin_seed_families(current_user: dict = Depends(get_current_user)):
     """Create 3 families with 5 members each (15 test users). Password for all: test1234."""
     if current_user["email"] not in ADMIN_EMAILS:
         raise HTTPException(status_code=403, detail="Admin access required")
-    password_hash = get_password_hash(SEED_TEST_PASSWORD)
+    password_hash = await get_password_hash_async(SEED_TEST_PASSWORD)
     now = datetime.now(timezone.utc).isoformat()
     created_users = []
     created_families = []
@@ -3770,7 +3876,7 @@ async def admin_seed_families(current_user: dict = Depends(get_current_user)):
             base = f"{tag.lower()}_{role}"
             username = f"{base}_{i}"
             email = f"{base}{i}@test.mafia"
-            if await db.users.find_one({"$or": [{"email": email}, {"username": username}]}):
+            if await db.users.find_one({"$or": [{"email": email}, {"username_lower": username_key(username)}]}):
                 continue
             rank_points = SEED_RANK_POINTS_BY_ROLE.get(role, 0)
             rank_id, _ = get_rank_info(rank_points)
@@ -3778,14 +3884,16 @@ async def admin_seed_families(current_user: dict = Depends(get_current_user)):
                 "id": user_id,
                 "email": email,
                 "username": username,
+                "username_lower": username_key(username),
                 "password_hash": password_hash,
                 "rank": rank_id,
                 "money": 1000.0,
                 "points": 0,
                 "rank_points": rank_points,
+                "rank_id": rank_id,
                 "bodyguard_slots": 2,
                 "bullets": 0,
-                "avatar_url": None,
+                "avatar_hash": None,
                 "jail_busts": 0,
                 "garage_batch_limit": DEFAULT_GARAGE_BATCH_LIMIT,
                 "total_crimes": 0,
@@ -3810,13 +3918,13 @@ async def admin_seed_families(current_user: dict = Depends(get_current_user)):
                 "armour_owned_level_max": 0,
                 "equipped_weapon_id": None,
                 "kill_inflation": 0.0,
-                "kill_inflation_updated_at": now,
+                "kill_inflation_updated_at": utcnow(),
                 "is_dead": False,
                 "dead_at": None,
                 "points_at_death": None,
                 "retrieval_used": False,
-                "last_seen": now,
-                "created_at": now,
+                "last_seen": utcnow(),
+                "created_at": utcnow(),
             }
             await db.users.insert_one(user_doc)
             created_users.append({"username": username, "email": email, "role": role, "family": name})
@@ -3835,8 +3943,9 @@ async def admin_seed_families(current_user: dict = Depends(get_current_user)):
             "tag": tag,
             "boss_id": boss_id,
             "treasury": SEED_TREASURY,
-            "created_at": now,
+            "created_at": utcnow(),
             "rackets": rackets,
+            "living_member_count": len(user_ids),
         })
         created_families.append({"name": name, "tag": tag})
         for user_id, role, _ in user_ids:
@@ -3845,7 +3954,7 @@ async def admin_seed_families(current_user: dict = Depends(get_current_user)):
                 "family_id": family_id,
                 "user_id": user_id,
                 "role": role,
-                "joined_at": now,
+                "joined_at": utcnow(),
             })
             await db.users.update_one(
                 {"id": user_id},
@@ -3903,7 +4012,7 @@ async def extort_property(request: ProtectionRacketRequest, current_user: dict =
     if not target_property:
         raise HTTPException(status_code=404, detail="Target doesn't own this property")
     
-    prop = await db.properties.find_one({"id": request.property_id}, {"_id": 0})
+    prop = catalog.current().properties.get(request.property_id)
     if not prop:
         raise HTTPException(status_code=404, detail="Property not found")
     
@@ -3931,7 +4040,7 @@ async def extort_property(request: ProtectionRacketRequest, current_user: dict =
         if extortion_amount > 0:
             await db.users.update_one(
                 {"id": current_user["id"]},
-                {"$inc": {"money": extortion_amount, "rank_points": rank_points}}
+                with_rank_id({"$inc": {"money": extortion_amount, "rank_points": rank_points}})
             )
             await db.users.update_one(
                 {"id": target["id"]},
@@ -3959,6 +4068,7 @@ async def extort_property(request: ProtectionRacketRequest, current_user: dict =
 async def get_racket_targets(current_user: dict = Depends(get_current_user)):
     users_with_properties = await db.user_properties.distinct("user_id")
     alive = {u["id"] for u in await db.users.find({"id": {"$in": users_with_properties}, "is_dead": {"$ne": True}}, {"_id": 0, "id": 1}).to_list(100)}
+    cat = catalog.current()
     targets = []
     for user_id in users_with_properties:
         if user_id == current_user["id"] or user_id not in alive:
@@ -3969,7 +4079,7 @@ async def get_racket_targets(current_user: dict = Depends(get_current_user)):
         properties = await db.user_properties.find({"user_id": user_id}, {"_id": 0}).to_list(100)
         property_details = []
         for up in properties:
-            prop = await db.properties.find_one({"id": up["property_id"]}, {"_id": 0})
+            prop = cat.properties.get(up["property_id"])
             if prop:
                 level = up.get("level", 1)
                 revenue_12h = prop["income_per_hour"] * level * PROPERTY_ATTACK_HOURS
@@ -3994,17 +4104,18 @@ async def get_racket_targets(current_user: dict = Depends(get_current_user)):
 
 # Weapons endpoints
 @api_router.get("/weapons", response_model=List[WeaponResponse])
-async def get_weapons(current_user: dict = Depends(get_current_user)):
-    weapons = await db.weapons.find({}, {"_id": 0}).to_list(100)
+async def get_weapons(request: Request, current_user: dict = Depends(get_current_user)):
+    weapons = catalog.current().weapon_list
     user_weapons = await db.user_weapons.find({"user_id": current_user["id"]}, {"_id": 0}).to_list(100)
     
     weapons_map = {uw["weapon_id"]: uw["quantity"] for uw in user_weapons}
     equipped_weapon_id = current_user.get("equipped_weapon_id")
     if equipped_weapon_id and weapons_map.get(equipped_weapon_id, 0) <= 0:
         # Clear invalid equipped weapon (no longer owned)
+        owned_ids = {wid for wid, qty in weapons_map.items() if qty > 0}
         await db.users.update_one(
             {"id": current_user["id"]},
-            {"$set": {"equipped_weapon_id": None}}
+            {"$set": {"equipped_weapon_id": None, **combat_profile.set_fields(combat_profile.weapon_fields(owned_ids, None, catalog.current()))}}
         )
         equipped_weapon_id = None
     
@@ -4031,7 +4142,7 @@ async def get_weapons(current_user: dict = Depends(get_current_user)):
             equipped=(quantity > 0 and equipped_weapon_id == weapon["id"])
         ))
     
-    return result
+    return conditional.respond_body(request, result)
 
 @api_router.post("/weapons/equip")
 async def equip_weapon(request: WeaponEquipRequest, current_user: dict = Depends(get_current_user)):
@@ -4048,21 +4159,22 @@ async def equip_weapon(request: WeaponEquipRequest, current_user: dict = Depends
 
     await db.users.update_one(
         {"id": current_user["id"]},
-        {"$set": {"equipped_weapon_id": weapon_id}}
+        {"$set": {"equipped_weapon_id": weapon_id, **combat_profile.set_fields(combat_profile.weapon_fields({weapon_id}, weapon_id, catalog.current()))}}
     )
     return {"message": "Weapon equipped"}
 
 @api_router.post("/weapons/unequip")
 async def unequip_weapon(current_user: dict = Depends(get_current_user)):
+    owned_ids = await combat_profile.owned_weapon_ids(db, current_user["id"])
     await db.users.update_one(
         {"id": current_user["id"]},
-        {"$set": {"equipped_weapon_id": None}}
+        {"$set": {"equipped_weapon_id": None, **combat_profile.set_fields(combat_profile.weapon_fields(owned_ids, None, catalog.current()))}}
     )
     return {"message": "Weapon unequipped"}
 
 @api_router.post("/weapons/{weapon_id}/buy")
 async def buy_weapon(weapon_id: str, request: WeaponBuyRequest, current_user: dict = Depends(get_current_user)):
-    weapon = await db.weapons.find_one({"id": weapon_id}, {"_id": 0})
+    weapon = catalog.current().weapons.get(weapon_id)
     if not weapon:
         raise HTTPException(status_code=404, detail="Weapon not found")
 
@@ -4078,20 +4190,18 @@ async def buy_weapon(weapon_id: str, request: WeaponBuyRequest, current_user: di
         cost = int(weapon["price_money"] * mult)
         if current_user["money"] < cost:
             raise HTTPException(status_code=400, detail="Insufficient money")
-        await db.users.update_one(
-            {"id": current_user["id"]},
-            {"$inc": {"money": -cost}}
-        )
+        updates = {"$inc": {"money": -cost}}
     elif currency == "points":
         if weapon.get("price_points") is None:
             raise HTTPException(status_code=400, detail="This weapon can only be bought with money")
         cost = int(weapon["price_points"] * mult)
         if current_user["points"] < cost:
             raise HTTPException(status_code=400, detail="Insufficient points")
-        await db.users.update_one(
-            {"id": current_user["id"]},
-            {"$inc": {"points": -cost}}
-        )
+        updates = {"$inc": {"points": -cost}}
+    profile_fields = combat_profile.fields_after_gain(current_user.get("combat_profile"), weapon_id, catalog.current())
+    if profile_fields:
+        updates["$set"] = combat_profile.set_fields(profile_fields)
+    await db.users.update_one({"id": current_user["id"]}, updates)
     
     await db.user_weapons.update_one(
         {"user_id": current_user["id"], "weapon_id": weapon_id},
@@ -4104,7 +4214,7 @@ async def buy_weapon(weapon_id: str, request: WeaponBuyRequest, current_user: di
 @api_router.post("/weapons/{weapon_id}/sell")
 async def sell_weapon(weapon_id: str, current_user: dict = Depends(get_current_user)):
     """Sell one unit of a weapon for 50% of its base purchase price. Refunds money or points (same as list price type)."""
-    weapon = await db.weapons.find_one({"id": weapon_id}, {"_id": 0})
+    weapon = catalog.current().weapons.get(weapon_id)
     if not weapon:
         raise HTTPException(status_code=404, detail="Weapon not found")
     uw = await db.user_weapons.find_one({"user_id": current_user["id"], "weapon_id": weapon_id}, {"_id": 0, "quantity": 1})
@@ -4122,15 +4232,25 @@ async def sell_weapon(weapon_id: str, current_user: dict = Depends(get_current_u
         raise HTTPException(status_code=400, detail="Weapon has no sell value")
     # Prefer refunding money if both exist
     if refund_money is not None:
-        await db.users.update_one({"id": current_user["id"]}, {"$inc": {"money": refund_money}})
+        updates = {"$inc": {"money": refund_money}}
         refund_points = None
     else:
-        await db.users.update_one({"id": current_user["id"]}, {"$inc": {"points": refund_points}})
+        updates = {"$inc": {"points": refund_points}}
     new_qty = quantity - 1
+    if new_qty <= 0:
+        # Last one gone: if it was the combat weapon, fall back to the equipped one or the next best
+        equipped_weapon_id = current_user.get("equipped_weapon_id")
+        if weapon_id in (equipped_weapon_id, (current_user.get("combat_profile") or {}).get("weapon_id")):
+            if equipped_weapon_id == weapon_id:
+                equipped_weapon_id = None
+            owned_ids = await combat_profile.owned_weapon_ids(db, current_user["id"]) - {weapon_id}
+            updates["$set"] = {
+                "equipped_weapon_id": equipped_weapon_id,
+                **combat_profile.set_fields(combat_profile.weapon_fields(owned_ids, equipped_weapon_id, catalog.current())),
+            }
+    await db.users.update_one({"id": current_user["id"]}, updates)
     if new_qty <= 0:
         await db.user_weapons.delete_one({"user_id": current_user["id"], "weapon_id": weapon_id})
-        if current_user.get("equipped_weapon_id") == weapon_id:
-            await db.users.update_one({"id": current_user["id"]}, {"$set": {"equipped_weapon_id": None}})
     else:
         await db.user_weapons.update_one(
             {"user_id": current_user["id"], "weapon_id": weapon_id},
@@ -4141,12 +4261,18 @@ async def sell_weapon(weapon_id: str, current_user: dict = Depends(get_current_u
     return {"message": msg + " (50% of purchase price).", "refund_money": refund_money, "refund_points": refund_points}
 
 # Properties endpoints
+# available_income in GET /properties is computed as of the start of the current bucket, so the
+# body (and its ETag) stays the same between polls within one; collecting still pays up to now
+PROPERTY_INCOME_BUCKET_SECONDS = 60
+
 @api_router.get("/properties", response_model=List[PropertyResponse])
-async def get_properties(current_user: dict = Depends(get_current_user)):
-    properties = await db.properties.find({}, {"_id": 0}).to_list(100)
+async def get_properties(request: Request, current_user: dict = Depends(get_current_user)):
+    properties = catalog.current().property_list
     user_properties = await db.user_properties.find({"user_id": current_user["id"]}, {"_id": 0}).to_list(100)
     
     properties_map = {up["property_id"]: up for up in user_properties}
+    now = datetime.now(timezone.utc)
+    income_as_of = now - timedelta(seconds=now.timestamp() % PROPERTY_INCOME_BUCKET_SECONDS)
     
     result = []
     for prop in properties:
@@ -4157,7 +4283,7 @@ async def get_properties(current_user: dict = Depends(get_current_user)):
         available_income = 0
         if owned and "last_collected" in user_prop:
             last_collected = datetime.fromisoformat(user_prop["last_collected"])
-            hours_passed = (datetime.now(timezone.utc) - last_collected).total_seconds() / 3600
+            hours_passed = max(0.0, (income_as_of - last_collected).total_seconds() / 3600)
             available_income = min(hours_passed * prop["income_per_hour"] * level, prop["income_per_hour"] * level * 24)
         
         result.append(PropertyResponse(
@@ -4172,11 +4298,11 @@ async def get_properties(current_user: dict = Depends(get_current_user)):
             available_income=available_income
         ))
     
-    return result
+    return conditional.respond_body(request, result)
 
 @api_router.post("/properties/{property_id}/buy")
 async def buy_property(property_id: str, current_user: dict = Depends(get_current_user)):
-    prop = await db.properties.find_one({"id": property_id}, {"_id": 0})
+    prop = catalog.current().properties.get(property_id)
     if not prop:
         raise HTTPException(status_code=404, detail="Property not found")
     
@@ -4217,7 +4343,7 @@ async def buy_property(property_id: str, current_user: dict = Depends(get_curren
 
 @api_router.post("/properties/{property_id}/collect")
 async def collect_property_income(property_id: str, current_user: dict = Depends(get_current_user)):
-    prop = await db.properties.find_one({"id": property_id}, {"_id": 0})
+    prop = catalog.current().properties.get(property_id)
     if not prop:
         raise HTTPException(status_code=404, detail="Property not found")
     
@@ -4272,7 +4398,7 @@ async def _create_robot_bodyguard_user(owner_user: dict) -> tuple[str, str]:
     for _ in range(80):
         suffix = random.randint(100000, 9999999)
         candidate = f"{base}{suffix}"
-        exists = await db.users.find_one({"username": candidate}, {"_id": 0, "id": 1})
+        exists = await db.users.find_one({"username_lower": username_key(candidate)}, {"_id": 0, "id": 1})
         if not exists:
             username = candidate
             break
@@ -4285,14 +4411,16 @@ async def _create_robot_bodyguard_user(owner_user: dict) -> tuple[str, str]:
         "id": robot_user_id,
         "email": f"{username.lower()}@robot.mafia",
         "username": username,
-        "password_hash": get_password_hash(str(uuid.uuid4())),
+        "username_lower": username_key(username),
+        "password_hash": "",  # robots never log in; no bcrypt
         "rank": int(rank["id"]),
         "money": 0.0,
         "points": 0,
         "rank_points": int(rank_points),
+        "rank_id": int(rank["id"]),
         "bodyguard_slots": 0,
         "bullets": 0,
-        "avatar_url": None,
+        "avatar_hash": None,
         "jail_busts": 0,
         "garage_batch_limit": DEFAULT_GARAGE_BATCH_LIMIT,
         "total_crimes": 0,
@@ -4315,13 +4443,13 @@ async def _create_robot_bodyguard_user(owner_user: dict) -> tuple[str, str]:
         "armour_owned_level_max": 0,
         "equipped_weapon_id": None,
         "kill_inflation": 0.0,
-        "kill_inflation_updated_at": now_iso,
+        "kill_inflation_updated_at": utcnow(),
         "is_dead": False,
         "dead_at": None,
         "points_at_death": None,
         "retrieval_used": False,
-        "last_seen": now_iso,
-        "created_at": now_iso,
+        "last_seen": utcnow(),
+        "created_at": utcnow(),
         "is_npc": True,
         "is_bodyguard": True,
         "bodyguard_owner_id": owner_user["id"],
@@ -4331,32 +4459,18 @@ async def _create_robot_bodyguard_user(owner_user: dict) -> tuple[str, str]:
 
 @api_router.get("/bodyguards", response_model=List[BodyguardResponse])
 async def get_bodyguards(current_user: dict = Depends(get_current_user)):
-    bodyguards = await db.bodyguards.find({"user_id": current_user["id"]}, {"_id": 0}).to_list(10)
+    bodyguards = (await bodyguard_resolver.resolve(db, [current_user["id"]], get_rank_info))[current_user["id"]]
     
     result = []
     for i in range(4):
         bg = next((b for b in bodyguards if b["slot_number"] == i + 1), None)
         if bg:
-            username = None
-            rank_name = None
+            username = bg["username"]
+            rank_name = bg["rank_name"]
             if not bg["is_robot"] and bg.get("bodyguard_user_id"):
-                bg_user = await db.users.find_one(
-                    {"id": bg["bodyguard_user_id"]},
-                    {"_id": 0, "username": 1, "rank_points": 1}
-                )
-                username = bg_user["username"] if bg_user else "Unknown"
-                if bg_user:
-                    _, rank_name = get_rank_info(int(bg_user.get("rank_points", 0) or 0))
+                username = username or "Unknown"
             elif bg["is_robot"]:
                 # Prefer user doc username if we created a real robot user
-                if bg.get("bodyguard_user_id"):
-                    bg_user = await db.users.find_one(
-                        {"id": bg["bodyguard_user_id"]},
-                        {"_id": 0, "username": 1, "rank_points": 1}
-                    )
-                    username = bg_user["username"] if bg_user else None
-                    if bg_user:
-                        _, rank_name = get_rank_info(int(bg_user.get("rank_points", 0) or 0))
                 username = username or bg.get("robot_name") or f"Robot Guard #{i + 1}"
             
             result.append(BodyguardResponse(
@@ -4406,7 +4520,7 @@ async def upgrade_bodyguard_armour(slot: int, current_user: dict = Depends(get_c
         {"$set": {"armour_level": new_level}}
     )
     # Keep the bodyguard user doc armour in sync (affects bullets-to-kill)
-    await db.users.update_one({"id": bg["bodyguard_user_id"]}, {"$set": {"armour_level": new_level}})
+    await db.users.update_one({"id": bg["bodyguard_user_id"]}, {"$set": {"armour_level": new_level, "combat_profile.armour_level": new_level}})
 
     return {"message": f"Upgraded bodyguard armour to level {new_level} for {cost} points", "armour_level": new_level, "cost": cost}
 
@@ -4489,11 +4603,12 @@ async def hire_bodyguard(request: BodyguardHireRequest, current_user: dict = Dep
 
 
 @api_router.get("/events/active")
-async def get_active_event(current_user: dict = Depends(get_current_user)):
+async def get_active_event(request: Request, current_user: dict = Depends(get_current_user)):
     """Current game-wide daily event when enabled; otherwise null. Frontend uses for prices and banners. When all-events-for-testing is on, returns combined event."""
     enabled = await get_events_enabled()
     event = await get_effective_event() if enabled else None
-    return {"event": event, "events_enabled": enabled}
+    # Tagged by content: served from the event cache, and identical on every worker for the same state
+    return conditional.respond_body(request, {"event": event, "events_enabled": enabled}, "catalog")
 
 
 # Flash news: wars, booze prices, daily game event.
@@ -4548,7 +4663,7 @@ async def get_flash_news(current_user: dict = Depends(get_current_user)):
         b_name = fb.get("name") or "?"
         status = w.get("status")
         ended_at = w.get("ended_at")
-        created_at = w.get("created_at") or ""
+        created_at = to_iso(w.get("created_at")) or ""
         if status in ("active", "truce_offered"):
             items.append({
                 "id": w.get("id"),
@@ -4592,21 +4707,9 @@ async def get_flash_news(current_user: dict = Depends(get_current_user)):
 
 
 # Attack endpoints
-def _find_user_by_username_case_insensitive(username_raw: str):
-    """Return a find_one filter for users by username (case-insensitive match)."""
-    raw = (username_raw or "").strip()
-    if not raw:
-        return None
-    pattern = re.compile("^" + re.escape(raw) + "$", re.IGNORECASE)
-    return {"username": pattern}
-
-
 @api_router.post("/attack/search", response_model=AttackSearchResponse)
-async def search_target(request: AttackSearchRequest, current_user: dict = Depends(get_current_user)):
-    # Prune expired searches (24h)
-    cutoff = datetime.now(timezone.utc) - timedelta(hours=24)
-    await db.attacks.delete_many({"attacker_id": current_user["id"], "search_started": {"$lte": cutoff.isoformat()}})
-
+async def search_target(request: AttackSearchRequest, current_user: dict = Depends(get_current_user_profile("combat"))):
+    # Expired searches are removed by the attacks.expires_at TTL index (db_indexes.py)
     user_filter = _find_user_by_username_case_insensitive(request.target_username)
     if not user_filter:
         raise HTTPException(status_code=400, detail="Target username required")
@@ -4627,8 +4730,9 @@ async def search_target(request: AttackSearchRequest, current_user: dict = Depen
             raise HTTPException(status_code=400, detail="You can only attack NPCs you added to your hitlist")
 
     # Allow multiple concurrent attacks, but prevent duplicates for the same target
+    # (expires_at filter: the TTL monitor runs about once a minute)
     existing_attack_for_target = await db.attacks.find_one(
-        {"attacker_id": current_user["id"], "target_id": target["id"], "status": {"$in": ["searching", "found"]}},
+        {"attacker_id": current_user["id"], "target_id": target["id"], "status": {"$in": ["searching", "found"]}, "expires_at": {"$gt": utcnow()}},
         {"_id": 0}
     )
     if existing_attack_for_target:
@@ -4664,15 +4768,16 @@ async def search_target(request: AttackSearchRequest, current_user: dict = Depen
         "target_username": target["username"],
         "note": note,
         "status": "searching",
-        "search_started": now.isoformat(),
-        "found_at": found_at.isoformat(),
-        "expires_at": expires_at.isoformat(),
+        "search_started": now,
+        "found_at": found_at,
+        "expires_at": expires_at,
         # Don't reveal location until found
         "planned_location_state": random.choice(STATES),
         "location_state": None,
         "result": None,
         "rewards": None
     })
+    attack_scheduler.schedule(attack_id, found_at)
     
     return AttackSearchResponse(
         attack_id=attack_id,
@@ -4682,7 +4787,7 @@ async def search_target(request: AttackSearchRequest, current_user: dict = Depen
     )
 
 @api_router.get("/attack/status", response_model=AttackStatusResponse)
-async def get_attack_status(current_user: dict = Depends(get_current_user)):
+async def get_attack_status(current_user: dict = Depends(get_current_user_profile("core"))):
     attack = await db.attacks.find_one(
         {"attacker_id": current_user["id"], "status": {"$in": ["searching", "found", "traveling"]}},
         {"_id": 0}
@@ -4690,18 +4795,8 @@ async def get_attack_status(current_user: dict = Depends(get_current_user)):
     
     if not attack:
         raise HTTPException(status_code=404, detail="No active attack")
-    
-    now = datetime.now(timezone.utc)
-    found_time = datetime.fromisoformat(attack["found_at"])
-    
-    if attack["status"] == "searching" and now >= found_time:
-        new_location = attack.get("location_state") or attack.get("planned_location_state") or random.choice(STATES)
-        await db.attacks.update_one(
-            {"id": attack["id"]},
-            {"$set": {"status": "found", "location_state": new_location}}
-        )
-        attack["status"] = "found"
-        attack["location_state"] = new_location
+    # searching -> found is done by attack_scheduler; this endpoint only reads (a due search shows as found)
+    attack = as_found(attack, utcnow())
     
     can_travel = attack["status"] == "found" and attack.get("location_state") and current_user["current_state"] != attack["location_state"]
     can_attack = attack["status"] == "found" and attack.get("location_state") and current_user["current_state"] == attack["location_state"]
@@ -4726,46 +4821,26 @@ async def get_attack_status(current_user: dict = Depends(get_current_user)):
     )
 
 @api_router.get("/attack/list")
-async def list_attacks(current_user: dict = Depends(get_current_user)):
+async def list_attacks(current_user: dict = Depends(get_current_user_profile("core"))):
     """List all active attacks for the current user (searching/found)."""
-    now = datetime.now(timezone.utc)
-    cutoff = now - timedelta(hours=24)
+    with query_counter.query_budget("list_attacks", LIST_ATTACKS_MAX_QUERIES):
+        return await _list_attacks(current_user)
 
-    # Prune expired searches (new docs have expires_at, legacy fallback uses search_started)
-    await db.attacks.delete_many({"attacker_id": current_user["id"], "expires_at": {"$lte": now.isoformat()}})
 
+async def _list_attacks(current_user: dict) -> dict:
+    now = datetime.now(timezone.utc)
+
+    # Transitions and expiry are done by attack_scheduler (TTL index as backstop); this endpoint only reads
     attacks = await db.attacks.find(
-        {"attacker_id": current_user["id"], "status": {"$in": ["searching", "found"]}},
+        {"attacker_id": current_user["id"], "status": {"$in": ["searching", "found"]}, "expires_at": {"$gt": now}},
         {"_id": 0}
     ).sort("search_started", -1).to_list(50)
+    attacks = [as_found(a, now) for a in attacks]
+    # Bodyguards for every found target in one round trip (plus one for their users)
+    found_target_ids = {a["target_id"] for a in attacks if a["status"] == "found" and a.get("target_id")}
+    target_bodyguards = await bodyguard_resolver.resolve(db, found_target_ids, get_rank_info)
     items = []
     for attack in attacks:
-        # Legacy expiry fallback (no expires_at)
-        if not attack.get("expires_at"):
-            started_iso = attack.get("search_started") or attack.get("found_at")
-            try:
-                started = datetime.fromisoformat(started_iso) if started_iso else None
-                if started and started.tzinfo is None:
-                    started = started.replace(tzinfo=timezone.utc)
-            except Exception:
-                started = None
-            if started and started <= cutoff:
-                await db.attacks.delete_one({"id": attack["id"], "attacker_id": current_user["id"]})
-                continue
-            if started:
-                await db.attacks.update_one(
-                    {"id": attack["id"], "attacker_id": current_user["id"]},
-                    {"$set": {"expires_at": (started + timedelta(hours=24)).isoformat()}}
-                )
-
-        if attack["status"] == "searching":
-            found_time = datetime.fromisoformat(attack["found_at"])
-            if now >= found_time:
-                new_location = attack.get("location_state") or attack.get("planned_location_state") or random.choice(STATES)
-                await db.attacks.update_one({"id": attack["id"]}, {"$set": {"status": "found", "location_state": new_location}})
-                attack["status"] = "found"
-                attack["location_state"] = new_location
-
         can_travel = attack["status"] == "found" and attack.get("location_state") and current_user["current_state"] != attack["location_state"]
         can_attack = attack["status"] == "found" and attack.get("location_state") and current_user["current_state"] == attack["location_state"]
 
@@ -4794,17 +4869,11 @@ async def list_attacks(current_user: dict = Depends(get_current_user)):
         }
         # For found attacks, include first bodyguard so UI can show "has bodyguard in slot N, kill them first"
         if attack["status"] == "found" and attack.get("target_id"):
-            target_bgs = await db.bodyguards.find({"user_id": attack["target_id"]}, {"_id": 0}).to_list(10)
+            target_bgs = target_bodyguards.get(attack["target_id"]) or []
             if target_bgs:
-                first_bg = max(target_bgs, key=lambda b: b.get("slot_number", 0))
-                search_username = None
-                display_name = first_bg.get("robot_name") or "bodyguard"
-                if first_bg.get("bodyguard_user_id"):
-                    bg_user = await db.users.find_one({"id": first_bg["bodyguard_user_id"]}, {"_id": 0, "username": 1})
-                    if bg_user:
-                        search_username = bg_user.get("username")
-                        if not first_bg.get("robot_name"):
-                            display_name = search_username
+                first_bg = target_bgs[-1]  # highest slot is fought first
+                search_username = first_bg["username"]
+                display_name = first_bg.get("robot_name") or search_username or "bodyguard"
                 slot_n = first_bg.get("slot_number")
                 item["first_bodyguard"] = {"display_name": display_name, "search_username": search_username, "slot_number": slot_n}
                 item["bodyguard_count"] = len(target_bgs)
@@ -4813,7 +4882,7 @@ async def list_attacks(current_user: dict = Depends(get_current_user)):
     return {"attacks": items}
 
 @api_router.post("/attack/delete")
-async def delete_attacks(request: AttackDeleteRequest, current_user: dict = Depends(get_current_user)):
+async def delete_attacks(request: AttackDeleteRequest, current_user: dict = Depends(get_current_user_profile("core"))):
     ids = [x for x in (request.attack_ids or []) if isinstance(x, str) and x.strip()]
     ids = list(dict.fromkeys(ids))  # dedupe
     if not ids:
@@ -4890,13 +4959,13 @@ async def hitlist_add(request: HitlistAddRequest, current_user: dict = Depends(g
         if cost_points > 0 and (current_user.get("points") or 0) < cost_points:
             raise HTTPException(status_code=400, detail=f"Insufficient points (need {cost_points:,})")
 
-    target = await db.users.find_one({"username": target_username}, {"_id": 0, "id": 1, "username": 1, "is_dead": 1})
+    target = await db.users.find_one(_find_user_by_username_case_insensitive(target_username), {"_id": 0, "id": 1, "username": 1, "is_dead": 1})
     if not target:
         raise HTTPException(status_code=404, detail="Target user not found")
     if target.get("is_dead"):
         raise HTTPException(status_code=400, detail="Cannot place bounty on a dead account")
     if target_type == "bodyguards":
-        bgs = await db.bodyguards.find({"user_id": target["id"]}, {"_id": 0}).to_list(10)
+        bgs = (await bodyguard_resolver.resolve(db, [target["id"]], get_rank_info, with_users=False))[target["id"]]
         if not any(b.get("bodyguard_user_id") or b.get("is_robot") for b in bgs):
             raise HTTPException(status_code=400, detail="Target has no bodyguards")
 
@@ -4925,7 +4994,7 @@ async def hitlist_add(request: HitlistAddRequest, current_user: dict = Depends(g
                 "reward_type": "cash",
                 "reward_amount": reward_cash,
                 "hidden": hidden,
-                "created_at": now.isoformat(),
+                "created_at": now,
             })
             inserted.append(f"${reward_cash:,} cash")
         if reward_points > 0:
@@ -4940,7 +5009,7 @@ async def hitlist_add(request: HitlistAddRequest, current_user: dict = Depends(g
                 "reward_type": "points",
                 "reward_amount": reward_points,
                 "hidden": hidden,
-                "created_at": now.isoformat(),
+                "created_at": now,
             })
             inserted.append(f"{reward_points:,} pts")
         msg = f"Bounty placed on {target['username']} ({target_type}): " + " + ".join(inserted) + (" (hidden)" if hidden else "")
@@ -4958,7 +5027,7 @@ async def hitlist_add(request: HitlistAddRequest, current_user: dict = Depends(g
             "reward_type": reward_type,
             "reward_amount": reward_amount,
             "hidden": hidden,
-            "created_at": now.isoformat(),
+            "created_at": now,
         })
         msg = f"Bounty placed on {target['username']} ({target_type}) for {reward_amount} {reward_type}" + (" (hidden)" if hidden else "")
     return {"message": msg}
@@ -4970,18 +5039,13 @@ async def hitlist_npc_status(current_user: dict = Depends(get_current_user)):
     now = datetime.now(timezone.utc)
     window_start = now - timedelta(hours=HITLIST_NPC_COOLDOWN_HOURS)
     # Per-user timestamps (stored on user doc); each user has their own window
-    timestamps = (current_user.get("hitlist_npc_add_timestamps") or [])[:]
-    timestamps = [t for t in timestamps if t and (datetime.fromisoformat(t.replace("Z", "+00:00")) if isinstance(t, str) else t) > window_start]
+    timestamps = [to_datetime(t) for t in (current_user.get("hitlist_npc_add_timestamps") or [])]
+    timestamps = [t for t in timestamps if t and t > window_start]
     adds_in_window = len(timestamps)
     can_add = adds_in_window < HITLIST_NPC_MAX_PER_WINDOW
     next_add_at = None
     if not can_add and timestamps:
-        oldest = min(timestamps, key=lambda t: datetime.fromisoformat(t.replace("Z", "+00:00")) if isinstance(t, str) else t)
-        try:
-            oldest_dt = datetime.fromisoformat(oldest.replace("Z", "+00:00"))
-            next_add_at = (oldest_dt + timedelta(hours=HITLIST_NPC_COOLDOWN_HOURS)).isoformat()
-        except Exception:
-            pass
+        next_add_at = (min(timestamps) + timedelta(hours=HITLIST_NPC_COOLDOWN_HOURS)).isoformat()
     return {
         "can_add": can_add,
         "adds_used_in_window": adds_in_window,
@@ -4997,8 +5061,8 @@ async def hitlist_add_npc(current_user: dict = Depends(get_current_user)):
     now = datetime.now(timezone.utc)
     window_start = now - timedelta(hours=HITLIST_NPC_COOLDOWN_HOURS)
     # Use this user's timestamps only (per-user limit; other users have their own)
-    timestamps = list(current_user.get("hitlist_npc_add_timestamps") or [])
-    timestamps = [t for t in timestamps if t and (datetime.fromisoformat(t.replace("Z", "+00:00")) if isinstance(t, str) else t) > window_start]
+    timestamps = [to_datetime(t) for t in (current_user.get("hitlist_npc_add_timestamps") or [])]
+    timestamps = [t for t in timestamps if t and t > window_start]
     if len(timestamps) >= HITLIST_NPC_MAX_PER_WINDOW:
         raise HTTPException(
             status_code=400,
@@ -5007,7 +5071,6 @@ async def hitlist_add_npc(current_user: dict = Depends(get_current_user)):
     template = random.choice(HITLIST_NPC_TEMPLATES)
     hitlist_id = str(uuid.uuid4())
     npc_user_id = str(uuid.uuid4())
-    now_iso = now.isoformat()
     rewards = template.get("rewards") or {}
     rank_id = max(1, min(template.get("rank", 1), len(RANKS)))
     rank_points = RANKS[rank_id - 1]["required_points"]
@@ -5018,11 +5081,13 @@ async def hitlist_add_npc(current_user: dict = Depends(get_current_user)):
     await db.users.insert_one({
         "id": npc_user_id,
         "username": npc_username,
+        "username_lower": username_key(npc_username),
         "email": f"npc.{npc_user_id}@hitlist.local",
         "password_hash": "",
         "is_npc": True,
         "is_dead": False,
         "rank_points": rank_points,
+        "rank_id": rank_id,
         "money": 0,
         "points": 0,
         "bullets": 0,
@@ -5031,7 +5096,7 @@ async def hitlist_add_npc(current_user: dict = Depends(get_current_user)):
         "current_state": random.choice(STATES),
         "total_kills": 0,
         "total_deaths": 0,
-        "created_at": now_iso,
+        "created_at": now,
     })
     await db.hitlist.insert_one({
         "id": hitlist_id,
@@ -5046,9 +5111,9 @@ async def hitlist_add_npc(current_user: dict = Depends(get_current_user)):
         "npc_rank": rank_id,
         "npc_template_id": template.get("id", ""),
         "npc_rewards": dict(rewards),
-        "created_at": now_iso,
+        "created_at": now,
     })
-    timestamps.append(now_iso)
+    timestamps.append(now)
     await db.users.update_one(
         {"id": current_user["id"]},
         {"$set": {"hitlist_npc_add_timestamps": timestamps[-10:]}}
@@ -5168,7 +5233,7 @@ async def hitlist_buy_off_user(request: HitlistBuyOffUserRequest, current_user:
     target_username = (request.target_username or "").strip()
     if not target_username:
         raise HTTPException(status_code=400, detail="Target username required")
-    target = await db.users.find_one({"username": target_username}, {"_id": 0, "id": 1, "username": 1})
+    target = await db.users.find_one(_find_user_by_username_case_insensitive(target_username), {"_id": 0, "id": 1, "username": 1})
     if not target:
         raise HTTPException(status_code=404, detail="User not found")
     if target["id"] == current_user["id"]:
@@ -5239,13 +5304,15 @@ async def hitlist_reveal(current_user: dict = Depends(get_current_user)):
 
 @api_router.post("/attack/travel")
 async def travel_to_target(request: AttackIdRequest, current_user: dict = Depends(get_current_user)):
+    now = utcnow()
     attack = await db.attacks.find_one(
-        {"attacker_id": current_user["id"], "status": "found", "id": request.attack_id},
+        {"attacker_id": current_user["id"], "id": request.attack_id, **found_query(now)},
         {"_id": 0}
     )
     
     if not attack:
         raise HTTPException(status_code=404, detail="No target found to travel to")
+    attack = as_found(attack, now)
     
     await db.users.update_one(
         {"id": current_user["id"]},
@@ -5254,29 +5321,12 @@ async def travel_to_target(request: AttackIdRequest, current_user: dict = Depend
     
     return {"message": f"Traveled to {attack['location_state']}"}
 
-async def _best_weapon_for_user(user_id: str, equipped_weapon_id: str | None = None) -> tuple[int, str]:
-    """
-    Return (damage, weapon_name) for combat.
-    If equipped_weapon_id is provided and owned, use it; otherwise fall back to best owned.
-    """
-    user_weapons = await db.user_weapons.find({"user_id": user_id, "quantity": {"$gt": 0}}, {"_id": 0}).to_list(100)
-    weapons_list = await db.weapons.find({}, {"_id": 0, "id": 1, "damage": 1, "name": 1}).to_list(200)
-
-    owned_ids = {uw.get("weapon_id") for uw in user_weapons}
-    if equipped_weapon_id and equipped_weapon_id in owned_ids:
-        w = next((x for x in weapons_list if x.get("id") == equipped_weapon_id), None)
-        if w:
-            return int(w.get("damage", 5) or 5), (w.get("name") or "Weapon")
-
-    best_damage = 5
-    best_name = "Brass Knuckles"
-    for uw in user_weapons:
-        w = next((x for x in weapons_list if x.get("id") == uw.get("weapon_id")), None)
-        dmg = int(w.get("damage", 0) or 0) if w else 0
-        if dmg > best_damage:
-            best_damage = dmg
-            best_name = w.get("name") or best_name
-    return best_damage, best_name
+def _rank_id_of(rank_points) -> int:
+    return get_rank_info(rank_points)[0]
+
+async def _combat_profile(user: dict) -> dict:
+    """users.combat_profile for a loaded user (weapon, rank, armour); built on first use. See combat_profile.py."""
+    return await combat_profile.for_user(db, user, catalog.current(), _rank_id_of)
 
 def _bullets_to_kill(
     target_armour_level: int,
@@ -5285,7 +5335,7 @@ def _bullets_to_kill(
     attacker_rank_id: int,
 ) -> int:
     """
-    Bullets required to kill target (clamped 5k–100k).
+    Bullets required to kill target, from the precomputed table (formula: bullet_table.breakdown).
 
     Design goals:
     - Higher target rank => more bullets needed.
@@ -5293,27 +5343,7 @@ def _bullets_to_kill(
     - Higher attacker weapon/rank => fewer bullets needed.
     - Big rank gaps still stay expensive (e.g. Goon vs Godfather >= 30k+ even with best weapon).
     """
-    arm = min(max(0, int(target_armour_level or 0)), 5)
-    tr = min(max(1, int(target_rank_id or 1)), 11)
-    ar = min(max(1, int(attacker_rank_id or 1)), 11)
-    dmg = max(5, int(attacker_weapon_damage or 5))
-
-    base = ARMOUR_BASE_BULLETS.get(arm, MIN_BULLETS_TO_KILL)
-
-    # Defender scaling (rank + rank gap)
-    gap = max(0, tr - ar)
-    rank_factor = 1.0 + (tr - 1) * 0.20          # up to 3.0x at rank 11
-    gap_factor = 1.0 + gap * 0.60                # big gaps hurt a lot
-
-    # Attacker reductions (weapon + rank)
-    weapon_factor = 1.0 + (dmg / 140.0)          # best weapon ~1.85x
-    attacker_factor = 1.0 + (ar - 1) * 0.05      # rank 11 ~1.5x
-
-    needed_raw = (base * rank_factor * gap_factor) / weapon_factor / attacker_factor
-
-    needed_i = int(math.ceil(needed_raw))
-    # No artificial floor and no max cap (per request).
-    return max(1, needed_i)
+    return bullets_table.lookup(target_armour_level, target_rank_id, attacker_weapon_damage, attacker_rank_id)
 
 def _bullets_to_kill_breakdown(
     target_armour_level: int,
@@ -5322,91 +5352,22 @@ def _bullets_to_kill_breakdown(
     attacker_rank_id: int,
 ) -> dict:
     """Same logic as _bullets_to_kill, but returns a breakdown for UI/debug."""
-    arm = min(max(0, int(target_armour_level or 0)), 5)
-    tr = min(max(1, int(target_rank_id or 1)), 11)
-    ar = min(max(1, int(attacker_rank_id or 1)), 11)
-    dmg = max(5, int(attacker_weapon_damage or 5))
-
-    base = ARMOUR_BASE_BULLETS.get(arm, MIN_BULLETS_TO_KILL)
-    gap = max(0, tr - ar)
-    rank_factor = 1.0 + (tr - 1) * 0.20
-    gap_factor = 1.0 + gap * 0.60
-    weapon_factor = 1.0 + (dmg / 140.0)
-    attacker_factor = 1.0 + (ar - 1) * 0.05
-
-    needed_raw = (base * rank_factor * gap_factor) / weapon_factor / attacker_factor
-    needed_before_clamp = int(math.ceil(needed_raw))
-    bullets_required = max(1, needed_before_clamp)
-
-    return {
-        "base_from_armour": base,
-        "rank_factor": round(rank_factor, 3),
-        "gap_factor": round(gap_factor, 3),
-        "weapon_factor": round(weapon_factor, 3),
-        "attacker_factor": round(attacker_factor, 3),
-        "rank_gap": gap,
-        "needed_raw": needed_raw,
-        "needed_before_clamp": needed_before_clamp,
-        "bullets_required": bullets_required,
-    }
+    return bullet_table.breakdown(
+        ARMOUR_BASE_BULLETS, MIN_BULLETS_TO_KILL, target_armour_level, target_rank_id, attacker_weapon_damage, attacker_rank_id
+    )
 
-async def _apply_kill_inflation_decay(user_id: str) -> float:
+def _kill_inflation(user: dict) -> float:
     """
-    Inflation system:
+    Inflation system (kill_inflation.py):
     - Each kill increases inflation by ~2–4% (handled elsewhere).
-    - If no kills happen, inflation decays by ~2–6% per hour.
+    - If no kills happen, inflation decays by 4% (mean of the old 2–6% draw) per whole hour.
     - No upper limit.
+    Computed from the stored value + timestamp; never writes.
     """
-    now = datetime.now(timezone.utc)
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "kill_inflation": 1, "kill_inflation_updated_at": 1})
-    if not user:
-        return 0.0
-
-    inflation = float(user.get("kill_inflation", 0.0) or 0.0)
-    updated_at_iso = user.get("kill_inflation_updated_at")
-    if not updated_at_iso:
-        await db.users.update_one({"id": user_id}, {"$set": {"kill_inflation_updated_at": now.isoformat()}})
-        return inflation
-
-    try:
-        updated_at = datetime.fromisoformat(updated_at_iso)
-        if updated_at.tzinfo is None:
-            updated_at = updated_at.replace(tzinfo=timezone.utc)
-    except Exception:
-        await db.users.update_one({"id": user_id}, {"$set": {"kill_inflation_updated_at": now.isoformat()}})
-        return inflation
-
-    hours = int((now - updated_at).total_seconds() // 3600)
-    if hours <= 0 or inflation <= 0:
-        return inflation
-
-    new_inflation = inflation
-    for _ in range(hours):
-        new_inflation = max(0.0, new_inflation - random.uniform(0.02, 0.06))
-
-    if abs(new_inflation - inflation) > 1e-9:
-        await db.users.update_one(
-            {"id": user_id},
-            {"$set": {"kill_inflation": new_inflation, "kill_inflation_updated_at": (updated_at + timedelta(hours=hours)).isoformat()}}
-        )
-    return new_inflation
-
-async def _increase_kill_inflation_on_kill(user_id: str) -> float:
-    """Increase inflation by 2–4% on a successful kill."""
-    now = datetime.now(timezone.utc)
-    inc = random.uniform(0.02, 0.04)
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "kill_inflation": 1})
-    cur = float(user.get("kill_inflation", 0.0) or 0.0) if user else 0.0
-    new = cur + inc
-    await db.users.update_one(
-        {"id": user_id},
-        {"$set": {"kill_inflation": new, "kill_inflation_updated_at": now.isoformat()}}
-    )
-    return new
-
+    return kill_inflation.effective(user)
 
 @api_router.post("/attack/bullets/calc")
-async def calc_bullets(request: BulletCalcRequest, current_user: dict = Depends(get_current_user)):
+async def calc_bullets(request: BulletCalcRequest, current_user: dict = Depends(get_current_user_profile("combat"))):
     """Bullet calculator helper for UI (does not spend bullets)."""
     user_filter = _find_user_by_username_case_insensitive(request.target_username)
     if not user_filter:
@@ -5417,15 +5378,14 @@ async def calc_bullets(request: BulletCalcRequest, current_user: dict = Depends(
     if target.get("is_dead"):
         raise HTTPException(status_code=400, detail="Target is dead")
 
-    attacker_rank_id, attacker_rank_name = get_rank_info(current_user.get("rank_points", 0))
+    profile = await _combat_profile(current_user)
+    attacker_rank_id = profile["rank_id"]
+    attacker_rank_name = RANKS[attacker_rank_id - 1]["name"]
     target_rank_id, target_rank_name = get_rank_info(target.get("rank_points", 0))
     target_armour = int(target.get("armour_level", 0) or 0)
 
-    inflation = await _apply_kill_inflation_decay(current_user["id"])
-    best_damage, best_weapon_name = await _best_weapon_for_user(
-        current_user["id"],
-        current_user.get("equipped_weapon_id")
-    )
+    inflation = _kill_inflation(current_user)
+    best_damage, best_weapon_name = profile["weapon_damage"], profile["weapon_name"]
 
     breakdown = _bullets_to_kill_breakdown(target_armour, target_rank_id, best_damage, attacker_rank_id)
     bullets_base = int(breakdown["bullets_required"])
@@ -5447,10 +5407,68 @@ async def calc_bullets(request: BulletCalcRequest, current_user: dict = Depends(
         "needed_before_clamp": breakdown["needed_before_clamp"],
     }
 
+@api_router.post("/attack/bullets/calc-bulk")
+async def calc_bullets_bulk(request: BulletCalcBulkRequest, current_user: dict = Depends(get_current_user_profile("combat"))):
+    """Bullet calculator for many targets at once (does not spend bullets). One users query for all targets."""
+    keys = list(dict.fromkeys(k for k in (username_key(u) for u in request.target_usernames) if k))
+    if not keys:
+        raise HTTPException(status_code=400, detail="At least one target username required")
+    if len(keys) > BULLET_CALC_BULK_MAX_TARGETS:
+        raise HTTPException(status_code=400, detail=f"At most {BULLET_CALC_BULK_MAX_TARGETS} targets per request")
+
+    targets, profile = await asyncio.gather(
+        db.users.find(
+            {"username_lower": {"$in": keys}},
+            {"_id": 0, "username": 1, "username_lower": 1, "rank_points": 1, "armour_level": 1, "is_dead": 1},
+        ).to_list(len(keys)),
+        _combat_profile(current_user),
+    )
+    inflation = _kill_inflation(current_user)
+    by_key = {t["username_lower"]: t for t in targets}
+    attacker_rank_id = profile["rank_id"]
+
+    found, not_found, dead = [], [], []
+    for key in keys:
+        target = by_key.get(key)
+        if not target:
+            not_found.append(key)
+        elif target.get("is_dead"):
+            dead.append(target["username"])
+        else:
+            found.append((target, *get_rank_info(target.get("rank_points", 0))))
+    bullets = bullets_table.bulk(
+        ((int(t.get("armour_level", 0) or 0), rank_id) for t, rank_id, _ in found),
+        profile["weapon_damage"],
+        attacker_rank_id,
+        inflation,
+    )
+
+    return {
+        "attacker_rank": attacker_rank_id,
+        "attacker_rank_name": RANKS[attacker_rank_id - 1]["name"],
+        "weapon_name": profile["weapon_name"],
+        "weapon_damage": profile["weapon_damage"],
+        "inflation": inflation,
+        "inflation_pct": int(round(inflation * 100)),
+        "targets": [
+            {
+                "target_username": t["username"],
+                "target_rank": rank_id,
+                "target_rank_name": rank_name,
+                "target_armour_level": int(t.get("armour_level", 0) or 0),
+                "bullets_required": required,
+                "bullets_base": base,
+            }
+            for (t, rank_id, rank_name), (base, required) in zip(found, bullets)
+        ],
+        "not_found": not_found,
+        "dead": dead,
+    }
+
 @api_router.get("/attack/inflation")
-async def get_attack_inflation(current_user: dict = Depends(get_current_user)):
+async def get_attack_inflation(current_user: dict = Depends(get_current_user_profile("combat"))):
     """Get current inflation % (decayed)."""
-    inflation = await _apply_kill_inflation_decay(current_user["id"])
+    inflation = _kill_inflation(current_user)
     return {
         "inflation": inflation,
         "inflation_pct": int(round(inflation * 100)),
@@ -5458,44 +5476,56 @@ async def get_attack_inflation(current_user: dict = Depends(get_current_user)):
 
 
 @api_router.post("/attack/execute", response_model=AttackExecuteResponse)
-async def execute_attack(request: AttackExecuteRequest, current_user: dict = Depends(get_current_user)):
+async def execute_attack(request: AttackExecuteRequest, current_user: dict = Depends(get_current_user_profile("combat"))):
+    followups = []
+    with query_counter.query_budget("execute_attack", EXECUTE_ATTACK_MAX_QUERIES):
+        response = await _execute_attack(request, current_user, followups)
+    # Family war bookkeeping runs after the kill is settled and outside its query budget
+    for followup in followups:
+        await followup
+    return response
+
+
+async def _execute_attack(request: AttackExecuteRequest, current_user: dict, followups: list) -> AttackExecuteResponse:
+    now = utcnow()
     attack = await db.attacks.find_one(
-        {"attacker_id": current_user["id"], "status": "found", "id": request.attack_id},
+        {"attacker_id": current_user["id"], "id": request.attack_id, **found_query(now)},
         {"_id": 0}
     )
-    
+
     if not attack:
         raise HTTPException(status_code=404, detail="No active attack to execute")
-    
+    attack = as_found(attack, now)
+
     if current_user["current_state"] != attack["location_state"]:
         raise HTTPException(status_code=400, detail="You must travel to the target's location first")
-    
-    target = await db.users.find_one({"id": attack["target_id"]}, {"_id": 0})
+
+    # Independent reads in one round: target and its bodyguards (attacker's weapon/inflation come from current_user)
+    target, target_bodyguards, profile = await asyncio.gather(
+        db.users.find_one({"id": attack["target_id"]}, {"_id": 0}),
+        db.bodyguards.find({"user_id": attack["target_id"]}, {"_id": 0}).to_list(10),
+        _combat_profile(current_user),
+    )
+    inflation = _kill_inflation(current_user)
+    best_damage, best_weapon_name = profile["weapon_damage"], profile["weapon_name"]
     if not target:
         raise HTTPException(status_code=404, detail="Target not found")
     if target.get("is_dead"):
         raise HTTPException(status_code=400, detail="Target is already dead")
-    
+
     target_armour = target.get("armour_level", 0)
-    attacker_rank_id, _ = get_rank_info(current_user.get("rank_points", 0))
-    target_rank_id, _ = get_rank_info(target.get("rank_points", 0))
+    attacker_rank_id = profile["rank_id"]
+    target_rank_id, target_rank_name = get_rank_info(target.get("rank_points", 0))
     attacker_bullets = current_user.get("bullets", 0)
-    
-    # Best weapon attacker has (by damage)
-    best_damage, best_weapon_name = await _best_weapon_for_user(
-        current_user["id"],
-        current_user.get("equipped_weapon_id")
-    )
-    inflation = await _apply_kill_inflation_decay(current_user["id"])
+
     bullets_base = _bullets_to_kill(target_armour, target_rank_id, best_damage, attacker_rank_id)
     bullets_required = int(math.ceil(bullets_base * (1.0 + inflation)))
-    
+
     if attacker_bullets <= 0:
         raise HTTPException(status_code=400, detail="You need bullets to attack.")
 
     # If target has bodyguards, do not execute — tell frontend to show message and offer search for bodyguard
     # Use highest slot first (4 → 3 → 2 → 1) so attacker must kill slot 4, then 3, then 2, then 1
-    target_bodyguards = await db.bodyguards.find({"user_id": target["id"]}, {"_id": 0}).to_list(10)
     if target_bodyguards:
         first_bg = max(target_bodyguards, key=lambda b: b.get("slot_number", 0))
         display_name = first_bg.get("robot_name") or "bodyguard"
@@ -5523,21 +5553,28 @@ async def execute_attack(request: AttackExecuteRequest, current_user: dict = Dep
             rewards=None,
             first_bodyguard={"display_name": display_name or "bodyguard", "search_username": None, "slot_number": slot_n},
         )
-    
+
     target_name = target["username"]
-    target_health = float(target.get("health", DEFAULT_HEALTH))
     # Require player to specify how many bullets to use (at least 1)
     if not request.bullets_to_use or request.bullets_to_use < 1:
         raise HTTPException(status_code=400, detail="You must enter how many bullets to use (at least 1).")
     bullets_used = min(request.bullets_to_use, attacker_bullets, bullets_required)
     health_dealt_pct = (bullets_used / bullets_required) * 100.0
-    killed = health_dealt_pct >= target_health
-    
-    # Spend bullets used
-    await db.users.update_one(
-        {"id": current_user["id"]},
-        {"$inc": {"bullets": -bullets_used}}
+    now_iso = datetime.now(timezone.utc).isoformat()
+
+    # Deal the damage in one atomic update against the stored health (racing attackers on any
+    # worker each subtract from what the last one left); the same update kills the target when
+    # health runs out, so only one of them claims the kill. Decide from the health it saw.
+    victim_before = await db.users.find_one_and_update(
+        {"id": target["id"], "is_dead": {"$ne": True}},
+        _attack_damage_pipeline(health_dealt_pct, now_iso),
+        projection={"_id": 0, "health": 1, "money": 1},
+        return_document=ReturnDocument.BEFORE,
     )
+    if not victim_before:
+        raise HTTPException(status_code=400, detail="Target is already dead")
+    target_health = float(victim_before.get("health", DEFAULT_HEALTH))
+    killed = health_dealt_pct >= target_health
 
     # Record the attempt (success/fail) for history page
     attempt_base = {
@@ -5555,292 +5592,331 @@ async def execute_attack(request: AttackExecuteRequest, current_user: dict = Dep
         "target_armour_level": int(target_armour or 0),
         "target_rank_id": int(target_rank_id or 1),
         "attacker_rank_id": int(attacker_rank_id or 1),
-        "created_at": datetime.now(timezone.utc).isoformat(),
+        "created_at": utcnow(),
     }
 
-    if killed:
-        death_message = (request.death_message or "").strip()
-        make_public = bool(request.make_public)
-
-        # Increase inflation on successful kill
-        await _increase_kill_inflation_on_kill(current_user["id"])
-        killer_id = current_user["id"]
-        victim_id = target["id"]
-
-        # NPC hitlist target: grant npc_rewards from hitlist entry, then remove entry and mark NPC dead
-        if target.get("is_npc"):
-            hitlist_entry = await db.hitlist.find_one({"target_id": victim_id, "target_type": "npc"}, {"_id": 0, "npc_rewards": 1})
-            if hitlist_entry:
-                rewards = hitlist_entry.get("npc_rewards") or {}
-                inc = {"money": int(rewards.get("cash", 0) or 0), "points": int(rewards.get("points", 0) or 0), "rank_points": int(rewards.get("rank_points", 0) or 0), "bullets": int(rewards.get("bullets", 0) or 0), "total_kills": 1}
-                booze = rewards.get("booze")
-                if isinstance(booze, dict) and booze:
-                    booze_ids = [b["id"] for b in BOOZE_TYPES]
-                    for bid, amt in booze.items():
-                        if bid in booze_ids and amt and int(amt) > 0:
-                            inc[f"booze_carrying.{bid}"] = int(amt)
-                            inc[f"booze_carrying_cost.{bid}"] = 0
-                if inc:
-                    await db.users.update_one({"id": killer_id}, {"$inc": inc})
-                car_id = (rewards.get("car_id") or "").strip()
-                if car_id and next((c for c in CARS if c.get("id") == car_id), None):
-                    await db.user_cars.insert_one({"id": str(uuid.uuid4()), "user_id": killer_id, "car_id": car_id, "acquired_at": datetime.now(timezone.utc).isoformat()})
-                await db.hitlist.delete_one({"target_id": victim_id, "target_type": "npc"})
-                now_iso = datetime.now(timezone.utc).isoformat()
-                await db.users.update_one({"id": victim_id}, {"$set": {"is_dead": True, "dead_at": now_iso, "money": 0, "health": 0}, "$inc": {"total_deaths": 1}})
-                await db.attacks.update_one({"id": attack["id"]}, {"$set": {"status": "completed", "result": "success", "rewards": rewards}})
-                reward_parts = []
-                if inc.get("money"): reward_parts.append(f"${inc['money']:,} cash")
-                if inc.get("points"): reward_parts.append(f"{inc['points']} pts")
-                if inc.get("rank_points"): reward_parts.append(f"{inc['rank_points']} RP")
-                if inc.get("bullets"): reward_parts.append(f"{inc['bullets']} bullets")
-                if car_id: reward_parts.append("a car")
-                if isinstance(booze, dict) and booze: reward_parts.append("booze")
-                success_message = f"You killed {target_name}! (NPC) You got: " + ", ".join(reward_parts) + "."
-                try:
-                    await db.attack_attempts.insert_one({
-                        **attempt_base,
-                        "outcome": "killed",
-                        "death_message": death_message or None,
-                        "make_public": False,
-                        "rewards": rewards,
-                        "target_health_before": target_health,
-                        "target_health_after": 0.0,
-                        "is_npc_kill": True,
-                    })
-                except Exception:
-                    pass
-                return AttackExecuteResponse(success=True, message=success_message, rewards=rewards)
-
-        victim_money = int(target.get("money", 0))
-        cash_loot = int(victim_money * KILL_CASH_PERCENT)
-        rank_points = 25
-        ev = await get_effective_event()
-        cash_loot = int(cash_loot * ev.get("kill_cash", 1.0))
-        rank_points = int(rank_points * ev.get("rank_points", 1.0))
-        
-        victim_cars = await db.user_cars.find({"user_id": victim_id}, {"_id": 0, "car_id": 1}).to_list(500)
-        victim_props = await db.user_properties.find({"user_id": victim_id}, {"_id": 0, "property_id": 1}).to_list(100)
-        victim_cars_count = len(victim_cars)
-        victim_props_count = len(victim_props)
-        
-        exclusive_car_count = 0
-        for uc in victim_cars:
-            car_info = next((c for c in CARS if c["id"] == uc["car_id"]), None)
-            if car_info and car_info.get("rarity") == "exclusive":
-                exclusive_car_count += 1
-        
-        prop_names = []
-        for up in victim_props:
-            p = await db.properties.find_one({"id": up["property_id"]}, {"_id": 0, "name": 1})
-            if p:
-                prop_names.append(p["name"])
-        
-        await db.users.update_one(
-            {"id": killer_id},
-            {"$inc": {"money": cash_loot, "total_kills": 1, "rank_points": rank_points}}
-        )
-        await db.user_cars.update_many({"user_id": victim_id}, {"$set": {"user_id": killer_id}})
-        await db.user_properties.update_many({"user_id": victim_id}, {"$set": {"user_id": killer_id}})
-        
-        now_iso = datetime.now(timezone.utc).isoformat()
-        await db.users.update_one(
-            {"id": victim_id},
-            {"$set": {
-                "is_dead": True,
-                "dead_at": now_iso,
-                "points_at_death": target.get("points", 0),
-                "money": 0,
-                "health": 0
-            }, "$inc": {"total_deaths": 1}}
-        )
-        # If the victim was someone's bodyguard: owner loses both the bodyguard and the slot (delete bodyguard, decrement slots; must buy that slot again). Remaining BGs renumber 1..n. Applies for any slot count.
-        victim_as_bodyguard = await db.bodyguards.find({"bodyguard_user_id": victim_id}, {"_id": 0, "id": 1, "user_id": 1}).to_list(10)
-        bodyguard_owner_username = None
-        for bg in victim_as_bodyguard:
-            owner_id = bg["user_id"]
-            owner_doc = await db.users.find_one({"id": owner_id}, {"_id": 0, "username": 1, "family_id": 1})
-            if owner_doc:
-                bodyguard_owner_username = owner_doc.get("username")
-            await db.bodyguards.delete_one({"id": bg["id"]})  # lose the bodyguard
-            await db.users.update_one({"id": owner_id}, {"$inc": {"bodyguard_slots": -1}})  # lose the slot
-            await db.users.update_one({"id": owner_id, "bodyguard_slots": {"$lt": 0}}, {"$set": {"bodyguard_slots": 0}})
-            try:
-                owner_family_id = (owner_doc or {}).get("family_id")
-                if owner_family_id and killer_family_id:
-                    bg_war = await _get_active_war_between(killer_family_id, owner_family_id)
-                    if bg_war and bg_war.get("id"):
-                        await _record_war_stats_bodyguard_kill(bg_war["id"], killer_id, killer_family_id, owner_id, owner_family_id)
-            except Exception as e:
-                logging.exception("War stats bodyguard kill: %s", e)
-            # Renumber remaining bodyguards so slot_numbers are 1..n (e.g. had 1,2,4 left → become 1,2,3)
-            remaining = await db.bodyguards.find({"user_id": owner_id}, {"_id": 0, "id": 1, "slot_number": 1}).sort("slot_number", 1).to_list(10)
-            for i, b in enumerate(remaining, 1):
-                if b["slot_number"] != i:
-                    await db.bodyguards.update_one({"id": b["id"]}, {"$set": {"slot_number": i}})
-        # Store bodyguard info in attempt_base for history
-        is_victim_bodyguard = bool(target.get("is_bodyguard"))
-        attempt_base["is_bodyguard_kill"] = is_victim_bodyguard
-        if is_victim_bodyguard and bodyguard_owner_username:
-            attempt_base["bodyguard_owner_username"] = bodyguard_owner_username
-
-        success_message = f"You killed {target_name}! You got ${cash_loot:,}"
-        extras = []
-        if victim_props_count:
-            p = f"their {victim_props_count} propert{'y' if victim_props_count == 1 else 'ies'}"
-            if prop_names:
-                p += f" ({', '.join(prop_names)})"
-            extras.append(p)
-        if victim_cars_count:
-            c = f"their {victim_cars_count} car{'s' if victim_cars_count != 1 else ''}"
-            if exclusive_car_count:
-                c += f" (including {'an' if exclusive_car_count == 1 else exclusive_car_count} exclusive car{'s' if exclusive_car_count != 1 else ''})"
-            extras.append(c)
-        if extras:
-            success_message += ", " + ", ".join(extras) + "."
-        else:
-            success_message += " and their assets."
+    if not killed:
+        return await _settle_failed_attack(attack, target, current_user, bullets_used, health_dealt_pct, target_health, attempt_base)
 
-        if death_message:
-            success_message += f' Death message: "{death_message}"'
+    death_message = (request.death_message or "").strip()
+    make_public = bool(request.make_public)
+    killer_id = current_user["id"]
+    victim_id = target["id"]
+    killer_family_id = current_user.get("family_id")
+    online_index.remove(victim_id)
 
-        if make_public:
-            try:
-                await db.public_kills.insert_one({
-                    "id": str(uuid.uuid4()),
-                    "killer_id": current_user["id"],
-                    "killer_username": current_user["username"],
-                    "victim_id": victim_id,
-                    "victim_username": target_name,
-                    "death_message": death_message or None,
-                    "bullets_used": bullets_used,
-                    "bullets_required": bullets_required,
-                    "make_public": True,
-                    "created_at": datetime.now(timezone.utc).isoformat(),
-                })
-            except Exception:
-                pass
-        
-        await db.attacks.update_one(
-            {"id": attack["id"]},
-            {"$set": {
-                "status": "completed",
-                "result": "success",
-                "rewards": {
-                    "money": cash_loot,
-                    "rank_points": rank_points,
-                    "cars_taken": victim_cars_count,
-                    "properties_taken": victim_props_count,
-                    "exclusive_cars": exclusive_car_count
-                }
-            }}
-        )
-        await send_notification(killer_id, "Kill", success_message, "attack")
-
-        # Witness statements: how many go out depends on weapon (worse gun = more) and silencer (reduces). Sent to random users (victim may or may not get one).
-        max_statements = max(0, min(6, 7 - (best_damage // 20)))
-        if current_user.get("has_silencer"):
-            max_statements = max(0, max_statements - 2)
-        number_to_send = random.randint(0, max_statements)
-        if number_to_send > 0:
-            location = attack.get("location_state") or "Unknown"
-            time_str = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
-            victim_label = f"bodyguard {target_name}" if target.get("is_bodyguard") else target_name
-            witness_msg = f"{current_user.get('username') or 'Someone'} killed {victim_label}. Weapon: {best_weapon_name}. Bullets used: {bullets_used:,}. Location: {location}. Time: {time_str}."
-            all_user_ids = await db.users.find(
-                {"is_dead": {"$ne": True}, "is_npc": {"$ne": True}, "is_bodyguard": {"$ne": True}, "id": {"$ne": killer_id}},
-                {"_id": 0, "id": 1}
-            ).to_list(5000)
-            recipient_ids = [u["id"] for u in all_user_ids]
-            if recipient_ids:
-                to_send = min(number_to_send, len(recipient_ids))
-                for uid in random.sample(recipient_ids, to_send):
-                    await send_notification(uid, "Witness statement", witness_msg, "attack")
-
-        victim_family_id = target.get("family_id")
-        killer_family_id = current_user.get("family_id")
-        # Record war stats first: use the war between killer's and victim's family so it shows in killer's modal
-        if victim_family_id:
-            try:
-                if killer_family_id:
-                    war = await _get_active_war_between(killer_family_id, victim_family_id)
-                else:
-                    war = await _get_active_war_for_family(victim_family_id)
-                if war and war.get("id"):
-                    await _record_war_stats_player_kill(war["id"], killer_id, killer_family_id, victim_id, victim_family_id)
-            except Exception as e:
-                logging.exception("War stats record on kill: %s", e)
-        # Notifications, war start, wipe check — don't fail the request if these error
-        if victim_family_id:
-            try:
-                await send_notification_to_family(
-                    victim_family_id,
-                    "💀 Family Member Killed",
-                    f"{target_name} was killed by {current_user['username']}.",
-                    "attack",
-                )
-                target_role = (target.get("family_role") or "").lower()
-                if target_role in ("boss", "underboss", "consigliere"):
-                    if killer_family_id:
-                        await _family_war_start(killer_family_id, victim_family_id)
-                await _family_war_check_wipe_and_award(victim_family_id)
-            except Exception as e:
-                logging.exception("Family notify/war on kill: %s", e)
+    # Spend bullets and bump inflation (2–4% per kill) with the rest of the killer's rewards
+    killer_set = {"kill_inflation": inflation + random.uniform(0.02, 0.04), "kill_inflation_updated_at": utcnow()}
+    killer_inc = {"bullets": -bullets_used, "total_kills": 1}
 
+    # NPC hitlist target: grant npc_rewards from hitlist entry (removed as it's claimed)
+    hitlist_entry = None
+    if target.get("is_npc"):
+        hitlist_entry = await db.hitlist.find_one_and_delete({"target_id": victim_id, "target_type": "npc"}, {"_id": 0, "npc_rewards": 1})
+    if hitlist_entry:
+        rewards = hitlist_entry.get("npc_rewards") or {}
+        for key, field in (("cash", "money"), ("points", "points"), ("rank_points", "rank_points"), ("bullets", "bullets")):
+            killer_inc[field] = killer_inc.get(field, 0) + int(rewards.get(key, 0) or 0)
+        booze = rewards.get("booze")
+        if isinstance(booze, dict) and booze:
+            booze_ids = [b["id"] for b in BOOZE_TYPES]
+            for bid, amt in booze.items():
+                if bid in booze_ids and amt and int(amt) > 0:
+                    killer_inc[f"booze_carrying.{bid}"] = int(amt)
+                    killer_inc[f"booze_carrying_cost.{bid}"] = 0
+        car_id = (rewards.get("car_id") or "").strip()
+        writes = [
+            db.users.update_one({"id": killer_id}, with_rank_id({"$inc": killer_inc, "$set": killer_set})),
+            db.attacks.update_one({"id": attack["id"]}, {"$set": {"status": "completed", "result": "success", "rewards": rewards}}),
+        ]
+        if car_id and car_id in catalog.current().cars:
+            writes.append(db.user_cars.insert_one({"id": str(uuid.uuid4()), "user_id": killer_id, "car_id": car_id, "acquired_at": now_iso}))
+        await asyncio.gather(*writes)
+        reward_parts = []
+        if rewards.get("cash"): reward_parts.append(f"${int(rewards['cash']):,} cash")
+        if rewards.get("points"): reward_parts.append(f"{int(rewards['points'])} pts")
+        if rewards.get("rank_points"): reward_parts.append(f"{int(rewards['rank_points'])} RP")
+        if rewards.get("bullets"): reward_parts.append(f"{int(rewards['bullets'])} bullets")
+        if car_id: reward_parts.append("a car")
+        if isinstance(booze, dict) and booze: reward_parts.append("booze")
+        success_message = f"You killed {target_name}! (NPC) You got: " + ", ".join(reward_parts) + "."
         try:
             await db.attack_attempts.insert_one({
                 **attempt_base,
                 "outcome": "killed",
                 "death_message": death_message or None,
-                "make_public": make_public,
-                "rewards": {"money": cash_loot, "rank_points": rank_points, "cars_taken": victim_cars_count, "properties_taken": victim_props_count},
+                "make_public": False,
+                "rewards": rewards,
                 "target_health_before": target_health,
                 "target_health_after": 0.0,
+                "is_npc_kill": True,
             })
         except Exception:
             pass
-        
-        return AttackExecuteResponse(
-            success=True,
-            message=success_message,
-            rewards={"money": cash_loot, "rank_points": rank_points, "cars_taken": victim_cars_count, "properties_taken": victim_props_count, "exclusive_cars": exclusive_car_count}
+        await kill_events.append(db, _kill_event(current_user, target, attacker_rank_id, target_rank_name, best_weapon_name, False))
+        return AttackExecuteResponse(success=True, message=success_message, rewards=rewards)
+
+    victim_money = int(victim_before.get("money", 0) or 0)
+    cash_loot = int(victim_money * KILL_CASH_PERCENT)
+    rank_points = 25
+    ev = await get_effective_event()
+    cash_loot = int(cash_loot * ev.get("kill_cash", 1.0))
+    rank_points = int(rank_points * ev.get("rank_points", 1.0))
+    killer_inc.update({"money": cash_loot, "rank_points": rank_points})
+
+    victim_cars, victim_props, victim_as_bodyguard = await asyncio.gather(
+        db.user_cars.find({"user_id": victim_id}, {"_id": 0, "car_id": 1}).to_list(500),
+        db.user_properties.find({"user_id": victim_id}, {"_id": 0, "property_id": 1}).to_list(100),
+        # If the victim was someone's bodyguard: owner loses both the bodyguard and the slot
+        db.bodyguards.find({"bodyguard_user_id": victim_id}, {"_id": 0, "id": 1, "user_id": 1}).to_list(10),
+    )
+    victim_cars_count = len(victim_cars)
+    victim_props_count = len(victim_props)
+
+    cat = catalog.current()
+    exclusive_car_count = sum(1 for uc in victim_cars if cat.is_exclusive_car(uc["car_id"]))
+    prop_names = [cat.properties[up["property_id"]]["name"] for up in victim_props if up["property_id"] in cat.properties]
+
+    user_ops = [UserUpdateOne({"id": killer_id}, with_rank_id({"$inc": killer_inc, "$set": killer_set}))]
+    bodyguard_ops = []
+    owners = {}
+    if victim_as_bodyguard:
+        owner_ids = list({bg["user_id"] for bg in victim_as_bodyguard})
+        dead_bg_ids = {bg["id"] for bg in victim_as_bodyguard}
+        owner_docs, remaining = await asyncio.gather(
+            db.users.find({"id": {"$in": owner_ids}}, {"_id": 0, "id": 1, "username": 1, "family_id": 1}).to_list(10),
+            db.bodyguards.find({"user_id": {"$in": owner_ids}}, {"_id": 0, "id": 1, "user_id": 1, "slot_number": 1}).sort("slot_number", 1).to_list(50),
         )
+        owners = {o["id"]: o for o in owner_docs}
+        for bg in victim_as_bodyguard:
+            bodyguard_ops.append(DeleteOne({"id": bg["id"]}))  # lose the bodyguard
+            # lose the slot, never below 0
+            user_ops.append(UserUpdateOne({"id": bg["user_id"]}, [{"$set": {"bodyguard_slots": {"$max": [0, {"$subtract": [{"$ifNull": ["$bodyguard_slots", 0]}, 1]}]}}}]))
+        # Renumber remaining bodyguards so slot_numbers are 1..n (e.g. had 1,2,4 left → become 1,2,3)
+        for owner_id in owner_ids:
+            kept = [b for b in remaining if b["user_id"] == owner_id and b["id"] not in dead_bg_ids]
+            for i, b in enumerate(kept, 1):
+                if b.get("slot_number") != i:
+                    bodyguard_ops.append(UpdateOne({"id": b["id"]}, {"$set": {"slot_number": i}}))
+    bodyguard_owner_username = next((o.get("username") for o in owners.values() if o.get("username")), None)
+
+    # Store bodyguard info in attempt_base for history
+    is_victim_bodyguard = bool(target.get("is_bodyguard"))
+    attempt_base["is_bodyguard_kill"] = is_victim_bodyguard
+    if is_victim_bodyguard and bodyguard_owner_username:
+        attempt_base["bodyguard_owner_username"] = bodyguard_owner_username
+
+    success_message = f"You killed {target_name}! You got ${cash_loot:,}"
+    extras = []
+    if victim_props_count:
+        p = f"their {victim_props_count} propert{'y' if victim_props_count == 1 else 'ies'}"
+        if prop_names:
+            p += f" ({', '.join(prop_names)})"
+        extras.append(p)
+    if victim_cars_count:
+        c = f"their {victim_cars_count} car{'s' if victim_cars_count != 1 else ''}"
+        if exclusive_car_count:
+            c += f" (including {'an' if exclusive_car_count == 1 else exclusive_car_count} exclusive car{'s' if exclusive_car_count != 1 else ''})"
+        extras.append(c)
+    if extras:
+        success_message += ", " + ", ".join(extras) + "."
     else:
-        new_health = max(0.0, target_health - health_dealt_pct)
-        await db.users.update_one(
-            {"id": target["id"]},
-            {"$set": {"health": new_health}}
-        )
-        await db.attacks.update_one(
+        success_message += " and their assets."
+
+    if death_message:
+        success_message += f' Death message: "{death_message}"'
+
+    rewards = {"money": cash_loot, "rank_points": rank_points, "cars_taken": victim_cars_count, "properties_taken": victim_props_count}
+    # Settle the kill in one round: users and bodyguards as batched bulk_writes, assets moved in place
+    writes = [
+        db.users.bulk_write(user_ops, ordered=False),
+        db.user_cars.update_many({"user_id": victim_id}, {"$set": {"user_id": killer_id}}),
+        db.user_properties.update_many({"user_id": victim_id}, {"$set": {"user_id": killer_id}}),
+        db.attacks.update_one(
             {"id": attack["id"]},
-            {"$set": {"status": "failed", "result": "failed"}}
-        )
-        health_pct_str = f"{health_dealt_pct:.1f}" if health_dealt_pct != int(health_dealt_pct) else str(int(health_dealt_pct))
-        fail_message = f'You failed to kill {target_name}. You used {bullets_used:,} bullets — they only lost {health_pct_str}% health.'
+            {"$set": {"status": "completed", "result": "success", "rewards": {**rewards, "exclusive_cars": exclusive_car_count}}},
+        ),
+        send_notification(killer_id, "Kill", success_message, "attack"),
+    ]
+    if bodyguard_ops:
+        writes.append(db.bodyguards.bulk_write(bodyguard_ops, ordered=False))
+    await asyncio.gather(*writes)
+
+    side_effects = [
+        _record_attack_attempt({
+            **attempt_base,
+            "outcome": "killed",
+            "death_message": death_message or None,
+            "make_public": make_public,
+            "rewards": rewards,
+            "target_health_before": target_health,
+            "target_health_after": 0.0,
+        }),
+        _send_witness_statements(current_user, target, attack, best_damage, best_weapon_name, bullets_used),
+        kill_events.append(db, _kill_event(current_user, target, attacker_rank_id, target_rank_name, best_weapon_name, make_public)),
+    ]
+    if make_public:
+        side_effects.append(_record_public_kill({
+            "id": str(uuid.uuid4()),
+            "killer_id": killer_id,
+            "killer_username": current_user["username"],
+            "victim_id": victim_id,
+            "victim_username": target_name,
+            "death_message": death_message or None,
+            "bullets_used": bullets_used,
+            "bullets_required": bullets_required,
+            "make_public": True,
+            "created_at": utcnow(),
+        }))
+    await asyncio.gather(*side_effects)
+
+    for bg in victim_as_bodyguard:
+        owner_family_id = (owners.get(bg["user_id"]) or {}).get("family_id")
+        if owner_family_id and killer_family_id:
+            followups.append(_record_bodyguard_kill_war_stats(killer_id, killer_family_id, bg["user_id"], owner_family_id))
+    victim_family_id = target.get("family_id")
+    if victim_family_id:
+        followups.append(_family_consequences_of_kill(current_user, target, killer_family_id, victim_family_id))
+
+    return AttackExecuteResponse(
+        success=True,
+        message=success_message,
+        rewards={**rewards, "exclusive_cars": exclusive_car_count}
+    )
 
-        try:
-            await db.attack_attempts.insert_one({
-                **attempt_base,
-                "outcome": "failed",
-                "death_message": None,
-                "make_public": False,
-                "rewards": None,
-                "target_health_before": target_health,
-                "target_health_after": new_health,
-                "health_dealt_pct": float(health_dealt_pct),
-                "message": fail_message,
-            })
-        except Exception:
-            pass
 
-        return AttackExecuteResponse(
-            success=False,
-            message=fail_message,
-            rewards=None
+async def _family_consequences_of_kill(current_user: dict, target: dict, killer_family_id: str | None, victim_family_id: str) -> None:
+    killer_id = current_user["id"]
+    victim_id = target["id"]
+    living = None
+    try:
+        living = await family_counts.adjust(db.families, victim_family_id, -1)
+    except Exception as e:
+        logging.exception("Family living count on kill: %s", e)
+    # Record war stats first: use the war between killer's and victim's family so it shows in killer's modal
+    try:
+        if killer_family_id:
+            war = await _get_active_war_between(killer_family_id, victim_family_id)
+        else:
+            war = await _get_active_war_for_family(victim_family_id)
+        if war and war.get("id"):
+            await _record_war_stats_player_kill(war["id"], killer_id, killer_family_id, victim_id, victim_family_id)
+    except Exception as e:
+        logging.exception("War stats record on kill: %s", e)
+    # Notifications, war start, wipe check — don't fail the request if these error
+    try:
+        await send_notification_to_family(
+            victim_family_id,
+            "💀 Family Member Killed",
+            f"{target['username']} was killed by {current_user['username']}.",
+            "attack",
         )
+        target_role = (target.get("family_role") or "").lower()
+        if target_role in ("boss", "underboss", "consigliere"):
+            if killer_family_id:
+                await _family_war_start(killer_family_id, victim_family_id)
+        await _family_war_check_wipe_and_award(victim_family_id)
+        # Last living member: dissolve now that the war (if any) has been awarded
+        if living is not None and living <= 0:
+            await _dissolve_family(victim_family_id)
+    except Exception as e:
+        logging.exception("Family notify/war on kill: %s", e)
+
+
+def _attack_damage_pipeline(health_dealt_pct: float, now_iso: str) -> list:
+    """Update pipeline: health -= dealt (floored at 0); when that empties it, the target dies."""
+    health = {"$ifNull": ["$health", DEFAULT_HEALTH]}
+    dies = {"$gte": [health_dealt_pct, health]}
+
+    def on_death(value, field):
+        return {"$cond": [dies, value, f"${field}"]}
+
+    return [{"$set": {
+        "health": {"$max": [0, {"$subtract": [health, health_dealt_pct]}]},
+        "is_dead": on_death(True, "is_dead"),
+        "dead_at": on_death(now_iso, "dead_at"),
+        "points_at_death": on_death({"$ifNull": ["$points", 0]}, "points_at_death"),
+        "money": on_death(0, "money"),
+        "total_deaths": on_death({"$add": [{"$ifNull": ["$total_deaths", 0]}, 1]}, "total_deaths"),
+    }}]
+
+
+async def _settle_failed_attack(attack: dict, target: dict, current_user: dict, bullets_used: int, health_dealt_pct: float, target_health: float, attempt_base: dict) -> AttackExecuteResponse:
+    # The damage itself was already applied by _attack_damage_pipeline
+    new_health = max(0.0, target_health - health_dealt_pct)
+    health_pct_str = f"{health_dealt_pct:.1f}" if health_dealt_pct != int(health_dealt_pct) else str(int(health_dealt_pct))
+    fail_message = f'You failed to kill {target["username"]}. You used {bullets_used:,} bullets — they only lost {health_pct_str}% health.'
+    await asyncio.gather(
+        db.users.update_one({"id": current_user["id"]}, {"$inc": {"bullets": -bullets_used}}),
+        db.attacks.update_one({"id": attack["id"]}, {"$set": {"status": "failed", "result": "failed"}}),
+        _record_attack_attempt({
+            **attempt_base,
+            "outcome": "failed",
+            "death_message": None,
+            "make_public": False,
+            "rewards": None,
+            "target_health_before": target_health,
+            "target_health_after": new_health,
+            "health_dealt_pct": float(health_dealt_pct),
+            "message": fail_message,
+        }),
+    )
+    return AttackExecuteResponse(
+        success=False,
+        message=fail_message,
+        rewards=None
+    )
+
+
+async def _record_attack_attempt(doc: dict) -> None:
+    try:
+        await db.attack_attempts.insert_one(doc)
+    except Exception:
+        pass
+
+
+def _kill_event(current_user: dict, target: dict, attacker_rank_id: int, target_rank_name: str, weapon_name: str, make_public: bool) -> dict:
+    attacker_rank_name = next((r["name"] for r in RANKS if int(r["id"]) == int(attacker_rank_id or 1)), RANKS[0]["name"])
+    return kill_feed.make_event(current_user, target, attacker_rank_name, target_rank_name, weapon_name, make_public)
+
+async def _record_public_kill(doc: dict) -> None:
+    try:
+        await db.public_kills.insert_one(doc)
+    except Exception:
+        pass
+
+
+async def _record_bodyguard_kill_war_stats(killer_id: str, killer_family_id: str, owner_id: str, owner_family_id: str) -> None:
+    try:
+        bg_war = await _get_active_war_between(killer_family_id, owner_family_id)
+        if bg_war and bg_war.get("id"):
+            await _record_war_stats_bodyguard_kill(bg_war["id"], killer_id, killer_family_id, owner_id, owner_family_id)
+    except Exception as e:
+        logging.exception("War stats bodyguard kill: %s", e)
+
+
+async def _send_witness_statements(current_user: dict, target: dict, attack: dict, best_damage: int, best_weapon_name: str, bullets_used: int) -> None:
+    """Witness statements: how many go out depends on weapon (worse gun = more) and silencer (reduces). Sent to random users (victim may or may not get one)."""
+    max_statements = max(0, min(6, 7 - (best_damage // 20)))
+    if current_user.get("has_silencer"):
+        max_statements = max(0, max_statements - 2)
+    number_to_send = random.randint(0, max_statements)
+    if number_to_send <= 0:
+        return
+    location = attack.get("location_state") or "Unknown"
+    time_str = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+    victim_label = f"bodyguard {target['username']}" if target.get("is_bodyguard") else target["username"]
+    witness_msg = f"{current_user.get('username') or 'Someone'} killed {victim_label}. Weapon: {best_weapon_name}. Bullets used: {bullets_used:,}. Location: {location}. Time: {time_str}."
+    recipients = await db.users.aggregate([
+        {"$match": {"is_dead": {"$ne": True}, "is_npc": {"$ne": True}, "is_bodyguard": {"$ne": True}, "id": {"$ne": current_user["id"]}}},
+        {"$sample": {"size": number_to_send}},
+        {"$project": {"_id": 0, "id": 1}},
+    ]).to_list(number_to_send)
+    if recipients:
+        await send_notifications([u["id"] for u in recipients], "Witness statement", witness_msg, "attack")
 
 @api_router.get("/attack/attempts")
-async def get_attack_attempts(current_user: dict = Depends(get_current_user)):
+async def get_attack_attempts(current_user: dict = Depends(get_current_user_profile("core"))):
     """History of attack attempts involving current user."""
     docs = await db.attack_attempts.find(
         {"$or": [{"attacker_id": current_user["id"]}, {"target_id": current_user["id"]}]},
@@ -5881,19 +5957,15 @@ async def get_leaderboard(current_user: dict = Depends(get_current_user)):
     
     return result
 
-async def _top_by_field(field: str, current_user_id: str, limit: int, dead: bool = False) -> List[StatLeaderboardEntry]:
+def _top_by_field(field: str, current_user_id: str, limit: int, dead: bool = False) -> List[StatLeaderboardEntry]:
     limit = max(1, min(100, int(limit)))
-    query = {"is_dead": True} if dead else {"is_dead": {"$ne": True}, "is_bodyguard": {"$ne": True}}
-    users = await db.users.find(
-        query,
-        {"_id": 0, "username": 1, "id": 1, field: 1}
-    ).sort(field, -1).limit(limit).to_list(limit)
+    users = leaderboard_index.top(field, limit, pool="dead" if dead else "alive")
     out: List[StatLeaderboardEntry] = []
     for i, user in enumerate(users):
         out.append(StatLeaderboardEntry(
             rank=i + 1,
             username=user["username"],
-            value=int(user.get(field, 0) or 0),
+            value=user["value"],
             is_current_user=user["id"] == current_user_id
         ))
     return out
@@ -5901,19 +5973,19 @@ async def _top_by_field(field: str, current_user_id: str, limit: int, dead: bool
 
 @api_router.get("/leaderboards/top")
 async def get_top_leaderboards(
+    request: Request,
     limit: int = Query(10, ge=1, le=100, description="Top N (5, 10, 20, 50, 100)"),
     dead: bool = Query(False, description="If true, show top dead accounts instead of alive"),
     current_user: dict = Depends(get_current_user),
 ):
     """Top N leaderboards per stat (kills, crimes, gta, jail busts). Limit 1-100. Use dead=true for top dead accounts."""
     user_id = current_user["id"]
-    kills, crimes, gta, jail_busts = await asyncio.gather(
-        _top_by_field("total_kills", user_id, limit, dead=dead),
-        _top_by_field("total_crimes", user_id, limit, dead=dead),
-        _top_by_field("total_gta", user_id, limit, dead=dead),
-        _top_by_field("jail_busts", user_id, limit, dead=dead),
-    )
-    return {"kills": kills, "crimes": crimes, "gta": gta, "jail_busts": jail_busts}
+    kills = _top_by_field("total_kills", user_id, limit, dead=dead)
+    crimes = _top_by_field("total_crimes", user_id, limit, dead=dead)
+    gta = _top_by_field("total_gta", user_id, limit, dead=dead)
+    jail_busts = _top_by_field("jail_busts", user_id, limit, dead=dead)
+    # Tagged by content: each worker has its own in-memory index, so only the rendered top N is comparable
+    return conditional.respond_body(request, {"kills": kills, "crimes": crimes, "gta": gta, "jail_busts": jail_busts}, "catalog")
 
 # Payment endpoints (Stripe/emergent removed; routes kept so frontend does not 404)
 @api_router.post("/payments/checkout")
@@ -5938,7 +6010,7 @@ async def stripe_webhook(request: Request):
 # ============ NOTIFICATION/INBOX ENDPOINTS ============
 
 @api_router.get("/notifications")
-async def get_notifications(current_user: dict = Depends(get_current_user)):
+async def get_notifications(current_user: dict = Depends(get_current_user_profile("core"))):
     notifications = await db.notifications.find(
         {"user_id": current_user["id"]},
         {"_id": 0}
@@ -5949,7 +6021,7 @@ async def get_notifications(current_user: dict = Depends(get_current_user)):
     return {"notifications": notifications, "unread_count": unread_count}
 
 @api_router.post("/notifications/{notification_id}/read")
-async def mark_notification_read(notification_id: str, current_user: dict = Depends(get_current_user)):
+async def mark_notification_read(notification_id: str, current_user: dict = Depends(get_current_user_profile("core"))):
     await db.notifications.update_one(
         {"id": notification_id, "user_id": current_user["id"]},
         {"$set": {"read": True}}
@@ -5957,7 +6029,7 @@ async def mark_notification_read(notification_id: str, current_user: dict = Depe
     return {"message": "Notification marked as read"}
 
 @api_router.post("/notifications/read-all")
-async def mark_all_notifications_read(current_user: dict = Depends(get_current_user)):
+async def mark_all_notifications_read(current_user: dict = Depends(get_current_user_profile("core"))):
     await db.notifications.update_many(
         {"user_id": current_user["id"], "read": False},
         {"$set": {"read": True}}
@@ -5966,7 +6038,7 @@ async def mark_all_notifications_read(current_user: dict = Depends(get_current_u
 
 
 @api_router.delete("/notifications/{notification_id}")
-async def delete_notification(notification_id: str, current_user: dict = Depends(get_current_user)):
+async def delete_notification(notification_id: str, current_user: dict = Depends(get_current_user_profile("core"))):
     """Delete a single message from the current user's inbox."""
     result = await db.notifications.delete_one(
         {"id": notification_id, "user_id": current_user["id"]}
@@ -5977,22 +6049,22 @@ async def delete_notification(notification_id: str, current_user: dict = Depends
 
 
 @api_router.delete("/notifications")
-async def delete_all_notifications(current_user: dict = Depends(get_current_user)):
+async def delete_all_notifications(current_user: dict = Depends(get_current_user_profile("core"))):
     """Delete all messages in the current user's inbox."""
     result = await db.notifications.delete_many({"user_id": current_user["id"]})
     return {"message": "All messages deleted", "deleted_count": result.deleted_count}
 
 
 @api_router.post("/notifications/send")
-async def send_message_to_user(request: SendMessageRequest, current_user: dict = Depends(get_current_user)):
+async def send_message_to_user(request: SendMessageRequest, current_user: dict = Depends(get_current_user_profile("core"))):
     """Send a direct message to another user. Message can include emojis; optional gif_url is shown as an image."""
     target_username = (request.target_username or "").strip()
     if not target_username:
         raise HTTPException(status_code=400, detail="Enter a username")
-    if target_username == (current_user.get("username") or ""):
+    if username_key(target_username) == username_key(current_user.get("username")):
         raise HTTPException(status_code=400, detail="You cannot message yourself")
     target = await db.users.find_one(
-        {"username": target_username},
+        _find_user_by_username_case_insensitive(target_username),
         {"_id": 0, "id": 1, "username": 1}
     )
     if not target:
@@ -6022,7 +6094,7 @@ async def send_message_to_user(request: SendMessageRequest, current_user: dict =
         "message": message,
         "notification_type": "user_message_sent",
         "read": True,
-        "created_at": datetime.now(timezone.utc).isoformat(),
+        "created_at": utcnow(),
     }
     if gif_url:
         sent_copy["gif_url"] = gif_url
@@ -6031,7 +6103,7 @@ async def send_message_to_user(request: SendMessageRequest, current_user: dict =
 
 
 @api_router.get("/notifications/thread/{other_user_id}")
-async def get_thread(other_user_id: str, current_user: dict = Depends(get_current_user)):
+async def get_thread(other_user_id: str, current_user: dict = Depends(get_current_user_profile("core"))):
     """Get conversation thread with another user (for Telegram-style chat). Returns messages from both sides, sorted by time."""
     me = current_user["id"]
     # Messages they sent to me (user_message, I am user_id)
@@ -6280,11 +6352,7 @@ async def casino_dice_ownership(current_user: dict = Depends(get_current_user)):
     Expired buy-back offers are auto-REJECTED (winner keeps ownership).
     """
     now = datetime.now(timezone.utc)
-    # Clean up expired buy-back offers: auto-reject = winner keeps ownership, just delete the offer
-    await db.dice_buy_back_offers.delete_many({
-        "to_user_id": current_user["id"],
-        "expires_at": {"$lt": now.isoformat()},
-    })
+    # Expired buy-back offers (auto-reject: winner keeps ownership) are removed by the expires_at TTL index
     raw = (current_user.get("current_state") or (STATES[0] if STATES else "") or "").strip()
     city = _normalize_city_for_dice(raw) if raw else (STATES[0] if STATES else "")
     if not city:
@@ -6311,18 +6379,15 @@ async def casino_dice_ownership(current_user: dict = Depends(get_current_user)):
     )
     buy_back_offer = None
     if active_offer:
-        try:
-            exp_dt = datetime.fromisoformat((active_offer.get("expires_at") or "").replace("Z", "+00:00"))
-            if exp_dt > now:
-                buy_back_offer = {
-                    "offer_id": active_offer["id"],
-                    "points_offered": int(active_offer.get("points_offered") or 0),
-                    "amount_shortfall": int(active_offer.get("amount_shortfall") or 0),
-                    "owner_paid": int(active_offer.get("owner_paid") or 0),
-                    "expires_at": active_offer.get("expires_at"),
-                }
-        except Exception:
-            pass
+        exp_dt = to_datetime(active_offer.get("expires_at"))
+        if exp_dt and exp_dt > now:
+            buy_back_offer = {
+                "offer_id": active_offer["id"],
+                "points_offered": int(active_offer.get("points_offered") or 0),
+                "amount_shortfall": int(active_offer.get("amount_shortfall") or 0),
+                "owner_paid": int(active_offer.get("owner_paid") or 0),
+                "expires_at": exp_dt,
+            }
     return {
         "current_city": city,
         "owner": owner,
@@ -6396,7 +6461,7 @@ async def casino_dice_play(request: DicePlayRequest, current_user: dict = Depend
             # Buy-back set: transfer ownership to winner, create 2-min offer; accept = return to owner, reject = keep
             ownership_transferred = True
             await db.dice_ownership.update_one({"city": db_city}, {"$set": {"owner_id": current_user["id"], "owner_username": current_user["username"]}})
-            expires_at = (datetime.now(timezone.utc) + timedelta(minutes=2)).isoformat()
+            expires_at = utcnow() + timedelta(minutes=2)
             offer_id = str(uuid.uuid4())
             buy_back_doc = {
                 "id": offer_id,
@@ -6409,7 +6474,7 @@ async def casino_dice_play(request: DicePlayRequest, current_user: dict = Depend
                 "amount_shortfall": shortfall,
                 "owner_paid": actual_payout,
                 "expires_at": expires_at,
-                "created_at": datetime.now(timezone.utc).isoformat(),
+                "created_at": utcnow(),
             }
             await db.dice_buy_back_offers.insert_one(buy_back_doc)
             buy_back_offer = {"offer_id": offer_id, "points_offered": points_offered, "amount_shortfall": shortfall, "owner_paid": actual_payout, "expires_at": expires_at}
@@ -6539,13 +6604,9 @@ async def casino_dice_buy_back_accept(request: DiceBuyBackAcceptRequest, current
         raise HTTPException(status_code=404, detail="Offer not found")
     if offer.get("to_user_id") != current_user["id"]:
         raise HTTPException(status_code=403, detail="Not your offer")
-    expires = offer.get("expires_at")
-    if expires:
-        try:
-            if datetime.fromisoformat(expires.replace("Z", "+00:00")) < datetime.now(timezone.utc):
-                raise HTTPException(status_code=400, detail="Offer expired")
-        except Exception:
-            pass
+    expires = to_datetime(offer.get("expires_at"))
+    if expires and expires < datetime.now(timezone.utc):
+        raise HTTPException(status_code=400, detail="Offer expired")
     city = offer.get("city")
     from_owner_id = offer.get("from_owner_id")
     points_offered = int(offer.get("points_offered") or 0)
@@ -6991,11 +7052,7 @@ async def casino_blackjack_ownership(current_user: dict = Depends(get_current_us
     Expired buy-back offers are auto-REJECTED (winner keeps ownership).
     """
     now = datetime.now(timezone.utc)
-    # Clean up expired buy-back offers: auto-reject = winner keeps ownership, just delete the offer
-    await db.blackjack_buy_back_offers.delete_many({
-        "to_user_id": current_user["id"],
-        "expires_at": {"$lt": now.isoformat()},
-    })
+    # Expired buy-back offers (auto-reject: winner keeps ownership) are removed by the expires_at TTL index
     raw = (current_user.get("current_state") or "").strip()
     city = _normalize_city_for_blackjack(raw) if raw else (STATES[0] if STATES else "Chicago")
     display_city = city or raw or "Chicago"
@@ -7028,18 +7085,15 @@ async def casino_blackjack_ownership(current_user: dict = Depends(get_current_us
     )
     buy_back_offer = None
     if active_offer:
-        try:
-            exp_dt = datetime.fromisoformat((active_offer.get("expires_at") or "").replace("Z", "+00:00"))
-            if exp_dt > now:
-                buy_back_offer = {
-                    "offer_id": active_offer["id"],
-                    "points_offered": int(active_offer.get("points_offered") or 0),
-                    "amount_shortfall": int(active_offer.get("amount_shortfall") or 0),
-                    "owner_paid": int(active_offer.get("owner_paid") or 0),
-                    "expires_at": active_offer.get("expires_at"),
-                }
-        except Exception:
-            pass
+        exp_dt = to_datetime(active_offer.get("expires_at"))
+        if exp_dt and exp_dt > now:
+            buy_back_offer = {
+                "offer_id": active_offer["id"],
+                "points_offered": int(active_offer.get("points_offered") or 0),
+                "amount_shortfall": int(active_offer.get("amount_shortfall") or 0),
+                "owner_paid": int(active_offer.get("owner_paid") or 0),
+                "expires_at": exp_dt,
+            }
     return {
         "current_city": display_city,
         "owner_id": owner_id,
@@ -7123,13 +7177,9 @@ async def casino_blackjack_buy_back_accept(request: BlackjackBuyBackAcceptReques
         raise HTTPException(status_code=404, detail="Offer not found")
     if offer.get("to_user_id") != current_user["id"]:
         raise HTTPException(status_code=403, detail="Not your offer")
-    expires = offer.get("expires_at")
-    if expires:
-        try:
-            if datetime.fromisoformat(expires.replace("Z", "+00:00")) < datetime.now(timezone.utc):
-                raise HTTPException(status_code=400, detail="Offer expired")
-        except Exception:
-            pass
+    expires = to_datetime(offer.get("expires_at"))
+    if expires and expires < datetime.now(timezone.utc):
+        raise HTTPException(status_code=400, detail="Offer expired")
     city = offer.get("city")
     from_owner_id = offer.get("from_owner_id")
     points_offered = int(offer.get("points_offered") or 0)
@@ -7310,7 +7360,7 @@ async def casino_blackjack_start(request: BlackjackStartRequest, current_user: d
                 else:
                     ownership_transferred = True
                     await db.blackjack_ownership.update_one({"city": stored_city or city}, {"$set": {"owner_id": current_user["id"], "owner_username": current_user.get("username")}})
-                    expires_at = (datetime.now(timezone.utc) + timedelta(minutes=2)).isoformat()
+                    expires_at = utcnow() + timedelta(minutes=2)
                     offer_id = str(uuid.uuid4())
                     await db.blackjack_buy_back_offers.insert_one({
                         "id": offer_id,
@@ -7321,7 +7371,7 @@ async def casino_blackjack_start(request: BlackjackStartRequest, current_user: d
                         "amount_shortfall": shortfall,
                         "owner_paid": actual_owner_pay,
                         "expires_at": expires_at,
-                        "created_at": datetime.now(timezone.utc).isoformat(),
+                        "created_at": utcnow(),
                     })
                     buy_back_offer = {"offer_id": offer_id, "points_offered": buy_back_reward, "amount_shortfall": shortfall, "owner_paid": actual_owner_pay, "expires_at": expires_at}
             else:
@@ -7382,7 +7432,7 @@ async def casino_blackjack_start(request: BlackjackStartRequest, current_user: d
         "deck": deck,
         "status": status,
         "owner_id": owner_id,
-        "created_at": datetime.now(timezone.utc).isoformat(),
+        "created_at": utcnow(),
     })
     return {
         "status": status,
@@ -7507,7 +7557,7 @@ async def casino_blackjack_stand(current_user: dict = Depends(get_current_user))
                 else:
                     ownership_transferred = True
                     await db.blackjack_ownership.update_one({"city": stored_city_bj or bj_city}, {"$set": {"owner_id": current_user["id"], "owner_username": current_user.get("username")}})
-                    expires_at = (datetime.now(timezone.utc) + timedelta(minutes=2)).isoformat()
+                    expires_at = utcnow() + timedelta(minutes=2)
                     offer_id = str(uuid.uuid4())
                     await db.blackjack_buy_back_offers.insert_one({
                         "id": offer_id,
@@ -7518,7 +7568,7 @@ async def casino_blackjack_stand(current_user: dict = Depends(get_current_user))
                         "amount_shortfall": shortfall,
                         "owner_paid": actual_owner_pay,
                         "expires_at": expires_at,
-                        "created_at": datetime.now(timezone.utc).isoformat(),
+                        "created_at": utcnow(),
                     })
                     buy_back_offer = {"offer_id": offer_id, "points_offered": buy_back_reward, "amount_shortfall": shortfall, "owner_paid": actual_owner_pay, "expires_at": expires_at}
             else:
@@ -7852,7 +7902,7 @@ async def get_travel_info(current_user: dict = Depends(get_current_user)):
     
     cars_with_travel_times = []
     for uc in user_cars:
-        car_info = next((c for c in CARS if c["id"] == uc["car_id"]), None)
+        car_info = catalog.current().cars.get(uc["car_id"])
         if car_info:
             travel_time = TRAVEL_TIMES.get(car_info["rarity"], 45)
             user_car_id = uc.get("id") or str(uc["_id"])
@@ -7976,7 +8026,7 @@ async def travel(request: TravelRequest, current_user: dict = Depends(get_curren
         if not user_car:
             raise HTTPException(status_code=400, detail="Car not found")
         
-        car_info = next((c for c in CARS if c["id"] == user_car["car_id"]), None)
+        car_info = catalog.current().cars.get(user_car["car_id"])
         if car_info:
             travel_time = TRAVEL_TIMES.get(car_info["rarity"], 45)
             method_name = car_info["name"]
@@ -8093,13 +8143,8 @@ def _booze_user_in_jail(user: dict) -> bool:
     """True if user is currently in jail (jail_until in future)."""
     if not user.get("in_jail"):
         return False
-    jail_until_iso = user.get("jail_until")
-    if not jail_until_iso:
-        return False
-    jail_until = datetime.fromisoformat(jail_until_iso.replace("Z", "+00:00"))
-    if jail_until.tzinfo is None:
-        jail_until = jail_until.replace(tzinfo=timezone.utc)
-    return jail_until > datetime.now(timezone.utc)
+    jail_until = to_datetime(user.get("jail_until"))
+    return bool(jail_until and jail_until > datetime.now(timezone.utc))
 
 
 @api_router.post("/booze-run/buy")
@@ -8132,7 +8177,7 @@ async def booze_run_buy(request: BoozeBuyRequest, current_user: dict = Depends(g
         await db.users.update_one(
             {"id": current_user["id"]},
             {
-                "$set": {"in_jail": True, "jail_until": jail_until.isoformat()},
+                "$set": {"in_jail": True, "jail_until": jail_until},
                 "$unset": {"booze_carrying": "", "booze_carrying_cost": ""},
             },
         )
@@ -8189,7 +8234,7 @@ async def booze_run_sell(request: BoozeSellRequest, current_user: dict = Depends
         await db.users.update_one(
             {"id": current_user["id"]},
             {
-                "$set": {"in_jail": True, "jail_until": jail_until.isoformat()},
+                "$set": {"in_jail": True, "jail_until": jail_until},
                 "$unset": {"booze_carrying": "", "booze_carrying_cost": ""},
             },
         )
@@ -8710,7 +8755,8 @@ async def cancel_buy_offer(offer_id: str, current_user: dict = Depends(get_curre
 
 @api_router.post("/bodyguards/invite")
 async def invite_bodyguard(request: BodyguardInviteRequest, current_user: dict = Depends(get_current_user)):
-    target = await db.users.find_one({"username": request.target_username}, {"_id": 0})
+    user_filter = _find_user_by_username_case_insensitive(request.target_username)
+    target = await db.users.find_one(user_filter, {"_id": 0}) if user_filter else None
     if not target:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -8743,7 +8789,7 @@ async def invite_bodyguard(request: BodyguardInviteRequest, current_user: dict =
         "payment_type": request.payment_type,
         "duration_hours": request.duration_hours,
         "status": "pending",
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": utcnow()
     })
     
     # Notify invitee
@@ -8840,133 +8886,130 @@ async def decline_bodyguard_invite(invite_id: str, current_user: dict = Depends(
 
 # ============ Families & Family War API ============
 
-async def cleanup_dead_families():
-    """Remove families where all members are dead or don't exist. Transfer assets to war winners."""
-    families = await db.families.find({}, {"_id": 0}).to_list(50)
+async def _dissolve_family(family_id: str) -> bool:
+    """Remove a family whose living_member_count is 0. Transfer assets to war winners."""
+    # Deleting first claims the dissolution: a concurrent call (or a family that regained a member) finds nothing
+    fam = await db.families.find_one_and_delete({"id": family_id, "living_member_count": {"$lte": 0}}, {"_id": 0})
+    if not fam:
+        return False
+    # All members dead or non-existent - find ALL active/truce_offered wars
+    active_wars = await db.family_wars.find({
+        "$or": [{"family_a_id": family_id}, {"family_b_id": family_id}],
+        "status": {"$in": ["active", "truce_offered"]}
+    }, {"_id": 0}).to_list(10)
     
-    for fam in families:
-        family_id = fam["id"]
-        members = await db.family_members.find({"family_id": family_id}, {"_id": 0}).to_list(100)
+    now = datetime.now(timezone.utc).isoformat()
+    rackets = fam.get("rackets") or {}
+    treasury = fam.get("treasury", 0)
+    
+    # Process all active wars - transfer assets to first winner
+    assets_transferred = False
+    for active_war in active_wars:
+        # Determine winner (the other family)
+        winner_id = active_war["family_b_id"] if active_war["family_a_id"] == family_id else active_war["family_a_id"]
+        loser_id = family_id
         
-        living_count = 0
-        for m in members:
-            # Include 'id' in projection to ensure we get a non-empty dict when user exists
-            user = await db.users.find_one({"id": m["user_id"]}, {"_id": 0, "id": 1, "is_dead": 1})
-            if user and user.get("id") and not user.get("is_dead", False):
-                living_count += 1
+        # Use correct war status format (family_a_wins or family_b_wins)
+        war_status = "family_a_wins" if winner_id == active_war["family_a_id"] else "family_b_wins"
         
-        if living_count == 0:
-            # All members dead or non-existent - find ALL active/truce_offered wars
-            active_wars = await db.family_wars.find({
-                "$or": [{"family_a_id": family_id}, {"family_b_id": family_id}],
-                "status": {"$in": ["active", "truce_offered"]}
-            }, {"_id": 0}).to_list(10)
-            
-            now = datetime.now(timezone.utc).isoformat()
-            rackets = fam.get("rackets") or {}
-            treasury = fam.get("treasury", 0)
-            
-            # Process all active wars - transfer assets to first winner
-            assets_transferred = False
-            for active_war in active_wars:
-                # Determine winner (the other family)
-                winner_id = active_war["family_b_id"] if active_war["family_a_id"] == family_id else active_war["family_a_id"]
-                loser_id = family_id
+        # Transfer assets only once (to first war's winner)
+        prize_rackets_list = []
+        prize_treasury = 0
+        if not assets_transferred:
+            # Transfer rackets to winner
+            if rackets:
+                winner_fam = await db.families.find_one({"id": winner_id}, {"_id": 0, "rackets": 1, "boss_id": 1})
+                winner_rackets = (winner_fam or {}).get("rackets") or {}
                 
-                # Use correct war status format (family_a_wins or family_b_wins)
-                war_status = "family_a_wins" if winner_id == active_war["family_a_id"] else "family_b_wins"
-                
-                # Transfer assets only once (to first war's winner)
-                prize_rackets_list = []
-                prize_treasury = 0
-                if not assets_transferred:
-                    # Transfer rackets to winner
-                    if rackets:
-                        winner_fam = await db.families.find_one({"id": winner_id}, {"_id": 0, "rackets": 1, "boss_id": 1})
-                        winner_rackets = (winner_fam or {}).get("rackets") or {}
-                        
-                        for racket_id, state in rackets.items():
-                            level = state.get("level", 0)
-                            if level > 0:
-                                existing = winner_rackets.get(racket_id, {}).get("level", 0)
-                                if level > existing:
-                                    winner_rackets[racket_id] = {"level": level, "last_collected_at": None}
-                                    racket_def = next((r for r in FAMILY_RACKETS if r["id"] == racket_id), None)
-                                    prize_rackets_list.append({
-                                        "racket_id": racket_id,
-                                        "name": racket_def["name"] if racket_def else racket_id,
-                                        "level": level
-                                    })
-                        
-                        await db.families.update_one({"id": winner_id}, {"$set": {"rackets": winner_rackets}})
-                    
-                    # Transfer treasury to winner
-                    if treasury > 0:
-                        await db.families.update_one({"id": winner_id}, {"$inc": {"treasury": treasury}})
-                        prize_treasury = treasury
-                    
-                    # Notify winner
-                    await send_notification_to_family(
-                        winner_id,
-                        "🏆 WAR VICTORY!",
-                        f"The enemy family {fam['name']} has been destroyed! You've captured their rackets and ${treasury:,} from their treasury.",
-                        "system"
-                    )
-                    
-                    assets_transferred = True
+                for racket_id, state in rackets.items():
+                    level = state.get("level", 0)
+                    if level > 0:
+                        existing = winner_rackets.get(racket_id, {}).get("level", 0)
+                        if level > existing:
+                            winner_rackets[racket_id] = {"level": level, "last_collected_at": None}
+                            racket_def = catalog.current().rackets.get(racket_id)
+                            prize_rackets_list.append({
+                                "racket_id": racket_id,
+                                "name": racket_def["name"] if racket_def else racket_id,
+                                "level": level
+                            })
                 
-                # Names for DB readability
-                winner_fam_doc = await db.families.find_one({"id": winner_id}, {"_id": 0, "name": 1, "tag": 1})
-                winner_family_name = (winner_fam_doc or {}).get("name") or (winner_fam_doc or {}).get("tag") or winner_id
-                loser_family_name = fam.get("name") or fam.get("tag") or loser_id
-                # Mark war as won
-                await db.family_wars.update_one(
-                    {"id": active_war["id"]},
-                    {"$set": {
-                        "status": war_status,
-                        "winner_family_id": winner_id,
-                        "loser_family_id": loser_id,
-                        "winner_family_name": winner_family_name,
-                        "loser_family_name": loser_family_name,
-                        "ended_at": now,
-                        "prize_rackets": prize_rackets_list if prize_rackets_list else None,
-                        "prize_treasury": prize_treasury
-                    }}
-                )
+                await db.families.update_one({"id": winner_id}, {"$set": {"rackets": winner_rackets}})
+            
+            # Transfer treasury to winner
+            if treasury > 0:
+                await db.families.update_one({"id": winner_id}, {"$inc": {"treasury": treasury}})
+                prize_treasury = treasury
+            
+            # Notify winner
+            await send_notification_to_family(
+                winner_id,
+                "🏆 WAR VICTORY!",
+                f"The enemy family {fam['name']} has been destroyed! You've captured their rackets and ${treasury:,} from their treasury.",
+                "system"
+            )
             
-            # Delete the family and its members
-            await db.family_members.delete_many({"family_id": family_id})
-            await db.families.delete_one({"id": family_id})
+            assets_transferred = True
+        
+        # Names for DB readability
+        winner_fam_doc = await db.families.find_one({"id": winner_id}, {"_id": 0, "name": 1, "tag": 1})
+        winner_family_name = (winner_fam_doc or {}).get("name") or (winner_fam_doc or {}).get("tag") or winner_id
+        loser_family_name = fam.get("name") or fam.get("tag") or loser_id
+        # Mark war as won
+        await db.family_wars.update_one(
+            {"id": active_war["id"]},
+            {"$set": {
+                "status": war_status,
+                "winner_family_id": winner_id,
+                "loser_family_id": loser_id,
+                "winner_family_name": winner_family_name,
+                "loser_family_name": loser_family_name,
+                "ended_at": now,
+                "prize_rackets": prize_rackets_list if prize_rackets_list else None,
+                "prize_treasury": prize_treasury
+            }}
+        )
+    
+    # Delete its members (the family document is already gone)
+    await db.family_members.delete_many({"family_id": family_id})
+    return True
+
+
+async def _family_member_lost(family_id: str | None) -> None:
+    """A living member left, was removed or died: count down, dissolving the family at 0."""
+    if not family_id:
+        return
+    living = await family_counts.adjust(db.families, family_id, -1)
+    if living is not None and living <= 0:
+        await _dissolve_family(family_id)
+
+
+async def reconcile_families(only_missing: bool = False) -> dict:
+    """Repair living_member_count drift (family_counts.recount) and dissolve families left at 0."""
+    result = await family_counts.recount(db, only_missing=only_missing)
+    dissolved = 0
+    for family_id in result["zero"]:
+        dissolved += await _dissolve_family(family_id)
+    return {**result, "dissolved": dissolved}
 
 
 @api_router.get("/families")
 async def families_list(current_user: dict = Depends(get_current_user)):
     """List all families (id, name, tag, member_count, treasury). Only shows families with living members."""
-    # Run cleanup first
-    await cleanup_dead_families()
-    
-    cursor = db.families.find({}, {"_id": 0, "id": 1, "name": 1, "tag": 1, "treasury": 1})
-    fams = await cursor.to_list(MAX_FAMILIES * 2)
-    out = []
-    for f in fams:
-        # Count only living members
-        members = await db.family_members.find({"family_id": f["id"]}, {"_id": 0, "user_id": 1}).to_list(100)
-        living_count = 0
-        for m in members:
-            # Include 'id' in projection to ensure we get a non-empty dict when user exists
-            user = await db.users.find_one({"id": m["user_id"]}, {"_id": 0, "id": 1, "is_dead": 1})
-            if user and user.get("id") and not user.get("is_dead", False):
-                living_count += 1
-        
-        if living_count > 0:  # Only include families with living members
-            out.append({
-                "id": f["id"],
-                "name": f["name"],
-                "tag": f["tag"],
-                "member_count": living_count,
-                "treasury": f.get("treasury", 0),
-            })
-    return out
+    fams = await db.families.find(
+        {"living_member_count": {"$gt": 0}},
+        {"_id": 0, "id": 1, "name": 1, "tag": 1, "treasury": 1, "living_member_count": 1},
+    ).to_list(MAX_FAMILIES * 2)
+    return [
+        {
+            "id": f["id"],
+            "name": f["name"],
+            "tag": f["tag"],
+            "member_count": int(f["living_member_count"]),
+            "treasury": f.get("treasury", 0),
+        }
+        for f in fams
+    ]
 
 
 @api_router.get("/families/config")
@@ -8983,7 +9026,7 @@ async def families_config(current_user: dict = Depends(get_current_user)):
 
 def _racket_income_and_cooldown(racket_id: str, level: int, ev: dict):
     """Income per collect and cooldown hours for a racket (with event modifiers)."""
-    r = next((x for x in FAMILY_RACKETS if x["id"] == racket_id), None)
+    r = catalog.current().rackets.get(racket_id)
     if not r or level <= 0:
         return 0, 0
     base_income = r["base_income"] * level
@@ -9118,7 +9161,7 @@ async def families_create(request: FamilyCreateRequest, current_user: dict = Dep
     if await db.families.find_one({"$or": [{"name": name}, {"tag": tag}]}):
         raise HTTPException(status_code=400, detail="Name or tag already taken")
     family_id = str(uuid.uuid4())
-    now = datetime.now(timezone.utc).isoformat()
+    now = utcnow()
     await db.families.insert_one({
         "id": family_id,
         "name": name,
@@ -9127,6 +9170,7 @@ async def families_create(request: FamilyCreateRequest, current_user: dict = Dep
         "treasury": 0,
         "created_at": now,
         "rackets": {},
+        "living_member_count": 1,
     })
     await db.family_members.insert_one({
         "id": str(uuid.uuid4()),
@@ -9153,7 +9197,7 @@ async def families_join(request: FamilyJoinRequest, current_user: dict = Depends
     count = await db.family_members.count_documents({"family_id": request.family_id})
     if count >= sum(FAMILY_ROLE_LIMITS.values()):
         raise HTTPException(status_code=400, detail="Family is full")
-    now = datetime.now(timezone.utc).isoformat()
+    now = utcnow()
     await db.family_members.insert_one({
         "id": str(uuid.uuid4()),
         "family_id": request.family_id,
@@ -9161,6 +9205,7 @@ async def families_join(request: FamilyJoinRequest, current_user: dict = Depends
         "role": "associate",
         "joined_at": now,
     })
+    await family_counts.adjust(db.families, request.family_id, 1)
     await db.users.update_one(
         {"id": current_user["id"]},
         {"$set": {"family_id": request.family_id, "family_role": "associate"}},
@@ -9177,8 +9222,10 @@ async def families_leave(current_user: dict = Depends(get_current_user)):
     fam = await db.families.find_one({"id": family_id}, {"_id": 0, "boss_id": 1})
     if fam and fam.get("boss_id") == current_user["id"]:
         raise HTTPException(status_code=400, detail="Boss must transfer leadership or dissolve family first")
-    await db.family_members.delete_one({"family_id": family_id, "user_id": current_user["id"]})
+    left = await db.family_members.delete_one({"family_id": family_id, "user_id": current_user["id"]})
     await db.users.update_one({"id": current_user["id"]}, {"$set": {"family_id": None, "family_role": None}})
+    if left.deleted_count:
+        await _family_member_lost(family_id)
     return {"message": "Left family"}
 
 
@@ -9198,8 +9245,11 @@ async def families_kick(request: FamilyKickRequest, current_user: dict = Depends
         raise HTTPException(status_code=404, detail="Member not found")
     if member.get("role") == "boss":
         raise HTTPException(status_code=400, detail="Cannot kick the Boss")
-    await db.family_members.delete_one({"family_id": family_id, "user_id": request.user_id})
+    kicked = await db.family_members.delete_one({"family_id": family_id, "user_id": request.user_id})
+    kicked_user = await db.users.find_one({"id": request.user_id}, {"_id": 0})
     await db.users.update_one({"id": request.user_id}, {"$set": {"family_id": None, "family_role": None}})
+    if kicked.deleted_count and kicked_user and not kicked_user.get("is_dead"):
+        await _family_member_lost(family_id)
     return {"message": "Member kicked"}
 
 
@@ -9285,7 +9335,7 @@ async def families_racket_collect(racket_id: str, current_user: dict = Depends(g
     level = state.get("level", 0)
     if level <= 0:
         raise HTTPException(status_code=400, detail="Racket not active")
-    r_def = next((x for x in FAMILY_RACKETS if x["id"] == racket_id), None)
+    r_def = catalog.current().rackets.get(racket_id)
     if not r_def:
         raise HTTPException(status_code=404, detail="Racket not found")
     ev = await get_effective_event()
@@ -9319,7 +9369,7 @@ async def families_racket_upgrade(racket_id: str, current_user: dict = Depends(g
     fam = await db.families.find_one({"id": family_id}, {"_id": 0, "treasury": 1, "rackets": 1})
     if not fam:
         raise HTTPException(status_code=404, detail="Family not found")
-    if racket_id not in [x["id"] for x in FAMILY_RACKETS]:
+    if racket_id not in catalog.current().rackets:
         raise HTTPException(status_code=404, detail="Racket not found")
     rackets = (fam.get("rackets") or {}).copy()
     state = rackets.get(racket_id) or {}
@@ -9351,7 +9401,7 @@ async def families_racket_attack_targets(debug: bool = False, current_user: dict
             lv = state.get("level", 0)
             if lv < 1:
                 continue
-            r_def = next((x for x in FAMILY_RACKETS if x["id"] == rid), None)
+            r_def = catalog.current().rackets.get(rid)
             income, cooldown_h = _racket_income_and_cooldown(rid, lv, ev)
             potential_take = int(income * FAMILY_RACKET_ATTACK_REVENUE_PCT)
             success_chance = max(FAMILY_RACKET_ATTACK_MIN_SUCCESS, FAMILY_RACKET_ATTACK_BASE_SUCCESS - lv * FAMILY_RACKET_ATTACK_LEVEL_PENALTY)
@@ -9631,19 +9681,81 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("startup")
 async def startup_db():
-    await init_game_data()
+    timings = {}
+    results = {}
+    started = time.perf_counter()
+    for name, step in (
+        ("migrate_timestamps", lambda: migrate_timestamps(db)),
+        # Capped, so it must exist before ensure_indexes would create it as a plain collection
+        ("kill_feed", lambda: kill_feed.ensure_collection(db)),
+        ("ensure_indexes", lambda: ensure_indexes(db)),
+        ("backfill_username_lower", backfill_username_lower),
+        ("backfill_rank_ids", lambda: rank_ids.backfill(db.users, RANKS, only_missing=True)),
+        ("backfill_attack_expiry", backfill_attack_expiry),
+        ("init_game_data", init_game_data),
+        ("catalog", lambda: catalog.load(db, CARS, FAMILY_RACKETS)),
+        # Dissolving a family at 0 names the rackets it hands over, so after the catalog
+        ("backfill_family_counts", lambda: reconcile_families(only_missing=True)),
+        ("leaderboards", lambda: leaderboard_index.rebuild(mongo_db.users)),
+    ):
+        t0 = time.perf_counter()
+        results[name] = await step()
+        timings[name] = round((time.perf_counter() - t0) * 1000)
+    logger.info("Startup took %dms %s", round((time.perf_counter() - started) * 1000), timings)
+    asyncio.create_task(_migrate_avatars())
+    asyncio.create_task(_seed_kill_feed())
+    # Changed weapon stats make stored profiles stale, so re-check everyone; otherwise fill gaps only
+    asyncio.create_task(_backfill_combat_profiles(recheck="weapons" in (results["init_game_data"] or {})))
+    asyncio.create_task(presence.run(mongo_db.users))
+    asyncio.create_task(_online_reconcile_loop())
+    asyncio.create_task(event_cache.run(mongo_db.game_config))
+    asyncio.create_task(catalog.run(db, CARS, FAMILY_RACKETS))
+    asyncio.create_task(attack_scheduler.run(mongo_db, STATES))
+    asyncio.create_task(kill_inflation.run(db))
+    asyncio.create_task(stats_snapshot.run(db, RANKS, lambda: catalog.current().cars))
+    asyncio.create_task(leaderboard_index.run(mongo_db))
     from routers.jail import spawn_jail_npcs
     asyncio.create_task(spawn_jail_npcs())
     # Start security monitoring background task
     asyncio.create_task(security_module.security_monitor_task(db))
 
+async def _seed_kill_feed():
+    """Background one-shot: fill an empty kill feed from past attack_attempts."""
+    try:
+        await kill_feed.seed_from_attempts(db, RANKS)
+    except Exception:
+        logger.exception("Kill feed seed failed")
+
+async def _migrate_avatars():
+    """Background one-shot: move legacy data-URL avatars into the avatar store."""
+    try:
+        moved = await avatar_store.migrate_data_url_avatars(db, avatar_bucket)
+        if moved:
+            logger.info("Migrated %s avatars to the avatar store", moved)
+    except Exception:
+        logger.exception("Avatar migration failed")
+
+async def _backfill_combat_profiles(recheck: bool = False):
+    """Background one-shot: build users.combat_profile where missing (recheck: rewrite any that differ)."""
+    try:
+        if recheck:
+            result = await combat_profile.check(db, catalog.current(), _rank_id_of, fix=True)
+            logger.info("combat_profile recheck: %s checked, %s fixed", result["checked"], result["fixed"])
+        else:
+            await combat_profile.backfill(db, catalog.current(), _rank_id_of)
+    except Exception:
+        logger.exception("combat_profile backfill failed")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await presence.flush(mongo_db.users)
+    await attack_scheduler.release(mongo_db.game_config)
     client.close()
+    _bcrypt_executor.shutdown(wait=False)
 
 async def init_game_data():
-    # Update crimes with new cooldowns (seconds instead of minutes for faster gameplay)
-    await db.crimes.delete_many({})
+    """Seed crimes, weapons and properties; a no-op unless the seed rows changed (see seeding.py). Returns what was written."""
+    # Crime cooldowns in seconds (cooldown_minutes kept for the API)
     crimes = [
         {"id": "crime1", "name": "Pickpocket", "description": "Steal from unsuspecting citizens - quick cash", "min_rank": 1, "reward_min": 50, "reward_max": 200, "cooldown_seconds": 15, "cooldown_minutes": 0.25, "crime_type": "petty"},
         {"id": "crime2", "name": "Mug a Pedestrian", "description": "Rob someone on the street", "min_rank": 1, "reward_min": 100, "reward_max": 400, "cooldown_seconds": 30, "cooldown_minutes": 0.5, "crime_type": "petty"},
@@ -9654,30 +9766,26 @@ async def init_game_data():
         {"id": "crime7", "name": "Bank Heist", "description": "Rob a bank vault - high risk, high reward", "min_rank": 7, "reward_min": 50000, "reward_max": 150000, "cooldown_seconds": 1800, "cooldown_minutes": 30, "crime_type": "major"},
         {"id": "crime8", "name": "Casino Heist", "description": "Rob a casino - the big score", "min_rank": 9, "reward_min": 200000, "reward_max": 500000, "cooldown_seconds": 3600, "cooldown_minutes": 60, "crime_type": "major"}
     ]
-    await db.crimes.insert_many(crimes)
-    
-    weapons_count = await db.weapons.count_documents({})
-    if weapons_count == 0:
-        weapons = [
-            {"id": "weapon1", "name": "Brass Knuckles", "description": "Street fighting tool", "damage": 5, "bullets_needed": 0, "rank_required": 1, "price_money": 100, "price_points": None},
-            {"id": "weapon2", "name": "Colt Detective Special", "description": "Compact revolver", "damage": 15, "bullets_needed": 6, "rank_required": 2, "price_money": 500, "price_points": None},
-            {"id": "weapon3", "name": "Smith & Wesson .38", "description": "Reliable revolver", "damage": 20, "bullets_needed": 6, "rank_required": 3, "price_money": 1000, "price_points": None},
-            {"id": "weapon4", "name": "Colt M1911", "description": "Powerful semi-automatic pistol", "damage": 30, "bullets_needed": 7, "rank_required": 4, "price_money": 2500, "price_points": None},
-            {"id": "weapon5", "name": "Sawed-off Shotgun", "description": "Devastating at close range", "damage": 50, "bullets_needed": 2, "rank_required": 5, "price_money": 5000, "price_points": None},
-            {"id": "weapon6", "name": "Winchester Model 1897", "description": "Pump-action shotgun", "damage": 60, "bullets_needed": 5, "rank_required": 6, "price_money": 8000, "price_points": None},
-            {"id": "weapon7", "name": "Thompson Submachine Gun", "description": "The iconic Tommy Gun", "damage": 80, "bullets_needed": 30, "rank_required": 7, "price_money": 15000, "price_points": None},
-            {"id": "weapon8", "name": "BAR (Browning Automatic Rifle)", "description": "Heavy automatic rifle", "damage": 100, "bullets_needed": 20, "rank_required": 9, "price_money": 30000, "price_points": None},
-            {"id": "weapon9", "name": "Luger P08", "description": "German precision pistol", "damage": 35, "bullets_needed": 8, "rank_required": 8, "price_money": 12000, "price_points": None},
-            {"id": "weapon10", "name": "Chicago Typewriter Premium", "description": "Gold-plated Tommy Gun", "damage": 120, "bullets_needed": 50, "rank_required": 11, "price_money": None, "price_points": 500}
-        ]
-        await db.weapons.insert_many(weapons)
-    
-    properties_count = await db.properties.count_documents({})
-    if properties_count == 0:
-        properties = [
-            {"id": "prop1", "name": "Speakeasy", "property_type": "casino", "price": 5000, "income_per_hour": 100, "max_level": 10},
-            {"id": "prop2", "name": "Bullet Factory", "property_type": "factory", "price": 20000, "income_per_hour": 500, "max_level": 5},
-            {"id": "prop3", "name": "Underground Casino", "property_type": "casino", "price": 50000, "income_per_hour": 1000, "max_level": 8},
-            {"id": "prop4", "name": "Luxury Casino", "property_type": "casino", "price": 200000, "income_per_hour": 5000, "max_level": 5}
-        ]
-        await db.properties.insert_many(properties)
+    weapons = [
+        {"id": "weapon1", "name": "Brass Knuckles", "description": "Street fighting tool", "damage": 5, "bullets_needed": 0, "rank_required": 1, "price_money": 100, "price_points": None},
+        {"id": "weapon2", "name": "Colt Detective Special", "description": "Compact revolver", "damage": 15, "bullets_needed": 6, "rank_required": 2, "price_money": 500, "price_points": None},
+        {"id": "weapon3", "name": "Smith & Wesson .38", "description": "Reliable revolver", "damage": 20, "bullets_needed": 6, "rank_required": 3, "price_money": 1000, "price_points": None},
+        {"id": "weapon4", "name": "Colt M1911", "description": "Powerful semi-automatic pistol", "damage": 30, "bullets_needed": 7, "rank_required": 4, "price_money": 2500, "price_points": None},
+        {"id": "weapon5", "name": "Sawed-off Shotgun", "description": "Devastating at close range", "damage": 50, "bullets_needed": 2, "rank_required": 5, "price_money": 5000, "price_points": None},
+        {"id": "weapon6", "name": "Winchester Model 1897", "description": "Pump-action shotgun", "damage": 60, "bullets_needed": 5, "rank_required": 6, "price_money": 8000, "price_points": None},
+        {"id": "weapon7", "name": "Thompson Submachine Gun", "description": "The iconic Tommy Gun", "damage": 80, "bullets_needed": 30, "rank_required": 7, "price_money": 15000, "price_points": None},
+        {"id": "weapon8", "name": "BAR (Browning Automatic Rifle)", "description": "Heavy automatic rifle", "damage": 100, "bullets_needed": 20, "rank_required": 9, "price_money": 30000, "price_points": None},
+        {"id": "weapon9", "name": "Luger P08", "description": "German precision pistol", "damage": 35, "bullets_needed": 8, "rank_required": 8, "price_money": 12000, "price_points": None},
+        {"id": "weapon10", "name": "Chicago Typewriter Premium", "description": "Gold-plated Tommy Gun", "damage": 120, "bullets_needed": 50, "rank_required": 11, "price_money": None, "price_points": 500}
+    ]
+    properties = [
+        {"id": "prop1", "name": "Speakeasy", "property_type": "casino", "price": 5000, "income_per_hour": 100, "max_level": 10},
+        {"id": "prop2", "name": "Bullet Factory", "property_type": "factory", "price": 20000, "income_per_hour": 500, "max_level": 5},
+        {"id": "prop3", "name": "Underground Casino", "property_type": "casino", "price": 50000, "income_per_hour": 1000, "max_level": 8},
+        {"id": "prop4", "name": "Luxury Casino", "property_type": "casino", "price": 200000, "income_per_hour": 5000, "max_level": 5}
+    ]
+    return await seeding.apply_seed(db, {
+        "crimes": (crimes, True),
+        "weapons": (weapons, False),
+        "properties": (properties, False),
+    })
@@ -0,0 +1,174 @@
+"""
+Materialized /stats/overview.
+
+build() computes the whole overview with server-side aggregation: one $group pass over users
+for totals and alive/dead counts, the rank histogram as a $group on the indexed users.rank_id
+(rank_ids.py), a $group over unclaimed bank deposits, a $group over user_cars by car_id and
+the indexed top-dead query. refresh() stores the result as the
+single stats_snapshots {"id": "overview"} document; run() does that every
+STATS_SNAPSHOT_SECONDS on one worker (claimed through game_config {"id": "stats_snapshot"}).
+The endpoint serves the stored snapshot and its generated_at; POST /api/admin/stats/refresh
+rebuilds it on demand. Recent kills are not part of the snapshot: the endpoint reads them
+from the kill feed (kill_feed.py) so new kills show up without waiting for a rebuild.
+"""
+import asyncio
+import logging
+import os
+from datetime import timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+import rank_ids
+from timestamps import utcnow
+
+logger = logging.getLogger(__name__)
+
+STATS_SNAPSHOT_SECONDS = float(os.environ.get("STATS_SNAPSHOT_SECONDS", "60"))
+SNAPSHOT_ID = "overview"
+CLAIM_ID = "stats_snapshot"
+RECENT_KILLS = 15
+TOP_DEAD = 20
+RARE_CAR_RARITIES = ("rare", "ultra_rare", "legendary", "exclusive")
+
+_stats = {"builds": 0, "last_build_ms": None, "generated_at": None}
+
+
+TOTALS_PIPELINE = [
+    {"$group": {
+        "_id": None,
+        "total_users": {"$sum": 1},
+        "dead_users": {"$sum": {"$cond": [{"$eq": ["$is_dead", True]}, 1, 0]}},
+        "money_total": {"$sum": {"$ifNull": ["$money", 0]}},
+        "points_total": {"$sum": {"$ifNull": ["$points", 0]}},
+        "swiss_total": {"$sum": {"$ifNull": ["$swiss_balance", 0]}},
+        "total_crimes": {"$sum": {"$ifNull": ["$total_crimes", 0]}},
+        "total_gta": {"$sum": {"$ifNull": ["$total_gta", 0]}},
+        "total_jail_busts": {"$sum": {"$ifNull": ["$jail_busts", 0]}},
+    }},
+]
+
+
+def _rank_name(ranks, rank_points) -> str:
+    points = int(rank_points or 0)
+    return next((r["name"] for r in reversed(ranks) if points >= r["required_points"]), ranks[0]["name"])
+
+
+def _rank_stats(ranks, groups) -> list:
+    by_id = {int(r["id"]): {"rank_id": int(r["id"]), "rank_name": r["name"], "alive": 0, "dead": 0} for r in ranks}
+    for g in groups:
+        row = by_id.get(g["_id"])
+        if row is None:  # no rank_id yet (backfilled at startup)
+            continue
+        row["dead"] += int(g.get("dead", 0))
+        row["alive"] += int(g.get("total", 0)) - int(g.get("dead", 0))
+    return [by_id[int(r["id"])] for r in ranks]
+
+
+async def build(db, ranks, cars) -> dict:
+    """Compute the overview. ranks: server.RANKS; cars: catalog cars by id."""
+    totals_agg, rank_groups, interest_agg, car_counts, top_dead = await asyncio.gather(
+        db.users.aggregate(TOTALS_PIPELINE).to_list(1),
+        db.users.aggregate(rank_ids.histogram_pipeline()).to_list(None),
+        db.bank_deposits.aggregate([
+            {"$match": {"claimed_at": None}},
+            {"$group": {"_id": None, "total": {"$sum": {"$add": [{"$ifNull": ["$principal", 0]}, {"$ifNull": ["$interest_amount", 0]}]}}}},
+        ]).to_list(1),
+        db.user_cars.aggregate([{"$group": {"_id": "$car_id", "count": {"$sum": 1}}}]).to_list(None),
+        db.users.find(
+            {"is_dead": True},
+            {"_id": 0, "username": 1, "total_kills": 1, "rank_points": 1, "dead_at": 1},
+        ).sort("total_kills", -1).limit(TOP_DEAD).to_list(TOP_DEAD),
+    )
+    totals = totals_agg[0] if totals_agg else {}
+    total_users = int(totals.get("total_users", 0) or 0)
+    dead_users = int(totals.get("dead_users", 0) or 0)
+
+    total_vehicles = exclusive_vehicles = rare_vehicles = 0
+    for cc in car_counts:
+        cnt = int(cc.get("count", 0) or 0)
+        rarity = (cars.get(cc.get("_id")) or {}).get("rarity")
+        total_vehicles += cnt
+        if rarity == "exclusive":
+            exclusive_vehicles += cnt
+        if rarity in RARE_CAR_RARITIES:
+            rare_vehicles += cnt
+
+    top_dead_users = []
+    for u in top_dead:
+        top_dead_users.append({
+            "username": u.get("username"),
+            "total_kills": int(u.get("total_kills", 0) or 0),
+            "rank_name": _rank_name(ranks, u.get("rank_points")),
+            "dead_at": u.get("dead_at"),
+        })
+
+    return {
+        "game_capital": {
+            "total_cash": int(totals.get("money_total", 0) or 0),
+            "swiss_total": int(totals.get("swiss_total", 0) or 0),
+            "interest_bank_total": int(interest_agg[0].get("total", 0) or 0) if interest_agg else 0,
+            "points_total": int(totals.get("points_total", 0) or 0),
+        },
+        "user_stats": {
+            "total_users": total_users,
+            "alive_users": total_users - dead_users,
+            "dead_users": dead_users,
+            "total_crimes": int(totals.get("total_crimes", 0) or 0),
+            "total_gta": int(totals.get("total_gta", 0) or 0),
+            "total_jail_busts": int(totals.get("total_jail_busts", 0) or 0),
+            "bullets_melted_total": 0,
+        },
+        "vehicle_stats": {
+            "total_vehicles": total_vehicles,
+            "exclusive_vehicles": exclusive_vehicles,
+            "rare_vehicles": rare_vehicles,
+        },
+        "rank_stats": _rank_stats(ranks, rank_groups),
+        "top_dead_users": top_dead_users,
+    }
+
+
+async def refresh(db, ranks, cars) -> dict:
+    """Build and store a new snapshot; returns the stored document."""
+    started = utcnow()
+    data = await build(db, ranks, cars)
+    doc = {"id": SNAPSHOT_ID, "generated_at": utcnow(), "data": data}
+    await db.stats_snapshots.replace_one({"id": SNAPSHOT_ID}, doc, upsert=True)
+    _stats.update(
+        builds=_stats["builds"] + 1,
+        last_build_ms=round((doc["generated_at"] - started).total_seconds() * 1000),
+        generated_at=doc["generated_at"].isoformat(),
+    )
+    return doc
+
+
+async def latest(db) -> dict | None:
+    return await db.stats_snapshots.find_one({"id": SNAPSHOT_ID}, {"_id": 0})
+
+
+async def _claim(config, now, interval_seconds: float) -> bool:
+    # One worker per interval (90%: sleeps drift a little)
+    try:
+        await config.update_one(
+            {"id": CLAIM_ID, "last_run": {"$lte": now - timedelta(seconds=interval_seconds * 0.9)}},
+            {"$set": {"last_run": now}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:  # another worker built it this interval
+        return False
+
+
+async def run(db, ranks, get_cars, interval_seconds: float = STATS_SNAPSHOT_SECONDS) -> None:
+    """Background loop: rebuild the snapshot once per interval across workers."""
+    while True:
+        try:
+            if await _claim(db.game_config, utcnow(), interval_seconds):
+                await refresh(db, ranks, get_cars())
+        except Exception:
+            logger.exception("Stats snapshot refresh failed")
+        await asyncio.sleep(interval_seconds)
+
+
+def metrics() -> dict:
+    return dict(_stats)
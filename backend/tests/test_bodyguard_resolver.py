@@ -0,0 +1,95 @@
+"""
+Bodyguard resolver tests
+Round trips stay constant however many owners (found attacks) are resolved
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import bodyguard_resolver  # noqa: E402
+
+
+def _matches(doc, query):
+    for key, cond in query.items():
+        if isinstance(cond, dict) and "$in" in cond:
+            if doc.get(key) not in cond["$in"]:
+                return False
+        elif doc.get(key) != cond:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, direction):
+        self.docs = sorted(self.docs, key=lambda d: d.get(key, 0), reverse=direction < 0)
+        return self
+
+    async def to_list(self, length):
+        return list(self.docs)
+
+
+class FakeCollection:
+    def __init__(self, docs, calls):
+        self.docs = docs
+        self.calls = calls
+
+    def find(self, query, projection=None):
+        self.calls.append(query)
+        return FakeCursor([dict(d) for d in self.docs if _matches(d, query)])
+
+
+class FakeDb:
+    def __init__(self, bodyguards, users):
+        self.calls = []
+        self.bodyguards = FakeCollection(bodyguards, self.calls)
+        self.users = FakeCollection(users, self.calls)
+
+
+def _rank_info(rank_points):
+    return (2, "Goon") if rank_points >= 100 else (1, "Rat")
+
+
+def _world(owners):
+    bodyguards, users = [], []
+    for n in range(owners):
+        owner = f"owner-{n}"
+        users.append({"id": f"guard-{n}", "username": f"Guard{n}", "rank_points": 100 * (n % 2)})
+        bodyguards.append({"user_id": owner, "slot_number": 2, "is_robot": False, "bodyguard_user_id": f"guard-{n}"})
+        bodyguards.append({"user_id": owner, "slot_number": 1, "is_robot": True, "robot_name": f"Robot{n}"})
+    return FakeDb(bodyguards, users)
+
+
+class TestBodyguardResolver:
+    @pytest.mark.parametrize("owners", [1, 5, 50])
+    def test_round_trips_constant(self, owners):
+        db = _world(owners)
+        result = asyncio.run(bodyguard_resolver.resolve(db, [f"owner-{n}" for n in range(owners)], _rank_info))
+        assert len(db.calls) == 2, f"Expected 2 queries for {owners} owners, got {len(db.calls)}"
+        assert len(result) == owners
+
+    def test_ordered_by_slot_with_usernames(self):
+        db = _world(2)
+        result = asyncio.run(bodyguard_resolver.resolve(db, ["owner-1", "owner-missing"], _rank_info))
+        guards = result["owner-1"]
+        assert [g["slot_number"] for g in guards] == [1, 2]
+        assert guards[0]["username"] is None and guards[0]["rank_name"] is None
+        assert guards[1]["username"] == "Guard1"
+        assert guards[1]["rank_name"] == "Goon"
+        assert result["owner-missing"] == []
+
+    def test_without_users_skips_user_query(self):
+        db = _world(3)
+        asyncio.run(bodyguard_resolver.resolve(db, ["owner-0"], _rank_info, with_users=False))
+        assert len(db.calls) == 1
+
+    def test_no_owners_no_queries(self):
+        db = _world(3)
+        assert asyncio.run(bodyguard_resolver.resolve(db, [], _rank_info)) == {}
+        assert db.calls == []
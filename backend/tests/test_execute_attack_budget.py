@@ -0,0 +1,197 @@
+"""
+/attack/execute query budget tests
+The kill path (bodyguard victim, public kill, witness statements, kill_feed append) and the
+failed path stay within EXECUTE_ATTACK_MAX_QUERIES with QUERY_BUDGET_STRICT on. Fake
+collections report each call to query_counter's CommandListener as the command pymongo sends.
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from pymongo import DeleteOne, InsertOne, UpdateOne
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test")
+
+import query_counter  # noqa: E402
+import server  # noqa: E402
+from user_loader import CachedDatabase, UserLoader  # noqa: E402
+
+_listener = query_counter.QueryCounter()
+
+
+def _command(name):
+    _listener.started(SimpleNamespace(command_name=name))
+
+
+def _matches(doc, query):
+    for key, cond in (query or {}).items():
+        if key.startswith("$"):
+            continue
+        if isinstance(cond, dict):
+            if "$in" in cond and doc.get(key) not in cond["$in"]:
+                return False
+            if "$ne" in cond and doc.get(key) == cond["$ne"]:
+                return False
+        elif doc.get(key) != cond:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, direction=1):
+        self.docs = sorted(self.docs, key=lambda d: d.get(key, 0), reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, length):
+        return list(self.docs if length is None else self.docs[:length])
+
+
+class FakeCollection:
+    def __init__(self, name, docs, log):
+        self.name = name
+        self.docs = docs
+        self.log = log
+
+    def _sent(self, command):
+        _command(command)
+        self.log.append((self.name, command))
+
+    def find(self, query=None, projection=None):
+        self._sent("find")
+        return FakeCursor([dict(d) for d in self.docs if _matches(d, query)])
+
+    async def find_one(self, query=None, projection=None, *args, **kwargs):
+        self._sent("find")
+        return next((dict(d) for d in self.docs if _matches(d, query)), None)
+
+    async def find_one_and_update(self, query, update, *args, **kwargs):
+        self._sent("findAndModify")
+        return next((dict(d) for d in self.docs if _matches(d, query)), None)
+
+    async def find_one_and_delete(self, query, *args, **kwargs):
+        self._sent("findAndModify")
+        return None
+
+    async def insert_one(self, doc, *args, **kwargs):
+        self._sent("insert")
+        self.docs.append(dict(doc))
+
+    async def insert_many(self, docs, *args, **kwargs):
+        self._sent("insert")
+        self.docs.extend(dict(d) for d in docs)
+
+    async def update_one(self, *args, **kwargs):
+        self._sent("update")
+
+    async def update_many(self, *args, **kwargs):
+        self._sent("update")
+
+    async def delete_one(self, *args, **kwargs):
+        self._sent("delete")
+
+    async def bulk_write(self, requests, *args, **kwargs):
+        # pymongo sends one command per operation type in an unordered bulk
+        for op_type, command in ((InsertOne, "insert"), (UpdateOne, "update"), (DeleteOne, "delete")):
+            if any(isinstance(op, op_type) for op in requests):
+                self._sent(command)
+
+    def aggregate(self, pipeline):
+        self._sent("aggregate")
+        return FakeCursor([{"id": d["id"]} for d in self.docs])
+
+
+class FakeDb:
+    def __init__(self, docs):
+        self.log = []
+        self._collections = {}
+        self._docs = docs
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(name, self._docs.get(name, []), self.log)
+        return self._collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+
+def _attacker():
+    return {
+        "id": "attacker", "username": "shooter", "email": "shooter@example.com", "rank_points": 0,
+        "current_state": "Chicago", "bullets": 10_000_000, "money": 0,
+    }
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake = FakeDb({
+        "attacks": [{"id": "atk", "attacker_id": "attacker", "target_id": "victim", "status": "found", "location_state": "Chicago"}],
+        "users": [
+            _attacker(),
+            {"id": "victim", "username": "guard", "is_bodyguard": True, "health": 100, "money": 1000, "rank_points": 0, "armour_level": 0},
+            {"id": "owner", "username": "boss", "bodyguard_slots": 2},
+            {"id": "bystander", "username": "witness"},
+        ],
+        # The victim guards "owner" (slot 1); the robot in slot 2 gets renumbered
+        "bodyguards": [
+            {"id": "bg-1", "user_id": "owner", "bodyguard_user_id": "victim", "slot_number": 1},
+            {"id": "bg-2", "user_id": "owner", "robot_name": "Tin", "slot_number": 2},
+        ],
+        "user_cars": [{"user_id": "victim", "car_id": "car1"}],
+        "user_properties": [{"user_id": "victim", "property_id": "prop1"}],
+    })
+    monkeypatch.setattr(server, "db", CachedDatabase(fake, UserLoader(ttl_seconds=0)))
+    monkeypatch.setattr(query_counter, "QUERY_BUDGET_STRICT", True)
+    monkeypatch.setattr(server.random, "randint", lambda a, b: b)  # as many witness statements as allowed
+    server.event_cache.invalidate()  # event state read from game_config, as on a cold worker
+    return fake
+
+
+def _execute(bullets_to_use):
+    request = server.AttackExecuteRequest(attack_id="atk", bullets_to_use=bullets_to_use, make_public=True, death_message="bye")
+    return asyncio.run(server.execute_attack(request, _attacker()))
+
+
+class TestExecuteAttackBudget:
+    def test_kill_path_within_budget(self, fake_db):
+        response = _execute(10_000_000)
+        assert response.success
+        run = query_counter.metrics()["execute_attack"]
+        assert run["last"] <= server.EXECUTE_ATTACK_MAX_QUERIES, fake_db.log
+        assert ("public_kills", "insert") in fake_db.log
+        # The kill_feed append (one insert per settled kill) is counted inside the budget
+        assert ("kill_feed", "insert") in fake_db.log
+        assert ("bodyguards", "delete") in fake_db.log
+
+    def test_failed_path_within_budget(self, fake_db):
+        response = _execute(1)
+        assert not response.success
+        assert query_counter.metrics()["execute_attack"]["last"] <= server.EXECUTE_ATTACK_MAX_QUERIES, fake_db.log
+        assert ("kill_feed", "insert") not in fake_db.log
+
+    def test_due_search_not_yet_flipped_can_be_executed(self, fake_db):
+        # Scheduled on a worker that isn't the scheduler leader: still "searching" past found_at
+        fake_db.attacks.docs[0].update({
+            "status": "searching", "found_at": server.utcnow() - server.timedelta(seconds=3),
+            "location_state": None, "planned_location_state": "Chicago",
+        })
+        assert _execute(10_000_000).success
+
+    def test_strict_budget_raises_when_exceeded(self, fake_db, monkeypatch):
+        monkeypatch.setattr(server, "EXECUTE_ATTACK_MAX_QUERIES", 5)
+        with pytest.raises(AssertionError, match="execute_attack sent"):
+            _execute(10_000_000)
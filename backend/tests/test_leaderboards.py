@@ -0,0 +1,153 @@
+"""
+In-memory leaderboard tests
+RankIndex agrees with a brute-force count/sort through inserts, updates and removals; write
+notifications only mark users dirty when a tracked field can change
+"""
+import asyncio
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import leaderboards  # noqa: E402
+from rank_ids import with_rank_id  # noqa: E402
+
+
+class SmallRankIndex(leaderboards.RankIndex):
+    LOAD = 4  # force bucket splits/removals with few keys
+
+
+def _expected_top(scores, n):
+    return sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:n]
+
+
+@pytest.mark.parametrize("index_cls", [leaderboards.RankIndex, SmallRankIndex])
+def test_rank_index_matches_brute_force(index_cls):
+    rng = random.Random(3)
+    scores = {f"u{i}": rng.randint(0, 50) for i in range(60)}
+    index = index_cls(scores)
+    for _ in range(500):
+        uid = f"u{rng.randint(0, 80)}"
+        if rng.random() < 0.2:
+            index.discard(uid)
+            scores.pop(uid, None)
+        else:
+            scores[uid] = rng.randint(0, 50)
+            index.set(uid, scores[uid])
+        probe = rng.randint(-1, 51)
+        assert index.count_above(probe) == sum(1 for s in scores.values() if s > probe)
+    assert len(index) == len(scores)
+    assert index.top(10) == _expected_top(scores, 10)
+    assert index.top(1000) == _expected_top(scores, 1000)
+
+
+def test_pools_and_top():
+    boards = leaderboards.Leaderboards()
+    boards.apply({"id": "a", "username": "A", "total_kills": 5})
+    boards.apply({"id": "b", "username": "B", "total_kills": 9})
+    boards.apply({"id": "c", "username": "C", "total_kills": 7, "is_bodyguard": True})
+    boards.apply({"id": "d", "username": "D", "total_kills": 3, "is_dead": True})
+    assert boards.rank("total_kills", 5) == 2
+    assert boards.rank("total_kills", 100) == 1
+    assert [u["username"] for u in boards.top("total_kills", 10)] == ["B", "A"]
+    assert [u["username"] for u in boards.top("total_kills", 10, pool="dead")] == ["D"]
+    boards.apply({"id": "b", "username": "B", "total_kills": 9, "is_dead": True})
+    assert [u["username"] for u in boards.top("total_kills", 10)] == ["A"]
+    assert [u["username"] for u in boards.top("total_kills", 10, pool="dead")] == ["B", "D"]
+
+
+@pytest.mark.parametrize("ids,update,dirty,rebuild", [
+    (["a"], {"$inc": {"total_crimes": 1}}, {"a"}, False),
+    (["a"], {"$set": {"last_seen": 1}}, set(), False),
+    (["a"], with_rank_id({"$inc": {"rank_points": 5}}, [{"id": 1, "name": "R", "required_points": 0}]), {"a"}, False),
+    (["a"], None, {"a"}, False),
+    (None, {"$set": {"kill_inflation": 0}}, set(), False),
+    (None, {"$set": {"is_dead": True}}, set(), True),
+])
+def test_note_write(ids, update, dirty, rebuild):
+    boards = leaderboards.Leaderboards()
+    boards.note_write(ids, update)
+    assert set(boards._dirty) == dirty
+    assert (boards._rebuild_requested is not None) == rebuild
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return list(self.docs)
+
+    def __aiter__(self):
+        async def gen():
+            for d in self.docs:
+                yield d
+        return gen()
+
+
+class FakeUsers:
+    def __init__(self, docs):
+        self.docs = {d["id"]: d for d in docs}
+
+    def find(self, query, projection):
+        ids = (query.get("id") or {}).get("$in")
+        return FakeCursor([d for uid, d in self.docs.items() if ids is None or uid in ids])
+
+
+def test_rebuild_then_flush():
+    users = FakeUsers([{"id": "a", "username": "A", "jail_busts": 1}, {"id": "b", "username": "B", "jail_busts": 2}])
+    boards = leaderboards.Leaderboards()
+    assert asyncio.run(boards.rebuild(users)) == 2
+    users.docs["a"]["jail_busts"] = 10
+    del users.docs["b"]
+    boards.note_write(["a"], {"$inc": {"jail_busts": 9}})
+    boards.note_write(["b"], None)
+    assert asyncio.run(boards.flush(users)) == 2
+    assert boards.top("jail_busts", 5) == [{"id": "a", "username": "A", "value": 10}]
+    assert boards.metrics()["dirty"] == 0
+
+
+class FakeFeed:
+    def __init__(self):
+        self.docs = []
+
+    async def insert_many(self, docs, ordered=True):
+        self.docs.extend(dict(d) for d in docs)
+
+    def find(self, query, projection):
+        since, worker = query["at"]["$gt"], query["worker"]["$ne"]
+        return FakeCursor([dict(d) for d in self.docs if d["at"] > since and d["worker"] != worker])
+
+
+def test_exchange_shares_dirty_ids_between_workers():
+    users = FakeUsers([{"id": "a", "username": "A", "total_kills": 1}, {"id": "b", "username": "B", "total_kills": 2}])
+    feed = FakeFeed()
+    here, there = leaderboards.Leaderboards(), leaderboards.Leaderboards()
+    for boards in (here, there):
+        asyncio.run(boards.rebuild(users))
+    # A kill settled on "here" only
+    users.docs["a"]["total_kills"] = 5
+    here.note_write(["a"], {"$inc": {"total_kills": 1}})
+    assert asyncio.run(here.exchange(feed)) == 0
+    asyncio.run(here.flush(users))
+    assert asyncio.run(there.exchange(feed)) == 1
+    assert set(there._dirty) == {"a"}
+    asyncio.run(there.flush(users))
+    assert there.top("total_kills", 1) == [{"id": "a", "username": "A", "value": 5}]
+    # Rows inside the overlap window are not applied twice, and a worker never reads its own
+    assert asyncio.run(there.exchange(feed)) == 0
+    assert asyncio.run(here.exchange(feed)) == 0
+
+
+def test_exchange_shares_rebuild_requests():
+    feed = FakeFeed()
+    here, there = leaderboards.Leaderboards(), leaderboards.Leaderboards()
+    for boards in (here, there):
+        asyncio.run(boards.rebuild(FakeUsers([])))
+    here.note_write(None, {"$set": {"is_dead": True}})
+    asyncio.run(here.exchange(feed))
+    asyncio.run(there.exchange(feed))
+    assert there._rebuild_requested is not None
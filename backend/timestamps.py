@@ -0,0 +1,96 @@
+"""
+Timestamp codec: documents store native BSON dates, API responses keep ISO strings.
+
+The Motor client is created with tz_aware=True, so stored dates come back as aware UTC
+datetimes and compare directly with utcnow(). to_datetime() also accepts the legacy ISO
+strings (and naive datetimes) so reads keep working on documents written before
+migrate_timestamps() ran. TTL indexes (db_indexes.py) only act on date-typed fields.
+"""
+import logging
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# collection -> fields stored as dates (converted from ISO strings by migrate_timestamps)
+TIMESTAMP_FIELDS = {
+    "users": ["created_at", "last_seen", "jail_until", "forced_online_until", "oc_cooldown_until", "kill_inflation_updated_at"],
+    "attacks": ["search_started", "found_at", "expires_at"],
+    "dice_buy_back_offers": ["created_at", "expires_at"],
+    "blackjack_buy_back_offers": ["created_at", "expires_at"],
+    "oc_invites": ["created_at", "expires_at"],
+    "security_flags": ["created_at"],
+    "bank_deposits": ["created_at", "matures_at"],
+    "money_transfers": ["created_at"],
+    "user_crimes": ["cooldown_until", "last_committed"],
+    "gta_cooldowns": ["cooldown_until"],
+    "attack_attempts": ["created_at"],
+    "public_kills": ["created_at"],
+    "blackjack_games": ["created_at"],
+    "notifications": ["created_at"],
+    "hitlist": ["created_at"],
+    "families": ["created_at"],
+    "family_members": ["joined_at"],
+    "family_wars": ["created_at"],
+    "sports_bets": ["created_at"],
+    "bodyguard_invites": ["created_at"],
+}
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def to_datetime(value) -> datetime | None:
+    """Aware UTC datetime from a stored date, naive datetime or ISO string; None if unusable."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, str):
+        try:
+            dt = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+    return None
+
+
+def to_iso(value) -> str | None:
+    """ISO string for API responses (the format the frontend has always received)."""
+    dt = to_datetime(value)
+    return dt.isoformat() if dt else None
+
+
+async def migrate_timestamps(db, fields: dict = TIMESTAMP_FIELDS, batch_size: int = 500) -> dict:
+    """
+    Convert ISO-string timestamps to BSON dates in place. Idempotent (only string values are
+    touched). The server-side $dateFromString pass does the bulk; anything it can't parse is
+    converted in Python, and values neither can read are left as they are.
+    Returns {"collection.field": documents converted} for fields that changed.
+    """
+    converted = {}
+    for coll_name, names in fields.items():
+        coll = db[coll_name]
+        for field in names:
+            is_string = {field: {"$type": "string"}}
+            result = await coll.update_many(
+                is_string,
+                [{"$set": {field: {"$dateFromString": {"dateString": f"${field}", "onError": f"${field}"}}}}],
+            )
+            count = result.modified_count
+            leftovers = await coll.find(is_string, {"_id": 1, field: 1}).to_list(None)
+            ops = []
+            for doc in leftovers:
+                dt = to_datetime(doc.get(field))
+                if dt is not None:
+                    ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {field: dt}}))
+            for i in range(0, len(ops), batch_size):
+                await coll.bulk_write(ops[i:i + batch_size], ordered=False)
+            count += len(ops)
+            if count:
+                converted[f"{coll_name}.{field}"] = count
+    if converted:
+        logger.info("Timestamp migration converted %s", converted)
+    return converted
@@ -0,0 +1,272 @@
+"""
+Cached loader for user documents keyed by id.
+
+Two layers: a request-scoped memo (a ContextVar reset by get_current_user) and an optional
+per-worker LRU with a short TTL (USER_CACHE_TTL_SECONDS, 0 disables). server.py wraps
+db.users in CachedUsersCollection, so every find_one({"id": ...}) goes through the request
+memo and every write to users invalidates the ids it touches (or everything, if the filter is
+not by id). Only the authenticated user (find_current_user, from the auth dependency) may come
+from the LRU: it can be up to the TTL behind writes made on other workers, which is fine for
+the caller's own document but not for other users a request reads and then writes back
+(an attack target's health). write_listeners are told about each write too (ids or None, and the update;
+None for deletes), e.g. the in-memory leaderboards. bulk_write() can only see what a request
+touches when it is a UserUpdateOne/UserDeleteOne (pymongo's ops keep filter and update
+private); any other request invalidates every user.
+"""
+import copy
+import os
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Optional
+
+from pymongo import DeleteOne, UpdateOne
+
+USER_CACHE_TTL_SECONDS = float(os.environ.get("USER_CACHE_TTL_SECONDS", "1.5"))
+USER_CACHE_MAX_ENTRIES = int(os.environ.get("USER_CACHE_MAX_ENTRIES", "2048"))
+
+# user_id -> (generation, doc) for the current request only
+_request_memo: ContextVar[Optional[dict]] = ContextVar("user_request_memo", default=None)
+
+
+def _project(doc: dict, projection) -> Optional[dict]:
+    """Apply a simple find projection in memory. None when the projection can't be served from cache."""
+    if not isinstance(projection, dict) or projection.get("_id", 1):
+        return None  # cached docs have no _id, so the caller must have excluded it
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if any("." in k or isinstance(v, dict) for k, v in fields.items()):
+        return None
+    if not fields:
+        return copy.deepcopy(doc)
+    if all(fields.values()):
+        return {k: copy.deepcopy(doc[k]) for k in fields if k in doc}
+    if not any(fields.values()):
+        return {k: copy.deepcopy(v) for k, v in doc.items() if k not in fields}
+    return None
+
+
+class UserLoader:
+    def __init__(self, ttl_seconds: float = USER_CACHE_TTL_SECONDS, max_entries: int = USER_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lru: OrderedDict = OrderedDict()  # user_id -> (expires_monotonic, generation, doc)
+        self._generations: dict = {}
+        self._epoch = 0
+        self.request_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def begin_request(self) -> None:
+        _request_memo.set({})
+
+    def generation(self, user_id: str) -> tuple:
+        return (self._epoch, self._generations.get(user_id, 0))
+
+    def get(self, user_id: str, shared: bool = False) -> Optional[dict]:
+        """Cached full document (not a copy) or None. shared: also look in the per-worker LRU."""
+        gen = self.generation(user_id)
+        memo = _request_memo.get()
+        if memo is not None:
+            entry = memo.get(user_id)
+            if entry and entry[0] == gen:
+                self.request_hits += 1
+                return entry[1]
+        entry = self._lru.get(user_id) if shared else None
+        if entry:
+            expires, entry_gen, doc = entry
+            if entry_gen == gen and time.monotonic() < expires:
+                self._lru.move_to_end(user_id)
+                self.shared_hits += 1
+                if memo is not None:
+                    memo[user_id] = (gen, doc)
+                return doc
+            del self._lru[user_id]
+        self.misses += 1
+        return None
+
+    def put(self, user_id: str, doc: dict, gen: tuple, shared: bool = False) -> None:
+        """Cache doc as read at generation gen; a write that landed since makes it a no-op."""
+        if gen != self.generation(user_id):
+            return
+        memo = _request_memo.get()
+        if memo is not None:
+            memo[user_id] = (gen, doc)
+        if shared and self.ttl_seconds > 0:
+            self._lru[user_id] = (time.monotonic() + self.ttl_seconds, gen, doc)
+            self._lru.move_to_end(user_id)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        """Drop one user for every request in this worker, or everything when user_id is None."""
+        self.invalidations += 1
+        if user_id is None:
+            self._epoch += 1
+            self._generations.clear()
+            self._lru.clear()
+            return
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        self._lru.pop(user_id, None)
+
+    def stats(self) -> dict:
+        hits = self.request_hits + self.shared_hits
+        total = hits + self.misses
+        return {
+            "request_hits": self.request_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations,
+            "lru_size": len(self._lru),
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+def _ids_in_filter(filter_doc) -> Optional[list]:
+    """User ids a write filter is limited to, or None if it may touch any user."""
+    if not isinstance(filter_doc, dict):
+        return None
+    uid = filter_doc.get("id")
+    if isinstance(uid, str):
+        return [uid]
+    if isinstance(uid, dict) and isinstance(uid.get("$in"), list) and len(uid) == 1:
+        return [u for u in uid["$in"] if isinstance(u, str)]
+    return None
+
+
+class UserUpdateOne(UpdateOne):
+    """UpdateOne for db.users.bulk_write that keeps its filter and update readable."""
+
+    def __init__(self, filter, update, **kwargs):
+        super().__init__(filter, update, **kwargs)
+        self.filter = filter
+        self.update = update
+
+
+class UserDeleteOne(DeleteOne):
+    """DeleteOne for db.users.bulk_write that keeps its filter readable."""
+
+    def __init__(self, filter, **kwargs):
+        super().__init__(filter, **kwargs)
+        self.filter = filter
+        self.update = None
+
+
+class CachedUsersCollection:
+    """db.users wrapper: find_one by id goes through the loader; writes invalidate."""
+
+    def __init__(self, collection, loader: UserLoader):
+        self._collection = collection
+        self.loader = loader
+        self.write_listeners: list = []  # callables (ids or None, update or None)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    async def _find_by_id(self, uid: str, projection, shared: bool):
+        cached = self.loader.get(uid, shared)
+        if cached is not None:
+            projected = _project(cached, projection)
+            if projected is not None:
+                return projected
+        gen = self.loader.generation(uid)
+        doc = await self._collection.find_one({"id": uid}, projection)
+        if doc is not None and projection == {"_id": 0}:
+            self.loader.put(uid, doc, gen, shared)
+            return copy.deepcopy(doc)
+        return doc
+
+    async def find_one(self, filter=None, projection=None, *args, **kwargs):
+        uid = filter.get("id") if isinstance(filter, dict) and len(filter) == 1 else None
+        if not isinstance(uid, str) or args or kwargs:
+            return await self._collection.find_one(filter, projection, *args, **kwargs)
+        return await self._find_by_id(uid, projection, shared=False)
+
+    async def find_current_user(self, user_id: str, projection=None):
+        """The authenticated user's document, served from the per-worker LRU when fresh enough."""
+        return await self._find_by_id(user_id, projection, shared=True)
+
+    def _notify(self, ids, update) -> None:
+        for listener in self.write_listeners:
+            listener(ids, update)
+
+    def _invalidate(self, filter_doc, update=None) -> None:
+        ids = _ids_in_filter(filter_doc)
+        self._notify(ids, update)
+        if ids is None:
+            self.loader.invalidate()
+            return
+        for uid in ids:
+            self.loader.invalidate(uid)
+
+    async def insert_one(self, document, *args, **kwargs):
+        try:
+            return await self._collection.insert_one(document, *args, **kwargs)
+        finally:
+            self._notify([document.get("id")], document)
+
+    async def update_one(self, filter, update, *args, **kwargs):
+        try:
+            return await self._collection.update_one(filter, update, *args, **kwargs)
+        finally:
+            self._invalidate(filter, update)
+
+    async def update_many(self, filter, update, *args, **kwargs):
+        try:
+            return await self._collection.update_many(filter, update, *args, **kwargs)
+        finally:
+            self._invalidate(filter, update)
+
+    async def replace_one(self, filter, replacement, *args, **kwargs):
+        try:
+            return await self._collection.replace_one(filter, replacement, *args, **kwargs)
+        finally:
+            self._invalidate(filter, replacement)
+
+    async def find_one_and_update(self, filter, update, *args, **kwargs):
+        try:
+            return await self._collection.find_one_and_update(filter, update, *args, **kwargs)
+        finally:
+            self._invalidate(filter, update)
+
+    async def delete_one(self, filter, *args, **kwargs):
+        try:
+            return await self._collection.delete_one(filter, *args, **kwargs)
+        finally:
+            self._invalidate(filter)
+
+    async def delete_many(self, filter, *args, **kwargs):
+        try:
+            return await self._collection.delete_many(filter, *args, **kwargs)
+        finally:
+            self._invalidate(filter)
+
+    async def bulk_write(self, requests, *args, **kwargs):
+        try:
+            return await self._collection.bulk_write(requests, *args, **kwargs)
+        finally:
+            ids = [_ids_in_filter(getattr(op, "filter", None)) for op in requests]
+            for op, op_ids in zip(requests, ids):
+                self._notify(op_ids, getattr(op, "update", None))
+            if any(i is None for i in ids):
+                self.loader.invalidate()
+            else:
+                for uid in {u for op_ids in ids for u in op_ids}:
+                    self.loader.invalidate(uid)
+
+
+class CachedDatabase:
+    """Motor database proxy whose users collection is a CachedUsersCollection."""
+
+    def __init__(self, database, loader: UserLoader):
+        self._database = database
+        self.users = CachedUsersCollection(database["users"], loader)
+
+    def __getattr__(self, name):
+        return getattr(self._database, name)
+
+    def __getitem__(self, name):
+        if name == "users":
+            return self.users
+        return self._database[name]
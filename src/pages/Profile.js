@@ -1,7 +1,7 @@
 import { useEffect, useMemo, useState } from 'react';
 import { useNavigate, useParams } from 'react-router-dom';
 import { User as UserIcon, Upload, Search, Shield, Trophy, Building2, Mail, Skull, Users as UsersIcon } from 'lucide-react';
-import api from '../utils/api';
+import api, { assetUrl } from '../utils/api';
 import { toast } from 'sonner';
 import { Tooltip, TooltipContent, TooltipProvider, TooltipTrigger } from '../components/ui/tooltip';
 import styles from '../styles/noir.module.css';
@@ -478,7 +478,7 @@ export default function Profile() {
   }
 
   const isRobotBodyguard = Boolean(profile.is_npc && profile.is_bodyguard);
-  const avatarSrc = isRobotBodyguard ? null : (preview || profile.avatar_url || null);
+  const avatarSrc = isRobotBodyguard ? null : (preview || assetUrl(profile.avatar_url) || null);
   const honours = profile.honours || [];
   const ownedCasinos = profile.owned_casinos || [];
 
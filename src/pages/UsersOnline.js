@@ -1,7 +1,7 @@
 import { useState, useEffect, useCallback } from 'react';
 import { Link } from 'react-router-dom';
 import { Users, User, Clock, MapPin } from 'lucide-react';
-import api from '../utils/api';
+import api, { assetUrl } from '../utils/api';
 import { toast } from 'sonner';
 import { HoverCard, HoverCardTrigger, HoverCardContent } from "@/components/ui/hover-card";
 import styles from '../styles/noir.module.css';
@@ -106,7 +106,7 @@ const UserCard = ({ user, profileCache, profileLoading, ensureProfilePreview })
                   <div className="flex gap-3">
                     <div className="w-12 h-12 rounded-md overflow-hidden border border-primary/20 bg-secondary flex items-center justify-center shrink-0">
                       {preview.avatar_url ? (
-                        <img src={preview.avatar_url} alt="avatar" className="w-full h-full object-cover" />
+                        <img src={assetUrl(preview.avatar_thumb_url || preview.avatar_url)} alt="avatar" className="w-full h-full object-cover" />
                       ) : (
                         <User size={24} className="text-mutedForeground" />
                       )}
@@ -24,6 +24,12 @@ export function getBaseURL() {
   return API || '/api';
 }
 
+/** Backend-relative asset paths (e.g. /api/avatars/...) resolved against the backend origin; data/absolute URLs unchanged. */
+export function assetUrl(path) {
+  if (!path || !path.startsWith('/api/')) return path;
+  return API_URL ? `${API_URL}${path}` : path;
+}
+
 /** Dispatch to refresh top bar / user data in Layout (money, points, rank, etc.). Pass newMoney to update cash immediately. */
 export function refreshUser(newMoney) {
   if (typeof window !== 'undefined') {